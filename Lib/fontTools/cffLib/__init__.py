@@ -11,6 +11,8 @@ from fontTools.ttLib.tables.otBase import OTTableWriter
 from fontTools.ttLib.tables.otBase import OTTableReader
 from fontTools.ttLib.tables import otTables as ot
 import struct
+import array
+import sys
 import logging
 import re
 
@@ -89,7 +91,10 @@ class CFFFontSet(object):
 			raise TypeError(nameOrIndex)
 		return self.topDictIndex[index]
 
-	def compile(self, file, otFont, isCFF2=None):
+	def compile(self, file, otFont, isCFF2=None, subroutinize=False):
+		"""Write the font set to `file`.  If `subroutinize` is true, the
+		CharStrings are first rewritten in place to share repeated code
+		through freshly computed local and global subroutines."""
 		self.otFont = otFont
 		if isCFF2 is not None:
 			# called from ttLib: assert 'major' value matches expected version
@@ -107,6 +112,10 @@ class CFFFontSet(object):
 			for topDict in self.topDictIndex:
 				topDict.recalcFontBBox()
 
+		if subroutinize:
+			from fontTools.cffLib import subroutinizer
+			subroutinizer.subroutinize(self)
+
 		if not isCFF2:
 			strings = IndexedStrings()
 		else:
@@ -223,8 +232,15 @@ class CFFFontSet(object):
 		elif name == "minor":
 			self.minor = int(attrs['value'])
 
-	def convertCFFToCFF2(self, otFont):
+	def convertCFFToCFF2(self, otFont, workers=None):
+		"""Converts the font set to CFF2, in place.  The charstrings are
+		converted on their bytecode, looking at glyphs in up to `workers`
+		processes."""
 		# This assumes a decompiled CFF table.
+		from fontTools.cffLib import cff2Converter
+		for topDict in self.topDictIndex:
+			cff2Converter.convertCharStrings(
+				topDict, self.GlobalSubrs, workers=workers)
 		self.major = 2
 		cff2GetGlyphOrder = self.otFont.getGlyphOrder
 		topDictData = TopDictIndex(None, cff2GetGlyphOrder, None)
@@ -272,7 +288,11 @@ class CFFFontSet(object):
 		else:
 			# clean up the PrivateDicts in the fdArray
 			privateOpOrder = buildOrder(privateDictOperators2)
-			for fontDict in fdArray:
+			for fontDict in topDict.FDArray:
+				# CFF2 has no strings.
+				for key in ('FontName', 'Weight'):
+					fontDict.rawDict.pop(key, None)
+					fontDict.__dict__.pop(key, None)
 				privateDict = fontDict.Private
 				for entry in privateDictOperators:
 					key = entry[1]
@@ -283,7 +303,7 @@ class CFFFontSet(object):
 						if hasattr(privateDict, key):
 							exec("del privateDict.%s" % (key))
 							# print "Removing privateDict attr", key
-		# At this point, the Subrs and Charstrings are all still T2Charstring class
+		# At this point, the dicts are all still of CFF classes;
 		# easiest to fix this by compiling, then decompiling again
 		file = BytesIO()
 		self.compile(file, otFont, isCFF2=True)
@@ -410,18 +430,16 @@ class IndexCompiler(object):
 		if self.items:
 			offSize = calcOffSize(offsets[-1])
 			writeCard8(file, offSize)
-			offSize = -offSize
-			pack = struct.pack
-			for offset in offsets:
-				binOffset = pack(">l", offset)[offSize:]
-				assert len(binOffset) == -offSize
-				file.write(binOffset)
-			for item in self.items:
-				if hasattr(item, "toFile"):
-					item.toFile(file)
-				else:
-					data = tobytes(item, encoding="latin1")
-					file.write(data)
+			file.write(packOffsets(offsets, offSize))
+			self.itemsToFile(file)
+
+	def itemsToFile(self, file):
+		for item in self.items:
+			if hasattr(item, "toFile"):
+				item.toFile(file)
+			else:
+				data = tobytes(item, encoding="latin1")
+				file.write(data)
 
 
 class IndexedStringsCompiler(IndexCompiler):
@@ -487,12 +505,7 @@ class FDArrayIndexCompiler(IndexCompiler):
 			writeCard16(file, len(self.items))
 		offSize = calcOffSize(offsets[-1])
 		writeCard8(file, offSize)
-		offSize = -offSize
-		pack = struct.pack
-		for offset in offsets:
-			binOffset = pack(">l", offset)[offSize:]
-			assert len(binOffset) == -offSize
-			file.write(binOffset)
+		file.write(packOffsets(offsets, offSize))
 		for item in self.items:
 			if hasattr(item, "toFile"):
 				item.toFile(file)
@@ -505,13 +518,53 @@ class FDArrayIndexCompiler(IndexCompiler):
 
 class GlobalSubrsCompiler(IndexCompiler):
 
+	"""Compiles an INDEX of charstrings.  The offsets are computed once,
+	as the charstrings are compiled.  Charstrings of a font that were never
+	loaded are not made into charstrings at all: their data is copied from
+	the font as it is written."""
+
 	def getItems(self, items, strings):
+		return self.compileItems(items, range(len(items)))
+
+	def compileItems(self, index, positions):
+		"""Compiles the charstrings at `positions` of `index`, a list or an
+		Index.  Returns them as bytecode, or as their position in the index
+		for those that are copied."""
+		loaded = getattr(index, "items", index)
 		out = []
-		for cs in items:
-			cs.compile(self.isCFF2)
-			out.append(cs.bytecode)
+		offsets = [1]
+		pos = 1
+		for i in positions:
+			cs = loaded[i]
+			if cs is None:
+				start, end = index.offsets[i:i+2]
+				pos += end - start
+				out.append(i)
+			else:
+				cs.compile(self.isCFF2)
+				pos += len(cs.bytecode)
+				out.append(cs.bytecode)
+			offsets.append(pos)
+		self.source = index
+		self.offsets = offsets if out else []
 		return out
 
+	def getOffsets(self):
+		return self.offsets
+
+	def itemsToFile(self, file):
+		source = self.source
+		sourceOffsets = getattr(source, "offsets", None)
+		if sourceOffsets is not None:
+			data = source._getData()
+			base = sourceOffsets[0]
+		for item in self.items:
+			if isinstance(item, bytes):
+				file.write(item)
+			else:
+				file.write(data[sourceOffsets[item] - base:
+						sourceOffsets[item + 1] - base])
+
 
 class SubrsCompiler(GlobalSubrsCompiler):
 
@@ -522,12 +575,21 @@ class SubrsCompiler(GlobalSubrsCompiler):
 
 class CharStringsCompiler(GlobalSubrsCompiler):
 
+	"""Compiles the CharStrings INDEX, from the charstrings `items` or, if
+	`positions` is given, from the charstrings at those positions of the
+	Index `items`."""
+
+	def __init__(self, items, strings, parent, isCFF2=None, positions=None):
+		self.positions = positions
+		super(CharStringsCompiler, self).__init__(
+			items, strings, parent, isCFF2=isCFF2)
+		del self.positions
+
 	def getItems(self, items, strings):
-		out = []
-		for cs in items:
-			cs.compile(self.isCFF2)
-			out.append(cs.bytecode)
-		return out
+		positions = self.positions
+		if positions is None:
+			positions = range(len(items))
+		return self.compileItems(items, positions)
 
 	def setPos(self, pos, endPos):
 		self.parent.rawDict["CharStrings"] = pos
@@ -558,13 +620,7 @@ class Index(object):
 		offSize = readCard8(file)
 		log.log(DEBUG, "    index count: %s offSize: %s", count, offSize)
 		assert offSize <= 4, "offSize too large: %s" % offSize
-		self.offsets = offsets = []
-		pad = b'\0' * (4 - offSize)
-		for index in range(count + 1):
-			chunk = file.read(offSize)
-			chunk = pad + chunk
-			offset, = struct.unpack(">L", chunk)
-			offsets.append(int(offset))
+		self.offsets = offsets = readOffsets(file, count + 1, offSize)
 		self.offsetBase = file.tell() - 1
 		file.seek(self.offsetBase + offsets[-1])  # pretend we've read the whole lot
 		log.log(DEBUG, "    end of %s at %s", name, file.tell())
@@ -576,16 +632,25 @@ class Index(object):
 		item = self.items[index]
 		if item is not None:
 			return item
-		offset = self.offsets[index] + self.offsetBase
-		size = self.offsets[index + 1] - self.offsets[index]
-		file = self.file
-		file.seek(offset)
-		data = file.read(size)
-		assert len(data) == size
-		item = self.produceItem(index, data, file, offset)
+		offsets = self.offsets
+		start = offsets[index]
+		end = offsets[index + 1]
+		data = self._getData()[start - offsets[0]:end - offsets[0]]
+		assert len(data) == end - start
+		item = self.produceItem(index, data, self.file, start + self.offsetBase)
 		self.items[index] = item
 		return item
 
+	def _getData(self):
+		# The data of all items is read at once, the first time an item
+		# is needed; items are then sliced from it.
+		data = getattr(self, "_data", None)
+		if data is None:
+			offsets = self.offsets
+			self.file.seek(self.offsetBase + offsets[0])
+			data = self._data = self.file.read(offsets[-1] - offsets[0])
+		return data
+
 	def __setitem__(self, index, item):
 		self.items[index] = item
 
@@ -793,24 +858,15 @@ class FDSelect(object):
 			# read data in from file
 			self.format = readCard8(file)
 			if self.format == 0:
-				from array import array
-				self.gidArray = array("B", file.read(numGlyphs)).tolist()
+				self.gidArray = array.array("B", file.read(numGlyphs))
 			elif self.format == 3:
-				gidArray = [None] * numGlyphs
+				gidArray = array.array("B", [0]) * numGlyphs
 				nRanges = readCard16(file)
-				fd = None
-				prev = None
-				for i in range(nRanges):
-					first = readCard16(file)
-					if prev is not None:
-						for glyphID in range(prev, first):
-							gidArray[glyphID] = fd
-					prev = first
-					fd = readCard8(file)
-				if prev is not None:
-					first = readCard16(file)
-					for glyphID in range(prev, first):
-						gidArray[glyphID] = fd
+				ranges = struct.unpack(">" + "HB" * nRanges + "H",
+						file.read(3 * nRanges + 2))
+				for i in range(0, 2 * nRanges, 2):
+					first, fd, end = ranges[i:i+3]
+					gidArray[first:end] = array.array("B", [fd]) * (end - first)
 				self.gidArray = gidArray
 			else:
 				assert False, "unsupported FDSelect format: %s" % format
@@ -818,7 +874,7 @@ class FDSelect(object):
 			# reading from XML. Make empty gidArray, and leave format as passed in.
 			# format is None will result in the smallest representation being used.
 			self.format = format
-			self.gidArray = []
+			self.gidArray = array.array("B")
 
 	def __len__(self):
 		return len(self.gidArray)
@@ -841,9 +897,7 @@ class CharStrings(object):
 		if file is not None:
 			self.charStringsIndex = SubrsIndex(
 				file, globalSubrs, private, fdSelect, fdArray, isCFF2=isCFF2)
-			self.charStrings = charStrings = {}
-			for i in range(len(charset)):
-				charStrings[charset[i]] = i
+			self.charStrings = dict(zip(charset, range(len(charset))))
 			# read from OTF file: charStrings.values() are indices into
 			# charStringsIndex.
 			self.charStringsAreIndexed = 1
@@ -955,6 +1009,47 @@ class CharStrings(object):
 			self[glyphName] = charString
 
 
+def readOffsets(file, count, offSize):
+	"""Reads count big-endian offsets of offSize bytes into an array."""
+	data = file.read(count * offSize)
+	assert len(data) == count * offSize
+	if offSize == 1:
+		return array.array("B", data)
+	if offSize == 3:
+		# Widen to four bytes.
+		wide = bytearray(4 * count)
+		wide[1::4] = data[0::3]
+		wide[2::4] = data[1::3]
+		wide[3::4] = data[2::3]
+		data = bytes(wide)
+		offSize = 4
+	offsets = array.array("H" if offSize == 2 else _uint32Code)
+	offsets.fromstring(data)
+	if sys.byteorder != "big":
+		offsets.byteswap()
+	return offsets
+
+_uint32Code = "I" if array.array("I").itemsize == 4 else "L"
+
+
+def packOffsets(offsets, offSize):
+	"""Packs offsets into big-endian numbers of offSize bytes."""
+	if offSize == 1:
+		return array.array("B", offsets).tostring()
+	wide = array.array("H" if offSize == 2 else _uint32Code, offsets)
+	if sys.byteorder != "big":
+		wide.byteswap()
+	data = wide.tostring()
+	if offSize == 3:
+		# Narrow from four bytes.
+		narrow = bytearray(3 * len(offsets))
+		narrow[0::3] = data[1::4]
+		narrow[1::3] = data[2::4]
+		narrow[2::3] = data[3::4]
+		data = bytes(narrow)
+	return data
+
+
 def readCard8(file):
 	return byteord(file.read(1))
 
@@ -1312,12 +1407,15 @@ class CharsetCompiler(object):
 	def __init__(self, strings, charset, parent):
 		assert charset[0] == '.notdef'
 		isCID = hasattr(parent.dictObj, "ROS")
-		data0 = packCharset0(charset, isCID, strings)
-		data = packCharset(charset, isCID, strings)
-		if len(data) < len(data0):
-			self.data = data
+		# Only pack the smaller of the formats: format 0 takes two bytes
+		# per glyph, formats 1 and 2 three or four bytes per range.
+		nameIDs = getCharsetIDs(charset, isCID, strings)
+		ranges = getCharsetRanges(nameIDs)
+		rangeSize = 4 if any(nLeft > 255 for _, nLeft in ranges) else 3
+		if rangeSize * len(ranges) < 2 * len(nameIDs):
+			self.data = packCharset(charset, isCID, strings, ranges=ranges)
 		else:
-			self.data = data0
+			self.data = packCharset0(charset, isCID, strings, nameIDs)
 		self.parent = parent
 
 	def setPos(self, pos, endPos):
@@ -1359,87 +1457,91 @@ def getSIDfromName(name, strings):
 	return strings.getSID(name)
 
 
-def packCharset0(charset, isCID, strings):
-	fmt = 0
-	data = [packCard8(fmt)]
+def getCharsetIDs(charset, isCID, strings):
+	"""Returns the CIDs or SIDs of the glyphs of charset, minus .notdef."""
 	if isCID:
-		getNameID = getCIDfromName
-	else:
-		getNameID = getSIDfromName
-
-	for name in charset[1:]:
-		data.append(packCard16(getNameID(name, strings)))
-	return bytesjoin(data)
+		return [int(name[3:]) for name in charset[1:]]
+	getSID = strings.getSID
+	return [getSID(name) for name in charset[1:]]
 
 
-def packCharset(charset, isCID, strings):
-	fmt = 1
+def getCharsetRanges(nameIDs):
+	"""Returns the (first, nLeft) ranges of consecutive IDs in nameIDs."""
 	ranges = []
-	first = None
-	end = 0
-	if isCID:
-		getNameID = getCIDfromName
-	else:
-		getNameID = getSIDfromName
-
-	for name in charset[1:]:
-		SID = getNameID(name, strings)
+	first = end = None
+	for nameID in nameIDs:
 		if first is None:
-			first = SID
-		elif end + 1 != SID:
-			nLeft = end - first
-			if nLeft > 255:
-				fmt = 2
-			ranges.append((first, nLeft))
-			first = SID
-		end = SID
-	if end:
-		nLeft = end - first
-		if nLeft > 255:
-			fmt = 2
-		ranges.append((first, nLeft))
+			first = nameID
+		elif end + 1 != nameID:
+			ranges.append((first, end - first))
+			first = nameID
+		end = nameID
+	if first is not None:
+		ranges.append((first, end - first))
+	return ranges
 
-	data = [packCard8(fmt)]
-	if fmt == 1:
-		nLeftFunc = packCard8
+
+def packCharset0(charset, isCID, strings, nameIDs=None):
+	fmt = 0
+	if nameIDs is None:
+		nameIDs = getCharsetIDs(charset, isCID, strings)
+	return packCard8(fmt) + struct.pack(">%dH" % len(nameIDs), *nameIDs)
+
+
+def packCharset(charset, isCID, strings, nameIDs=None, ranges=None):
+	if ranges is None:
+		if nameIDs is None:
+			nameIDs = getCharsetIDs(charset, isCID, strings)
+		ranges = getCharsetRanges(nameIDs)
+	if any(nLeft > 255 for first, nLeft in ranges):
+		fmt = 2
+		rangeFormat = ">HH"
 	else:
-		nLeftFunc = packCard16
+		fmt = 1
+		rangeFormat = ">HB"
+	data = [packCard8(fmt)]
 	for first, nLeft in ranges:
-		data.append(packCard16(first) + nLeftFunc(nLeft))
+		data.append(struct.pack(rangeFormat, first, nLeft))
 	return bytesjoin(data)
 
 
-def parseCharset0(numGlyphs, file, strings, isCID):
+def parseCharsetIDs(numGlyphs, file, fmt):
+	"""Reads the CIDs or SIDs of a charset of the given format into an
+	array, starting with 0 for .notdef."""
+	nameIDs = array.array("H", [0])
+	if fmt == 0:
+		data = array.array("H")
+		data.fromstring(file.read(2 * (numGlyphs - 1)))
+		if sys.byteorder != "big":
+			data.byteswap()
+		nameIDs.extend(data)
+		return nameIDs
+	rangeFormat = ">HB" if fmt == 1 else ">HH"
+	rangeSize = struct.calcsize(rangeFormat)
+	count = 1
+	while count < numGlyphs:
+		first, nLeft = struct.unpack(rangeFormat, file.read(rangeSize))
+		nameIDs.extend(range(first, first + nLeft + 1))
+		count = count + nLeft + 1
+	return nameIDs
+
+
+def charsetFromIDs(nameIDs, strings, isCID):
 	charset = [".notdef"]
 	if isCID:
-		for i in range(numGlyphs - 1):
-			CID = readCard16(file)
-			charset.append("cid" + str(CID).zfill(5))
+		charset.extend(["cid%05d" % CID for CID in nameIDs[1:]])
 	else:
-		for i in range(numGlyphs - 1):
-			SID = readCard16(file)
-			charset.append(strings[SID])
+		charset.extend([strings[SID] for SID in nameIDs[1:]])
 	return charset
 
 
+def parseCharset0(numGlyphs, file, strings, isCID):
+	return charsetFromIDs(parseCharsetIDs(numGlyphs, file, 0), strings, isCID)
+
+
 def parseCharset(numGlyphs, file, strings, isCID, fmt):
-	charset = ['.notdef']
-	count = 1
-	if fmt == 1:
-		nLeftFunc = readCard8
-	else:
-		nLeftFunc = readCard16
-	while count < numGlyphs:
-		first = readCard16(file)
-		nLeft = nLeftFunc(file)
-		if isCID:
-			for CID in range(first, first + nLeft + 1):
-				charset.append("cid" + str(CID).zfill(5))
-		else:
-			for SID in range(first, first + nLeft + 1):
-				charset.append(strings[SID])
-		count = count + nLeft + 1
-	return charset
+	return charsetFromIDs(
+		parseCharsetIDs(numGlyphs, file, fmt), strings, isCID)
 
 
 class EncodingCompiler(object):
@@ -1683,29 +1785,30 @@ class VarStoreConverter(SimpleConverter):
 
 def packFDSelect0(fdSelectArray):
 	fmt = 0
-	data = [packCard8(fmt)]
-	for index in fdSelectArray:
-		data.append(packCard8(index))
-	return bytesjoin(data)
+	return packCard8(fmt) + array.array("B", fdSelectArray).tostring()
+
 
+_fdSelectRunRE = re.compile(b"(.)\\1*", re.DOTALL)
 
-def packFDSelect3(fdSelectArray):
+def getFDSelectRanges(fdSelectArray):
+	"""Returns the (firstGlyph, fdIndex) pairs that start each run of
+	glyphs using the same font dict."""
+	data = array.array("B", fdSelectArray).tostring()
+	return [(m.start(), byteord(m.group(1)))
+			for m in _fdSelectRunRE.finditer(data)]
+
+
+def packFDSelect3(fdSelectArray, fdRanges=None):
 	fmt = 3
-	fdRanges = []
-	lenArray = len(fdSelectArray)
-	lastFDIndex = -1
-	for i in range(lenArray):
-		fdIndex = fdSelectArray[i]
-		if lastFDIndex != fdIndex:
-			fdRanges.append([i, fdIndex])
-			lastFDIndex = fdIndex
-	sentinelGID = i + 1
+	if fdRanges is None:
+		fdRanges = getFDSelectRanges(fdSelectArray)
+	sentinelGID = len(fdSelectArray)
 
 	data = [packCard8(fmt)]
 	data.append(packCard16(len(fdRanges)))
-	for fdRange in fdRanges:
-		data.append(packCard16(fdRange[0]))
-		data.append(packCard8(fdRange[1]))
+	for first, fdIndex in fdRanges:
+		data.append(packCard16(first))
+		data.append(packCard8(fdIndex))
 	data.append(packCard16(sentinelGID))
 	return bytesjoin(data)
 
@@ -1720,14 +1823,13 @@ class FDSelectCompiler(object):
 		elif fmt == 3:
 			self.data = packFDSelect3(fdSelectArray)
 		else:
-			# choose smaller of the two formats
-			data0 = packFDSelect0(fdSelectArray)
-			data3 = packFDSelect3(fdSelectArray)
-			if len(data0) < len(data3):
-				self.data = data0
+			# choose smaller of the two formats, without packing both
+			fdRanges = getFDSelectRanges(fdSelectArray)
+			if 1 + len(fdSelectArray) < 5 + 3 * len(fdRanges):
+				self.data = packFDSelect0(fdSelectArray)
 				fdSelect.format = 0
 			else:
-				self.data = data3
+				self.data = packFDSelect3(fdSelectArray, fdRanges)
 				fdSelect.format = 3
 
 		self.parent = parent
@@ -2108,12 +2210,17 @@ class TopDictCompiler(DictCompiler):
 			fdSelectComp = FDSelectCompiler(fdSelect, self)
 			children.append(fdSelectComp)
 		if hasattr(self.dictObj, "CharStrings"):
-			items = []
 			charStrings = self.dictObj.CharStrings
-			for name in self.dictObj.charset:
-				items.append(charStrings[name])
+			if charStrings.charStringsAreIndexed:
+				# Glyphs that were never loaded are copied over as they are.
+				items = charStrings.charStringsIndex
+				positions = [charStrings.charStrings[name]
+						for name in self.dictObj.charset]
+			else:
+				items = [charStrings[name] for name in self.dictObj.charset]
+				positions = None
 			charStringsComp = CharStringsCompiler(
-				items, strings, self, isCFF2=isCFF2)
+				items, strings, self, isCFF2=isCFF2, positions=positions)
 			children.append(charStringsComp)
 		if hasattr(self.dictObj, "FDArray"):
 			# I have not yet supported merging a ttx CFF-CID font, as there are
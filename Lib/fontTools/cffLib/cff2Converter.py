@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+
+"""Conversion of the CharStrings and subroutines of a CFF font to CFF2,
+working on their bytecode.
+
+CFF2 charstrings have no advance width, and don't end with 'endchar' or
+'return'.  The width, when there is one, is the first operand of a glyph;
+the converter only runs each glyph up to its first stack-clearing operator
+to tell whether it has one, and then cuts the bytes of the width and of the
+final operator.  Glyphs whose width is pushed inside a subroutine, or that
+can't be followed that way (eg. they compute their operands), are
+decompiled instead, with their subroutines inlined, and encoded again
+without the width.  The charstrings don't need to be decompiled into programs:
+those that were never loaded from the font are converted INDEX by INDEX,
+without making charstring objects of them.
+"""
+
+from __future__ import print_function, division, absolute_import
+from fontTools.misc.py23 import *
+from fontTools.misc import psCharStrings
+from fontTools.misc.workerTools import mapInWorkers
+
+__all__ = ["convertCharStrings"]
+
+
+_widthOperators = {
+	1: 0, 3: 0, 18: 0, 23: 0,  # hstem vstem hstemhm vstemhm
+	19: 0, 20: 0,  # hintmask cntrmask
+	21: 0, 22: 1, 4: 1,  # rmoveto hmoveto vmoveto
+	14: 0,  # endchar
+}  # operator: evenOdd
+_callOperators = frozenset([10, 29])  # callsubr callgsubr
+
+
+def _readOperand(data, index):
+	"""Returns the integer encoded at data[index], or None if it's not
+	an integer."""
+	b0 = data[index]
+	if 32 <= b0 <= 246:
+		return b0 - 139
+	if 247 <= b0 <= 250:
+		return (b0 - 247) * 256 + data[index+1] + 108
+	if 251 <= b0 <= 254:
+		return -(b0 - 251) * 256 - data[index+1] - 108
+	if b0 == 28:
+		value = (data[index+1] << 8) | data[index+2]
+		return value - 0x10000 if value >= 0x8000 else value
+	return None
+
+
+class _NeedsDecompiling(Exception):
+	pass
+
+
+class _WidthFinder(object):
+
+	"""Finds the width operand of glyphs, given the bytecode of the
+	global subroutines and of the local subroutines of each font dict."""
+
+	def __init__(self, globalSubrs, localSubrs):
+		self.globalSubrs = globalSubrs
+		self.globalBias = psCharStrings.calcSubrBias(globalSubrs)
+		self.localSubrs = localSubrs
+		self.localBias = [psCharStrings.calcSubrBias(subrs)
+				for subrs in localSubrs]
+
+	def widthLength(self, data, fdIndex):
+		"""Returns the number of bytes of the width operand at the start of
+		the glyph bytecode `data`, 0 if it has no width, or None if the
+		glyph has to be decompiled to remove it: when the width is pushed
+		inside a subroutine, or when the glyph computes operands, calls
+		computed subroutine numbers or uses other operators that aren't
+		modelled here before its first stack-clearing operator."""
+		self.fdIndex = fdIndex
+		self.count = 0
+		# Where the operand at the bottom of the stack ends, if it is the
+		# first one of the glyph.
+		self.widthEnd = None
+		try:
+			evenOdd = self.run(bytearray(data), 0)
+		except _NeedsDecompiling:
+			return None
+		if evenOdd is None or not (self.count % 2) ^ evenOdd:
+			return 0
+		return self.widthEnd
+
+	def run(self, data, level):
+		"""Runs data up to the first stack-clearing operator, and returns
+		the evenOdd of that, or None if data returns before one."""
+		index = 0
+		end = len(data)
+		lastOperand = None
+		while index < end:
+			b0 = data[index]
+			if b0 >= 32 or b0 == 28:
+				if b0 == 28:
+					size = 3
+				elif b0 <= 246:
+					size = 1
+				elif b0 <= 254:
+					size = 2
+				else:
+					size = 5
+				if not self.count:
+					self.widthEnd = size if level == 0 and index == 0 else None
+				self.count += 1
+				lastOperand = index
+				index += size
+				continue
+			op = b0
+			if op in _widthOperators:
+				return _widthOperators[op]
+			if op in _callOperators:
+				subrIndex = None
+				if lastOperand is not None:
+					subrIndex = _readOperand(data, lastOperand)
+				if subrIndex is None:
+					raise _NeedsDecompiling()
+				self.count -= 1
+				if op == 10:
+					subrs = self.localSubrs[self.fdIndex]
+					bias = self.localBias[self.fdIndex]
+				else:
+					subrs = self.globalSubrs
+					bias = self.globalBias
+				evenOdd = self.run(bytearray(subrs[subrIndex + bias]), level + 1)
+				if evenOdd is not None:
+					return evenOdd
+				lastOperand = None
+				index += 1
+				continue
+			if op == 11:  # return
+				return None
+			raise _NeedsDecompiling()
+		return None
+
+
+def _removeInlinedWidth(data, private, globalSubrs):
+	"""Returns the bytecode of the glyph `data`, with its subroutines
+	inlined and without its width, if it has one."""
+	from fontTools.cffLib.subroutinizer import (_expandCharString,
+			_splitCommands, _splitWidth)
+	charString = psCharStrings.T2CharString(bytecode=data, private=private,
+			globalSubrs=globalSubrs)
+	program = _expandCharString(charString, globalSubrs)
+	width, commands = _splitWidth(_splitCommands(program))
+	if width is not None:
+		program = program[1:]
+	return psCharStrings.T2CharString(program=program).encodeProgram(
+			isCFF2=True)
+
+
+def _stripLastOperator(data, opcodes):
+	"""Returns data without its last byte, if that is one of opcodes."""
+	if data and byteord(data[-1:]) in opcodes:
+		return data[:-1]
+	return data
+
+
+def _indexItems(index):
+	"""Returns the bytecode of the items of the Index `index`, compiling the
+	charstrings that were loaded, slicing the others from the font data."""
+	loaded = index.items
+	offsets = getattr(index, "offsets", None)
+	if offsets is not None and any(item is None for item in loaded):
+		data = index._getData()
+		base = offsets[0]
+	items = []
+	for i, item in enumerate(loaded):
+		if item is None:
+			items.append(data[offsets[i] - base:offsets[i+1] - base])
+		else:
+			item.compile()
+			items.append(item.bytecode)
+	return items
+
+
+def _setIndexItems(index, items):
+	"""Makes `items` the (not yet loaded) bytecode of the items of the
+	Index `index`."""
+	offsets = [1]
+	pos = 1
+	for item in items:
+		pos += len(item)
+		offsets.append(pos)
+	index.items = [None] * len(items)
+	index.offsets = offsets
+	index._data = bytesjoin(items)
+	index.file = None
+	index.offsetBase = 0
+
+
+def _makeWidthFinder(subrs):
+	globalSubrs, localSubrs = subrs
+	return _WidthFinder(globalSubrs, localSubrs)
+
+def _widthLength(finder, glyph):
+	data, fdIndex = glyph
+	return finder.widthLength(data, fdIndex)
+
+
+def convertCharStrings(topDict, globalSubrs, workers=None):
+	"""Converts the CharStrings of the CFF font `topDict`, its local
+	subroutines and the global subroutines `globalSubrs` to CFF2 bytecode,
+	in place.  The glyphs are looked at in up to `workers` processes.
+	"""
+	if hasattr(topDict, "FDArray"):
+		privates = [fontDict.Private for fontDict in topDict.FDArray]
+	else:
+		privates = [topDict.Private]
+	subrsIndexes = [getattr(private, "Subrs", None) for private in privates]
+	localSubrs = [_indexItems(subrs) if subrs is not None else []
+			for subrs in subrsIndexes]
+	globalItems = _indexItems(globalSubrs)
+
+	charStrings = topDict.CharStrings
+	if charStrings.charStringsAreIndexed:
+		index = charStrings.charStringsIndex
+		glyphs = _indexItems(index)
+		fdSelect = getattr(index, "fdSelect", None)
+		if fdSelect is not None and len(privates) > 1:
+			fdIndices = list(fdSelect)
+		else:
+			fdIndices = [0] * len(glyphs)
+	else:
+		names = list(charStrings.keys())
+		charStringList = [charStrings[name] for name in names]
+		glyphs = []
+		fdIndices = []
+		for charString in charStringList:
+			charString.compile()
+			glyphs.append(charString.bytecode)
+			fdIndices.append(getattr(charString, "fdSelectIndex", 0)
+					if len(privates) > 1 else 0)
+
+	widthLengths = mapInWorkers(_widthLength, list(zip(glyphs, fdIndices)),
+			workers, (globalItems, localSubrs), setup=_makeWidthFinder,
+			chunkSize=1000)
+	for i, widthLength in enumerate(widthLengths):
+		if widthLength is None:
+			glyphs[i] = _removeInlinedWidth(glyphs[i], privates[fdIndices[i]],
+					globalSubrs)
+			widthLengths[i] = 0
+	glyphs = [_stripLastOperator(data[widthLength:], (14,))
+			for data, widthLength in zip(glyphs, widthLengths)]
+
+	if charStrings.charStringsAreIndexed:
+		_setIndexItems(index, glyphs)
+	else:
+		for charString, data in zip(charStringList, glyphs):
+			charString.setBytecode(data)
+
+	# Subroutines may end with 'endchar' instead of 'return'.
+	for subrs, items in zip(subrsIndexes, localSubrs):
+		if subrs is not None:
+			_convertSubrs(subrs, items)
+	_convertSubrs(globalSubrs, globalItems)
+
+
+def _convertSubrs(subrs, items):
+	converted = [_stripLastOperator(data, (11, 14)) for data in items]
+	if converted != items or any(item is not None for item in subrs.items):
+		_setIndexItems(subrs, converted)
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+
+"""Hint removal for CFF CharStrings, working on their bytecode.
+
+The dehinter runs the bytecode of each glyph (and of the subroutines it
+calls) once, with the same bookkeeping as the subsetter's decompiler-based
+hint dropping: it notes where the stem hints of every charstring end, which
+calls to subroutines that only produce hints can go, and where the hintmask
+and cntrmask operators and their mask bytes are.  Each charstring that has
+hints then gets its new bytecode by copying the byte ranges that are kept,
+without decompiling it into a program or compiling it back.
+"""
+
+from __future__ import print_function, division, absolute_import
+from fontTools.misc.py23 import *
+from fontTools.misc import psCharStrings
+from fontTools.misc.psCharStrings import decodeT2
+
+__all__ = ["dehint", "dehintPrivate"]
+
+
+privateHintNames = (
+	'BlueValues', 'OtherBlues', 'FamilyBlues', 'FamilyOtherBlues',
+	'BlueScale', 'BlueShift', 'BlueFuzz',
+	'StemSnapH', 'StemSnapV', 'StdHW', 'StdVW')
+
+_stemOperators = frozenset([1, 3, 18, 23])  # hstem vstem hstemhm vstemhm
+_maskOperators = frozenset([19, 20])  # hintmask cntrmask
+_widthOperators = {21: 0, 22: 1, 4: 1, 14: 0}  # movetos, endchar: evenOdd
+_callOperators = frozenset([10, 29])  # callsubr callgsubr
+_noopOperators = frozenset([11, 3072])  # return ignore
+_unsupportedOperators = frozenset(
+	op for op, name in psCharStrings.t2OperatorNames.items()
+	if name in ('vsindex', 'blend', 'and', 'or', 'not', 'store', 'abs',
+		'add', 'sub', 'div', 'load', 'neg', 'eq', 'drop', 'put', 'get',
+		'ifelse', 'random', 'mul', 'sqrt', 'dup', 'exch', 'index', 'roll'))
+
+
+def _operandStart(data, start, end):
+	"""Returns the offset of the last operand encoded in data[start:end]."""
+	last = None
+	while start < end:
+		last = start
+		b0 = data[start]
+		if 32 <= b0 <= 246:
+			start += 1
+		elif 247 <= b0 <= 254:
+			start += 2
+		elif b0 == 28:
+			start += 3
+		else:
+			start += 5
+	return last
+
+
+class _Hints(object):
+
+	"""What dropping the hints of one charstring involves.  Offsets are
+	into its bytecode."""
+
+	__slots__ = ("hasHint", "lastHint", "status", "masks", "deletions")
+
+	def __init__(self):
+		# Whether calling this charstring produces any hint stems.
+		self.hasHint = False
+		# Offset to chop the bytecode at, to drop all hints.
+		self.lastHint = 0
+		# 0: after dropping hints, this charstring is empty
+		# 1: after dropping hints, there may be more hints
+		#    continuing after this
+		# 2: no more hints possible after this charstring
+		self.status = 0
+		# (start, end) of each hintmask or cntrmask with its mask bytes.
+		self.masks = []
+		# (start, end) of each call to a subroutine that is empty without
+		# hints.
+		self.deletions = []
+
+
+class _Dehinter(object):
+
+	def __init__(self, globalSubrs):
+		self.globalSubrs = globalSubrs
+		self.globalBias = psCharStrings.calcSubrBias(globalSubrs)
+		# id(charString) -> (charString, _Hints)
+		self.hints = {}
+
+	def run(self, charString):
+		"""Runs the glyph `charString`; returns its advance width."""
+		private = charString.private
+		self.localSubrs = getattr(private, "Subrs", [])
+		self.localBias = psCharStrings.calcSubrBias(self.localSubrs)
+		self.nominalWidthX = private.nominalWidthX
+		self.defaultWidthX = private.defaultWidthX
+		self.width = 0
+		self.gotWidth = False
+		self.stack = []
+		self.hintCount = 0
+		self.hintMaskBytes = 0
+		self.execute(charString)
+		return self.width
+
+	def popallWidth(self, evenOdd=0):
+		args = self.stack
+		self.stack = []
+		if not self.gotWidth:
+			if evenOdd ^ (len(args) % 2):
+				self.width = self.nominalWidthX + args[0]
+				args = args[1:]
+			else:
+				self.width = self.defaultWidthX
+			self.gotWidth = True
+		return args
+
+	def countHints(self):
+		self.hintCount += len(self.popallWidth()) // 2
+
+	def execute(self, charString):
+		if charString.bytecode is None:
+			charString.compile()
+		bytecode = charString.bytecode
+		data = bytearray(bytecode)
+		end = len(data)
+		hints = _Hints()
+		opsSinceCheck = 0  # operators since the last hint, mask or call
+		tokensSinceCheck = 0
+		lastTokenIsOp = False
+		index = 0
+		while index is not None and index < end:
+			operands, opcodes, argEnds, opEnds, nextIndex = decodeT2(
+				data, index)
+			start = 0
+			for i in range(len(opcodes)):
+				op = opcodes[i]
+				argEnd = argEnds[i]
+				opEnd = opEnds[i]
+				# Where the operands of this operator start
+				groupStart = index
+				index = opEnd
+				if argEnd > start:
+					self.stack.extend(operands[start:argEnd])
+					tokensSinceCheck += argEnd - start
+				start = argEnd
+				if op in _stemOperators:
+					self.countHints()
+					hints.hasHint = True
+					hints.lastHint = opEnd
+					opsSinceCheck = tokensSinceCheck = 0
+					lastTokenIsOp = True
+					continue
+				if op in _maskOperators:
+					if not self.hintMaskBytes:
+						self.countHints()
+						self.hintMaskBytes = (self.hintCount + 7) // 8
+					maskEnd = opEnd + self.hintMaskBytes
+					hints.masks.append((opEnd - 1, maskEnd))
+					if hints.status != 2:
+						if opsSinceCheck:
+							hints.status = 2
+						else:
+							# We are an implicit vstem
+							hints.hasHint = True
+							hints.lastHint = maskEnd
+							hints.status = 0
+					opsSinceCheck = tokensSinceCheck = 0
+					lastTokenIsOp = False
+					nextIndex = maskEnd
+					break
+				if op in _callOperators:
+					subrIndex = self.stack.pop()
+					if op == 10:
+						subr = self.localSubrs[subrIndex + self.localBias]
+					else:
+						subr = self.globalSubrs[subrIndex + self.globalBias]
+					subrHints = self.execute(subr)
+					if hints.status != 2:
+						if opsSinceCheck:
+							hints.status = 2
+						opsSinceCheck = tokensSinceCheck = 0
+					if hints.status != 2:
+						if subrHints.hasHint:
+							hints.hasHint = True
+						if subrHints.status == 0:
+							hints.lastHint = opEnd
+						else:
+							# Leave the subroutine call in
+							hints.lastHint = _operandStart(
+								data, groupStart, opEnd - 1)
+					elif subrHints.status == 0:
+						hints.deletions.append(
+							(_operandStart(data, groupStart, opEnd - 1), opEnd))
+					hints.status = max(hints.status, subrHints.status)
+					lastTokenIsOp = True
+					continue
+				opsSinceCheck += 1
+				tokensSinceCheck += 1
+				lastTokenIsOp = True
+				if op in _widthOperators:
+					self.popallWidth(_widthOperators[op])
+				elif op in _unsupportedOperators:
+					raise NotImplementedError(
+						psCharStrings.t2OperatorNames[op])
+				elif op not in _noopOperators:
+					self.stack = []
+			else:
+				if len(operands) > start:
+					self.stack.extend(operands[start:])
+					tokensSinceCheck += len(operands) - start
+					lastTokenIsOp = False
+			index = nextIndex
+		if hints.status != 2:
+			# The last token doesn't count.
+			if tokensSinceCheck > 1:
+				if opsSinceCheck - lastTokenIsOp > 0:
+					hints.status = 2
+				else:
+					hints.status = 1
+		if hints.hasHint or hints.masks:
+			self.hints[id(charString)] = (charString, hints)
+		return hints
+
+
+def _dropHints(charString, hints, widthBytes):
+	"""Sets the bytecode of charString to its original bytecode, minus the
+	hints, plus the encoded width (if not None)."""
+	bytecode = charString.bytecode
+	cuts = list(hints.deletions)
+	if hints.hasHint:
+		cuts.append((0, hints.lastHint))
+	cuts.extend(hints.masks)
+	cuts.sort()
+	pieces = [widthBytes] if widthBytes is not None else []
+	pos = 0
+	for start, end in cuts:
+		if start > pos:
+			pieces.append(bytecode[pos:start])
+		pos = max(pos, end)
+	pieces.append(bytecode[pos:])
+	charString.setBytecode(bytesjoin(pieces))
+
+
+def _encodeNumber(value):
+	if isinstance(value, float):
+		return psCharStrings.encodeFixed(value)
+	return psCharStrings.encodeIntT2(value)
+
+
+def dehintPrivate(private):
+	"""Drops the font-wide hinting values of the Private dict `private`,
+	without reading them."""
+	for name in privateHintNames:
+		if (name in private.__dict__ or name in private.rawDict or
+				name in private.defaults):
+			setattr(private, name, None)
+
+
+def dehint(topDict, glyphNames=None):
+	"""Drops the hints of the glyphs `glyphNames` (by default, all glyphs)
+	of the CFF font `topDict`, and of the subroutines they call, as well as
+	the hinting values of its Private dicts.
+
+	Glyph stems, hintmask and cntrmask operators are removed, and so are
+	calls to subroutines that only contain hints.  Arithmetic and CFF2
+	operators are not supported and raise NotImplementedError.
+	"""
+	if glyphNames is None:
+		glyphNames = topDict.charset
+	charStrings = topDict.CharStrings
+	dehinter = _Dehinter(topDict.GlobalSubrs)
+	widths = {}
+	for glyphName in glyphNames:
+		charString, _ = charStrings.getItemAndSelector(glyphName)
+		widths[id(charString)] = dehinter.run(charString)
+
+	# All charstrings have to be run before any is rewritten: the offsets
+	# are into the original bytecode of the subroutines.
+	for charString, hints in dehinter.hints.values():
+		widthBytes = None
+		if hints.hasHint and id(charString) in widths:
+			# Insert width back if needed
+			private = charString.private
+			width = widths[id(charString)]
+			if width != private.defaultWidthX:
+				widthBytes = _encodeNumber(width - private.nominalWidthX)
+		_dropHints(charString, hints, widthBytes)
+
+	if hasattr(topDict, "FDArray"):
+		for fontDict in topDict.FDArray:
+			dehintPrivate(fontDict.Private)
+	else:
+		dehintPrivate(topDict.Private)
@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+
+"""Instancer for variable CFF2 fonts.
+
+A CFF2Instancer parses the CharStrings and subroutines of a CFF2 font set
+once, turning every 'blend' into references to rows of a per-VarData table
+of default values and deltas.  Instantiating at a (normalized) location
+then computes the region scalars once per 'vsindex', applies all blends of
+the font in one pass over those tables, and writes a static CFF2 font set
+with the 'blend' and 'vsindex' operators dropped, the blended Private dict
+values resolved and the VarStore removed.  Any number of locations can be
+instantiated from the same instancer.
+"""
+
+from __future__ import print_function, division, absolute_import
+from fontTools.misc.py23 import *
+from fontTools.misc import psCharStrings
+from fontTools.cffLib import CFFFontSet, privateDictOperators2
+from fontTools.varLib.models import supportScalar
+import math
+
+__all__ = ["CFF2Instancer", "CFF2InstancerError", "instantiateCFF2"]
+
+
+class CFF2InstancerError(ValueError):
+	pass
+
+
+class _Blend(object):
+
+	"""Placeholder for one value produced by a 'blend' operator."""
+
+	__slots__ = ("vsIndex", "row")
+
+	def __init__(self, vsIndex, row):
+		self.vsIndex = vsIndex
+		self.row = row
+
+
+def _round(value):
+	return int(math.floor(value + .5))
+
+
+def _fontDicts(topDict):
+	if hasattr(topDict, "FDArray"):
+		return list(topDict.FDArray)
+	return [topDict]
+
+
+def _glyphEntries(cff):
+	"""Yields (charString, localSubrs, globalSubrs, private) for the glyphs
+	of the CFF font set."""
+	globalSubrs = cff.GlobalSubrs
+	for fontName in cff.keys():
+		topDict = cff[fontName]
+		charStrings = topDict.CharStrings
+		for glyphName in topDict.charset:
+			charString, _ = charStrings.getItemAndSelector(glyphName)
+			private = charString.private
+			yield (charString, getattr(private, "Subrs", []), globalSubrs,
+					private)
+
+
+def _subrEntries(cff):
+	"""Like _glyphEntries, for the local and global subroutines."""
+	globalSubrs = cff.GlobalSubrs
+	for fontName in cff.keys():
+		for fontDict in _fontDicts(cff[fontName]):
+			private = fontDict.Private
+			localSubrs = getattr(private, "Subrs", [])
+			for subr in localSubrs:
+				yield subr, localSubrs, globalSubrs, private
+	for subr in globalSubrs:
+		yield subr, [], globalSubrs, None
+
+
+def _allCharStrings(cff):
+	for entry in _glyphEntries(cff):
+		yield entry[0]
+	for entry in _subrEntries(cff):
+		yield entry[0]
+
+
+class CFF2Instancer(object):
+
+	"""Instantiates the CFF2 font set `cff` at normalized locations.
+
+	`axisTags` lists the axis tags in 'fvar' order, which is the order
+	of the axes in the VarStore regions.  If `roundValues` is true, blended
+	values whose master values are all integers are rounded to integers.
+
+	An instancer can be pickled, eg. to send it to worker processes, without
+	the font set: unpickled, it can only apply() itself to copies of it.
+	"""
+
+	def __init__(self, cff, axisTags, roundValues=True):
+		if cff.major != 2:
+			raise CFF2InstancerError("not a CFF2 font set")
+		self.cff = cff
+		self.axisTags = list(axisTags)
+		self.roundValues = roundValues
+		topDict = cff.topDictIndex[0]
+		self.varStore = getattr(topDict, "VarStore", None)
+		# The supports of the VarStore regions, and the regions of each
+		# vsindex
+		self._regions = []
+		self._varDataRegions = []
+		if self.varStore is not None:
+			otVarStore = self.varStore.otVarStore
+			for region in otVarStore.VarRegionList.Region:
+				self._regions.append({tag: (axis.StartCoord, axis.PeakCoord,
+						axis.EndCoord) for tag, axis in zip(self.axisTags,
+						region.VarRegionAxis)})
+			for varData in otVarStore.VarData:
+				self._varDataRegions.append(list(varData.VarRegionIndex))
+		# Per vsindex: default values, and their deltas (one per region)
+		self.defaults = {}
+		self.deltas = {}
+		self.integral = {}
+		self._subrVsIndex = {}
+		self._mixedVsIndexSubrs = []
+		# Per charstring id: its program with the blended values replaced
+		# by placeholders, or None if it doesn't vary
+		self._templates = {}
+		self._parseCharStrings()
+		# The templates in _allCharStrings() order, which apply() follows
+		self._charStringTemplates = [self._templates[id(charString)]
+				for charString in _allCharStrings(cff)]
+		del self._templates, self._subrVsIndex, self._mixedVsIndexSubrs
+		# The variable font set, compiled, for instantiate() to start from
+		self._data = None
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		for name in ("cff", "varStore", "_data"):
+			state[name] = None
+		return state
+
+	def _numRegions(self, vsIndex):
+		if self.varStore is None:
+			raise CFF2InstancerError("font has blends but no VarStore")
+		return self.varStore.otVarStore.VarData[vsIndex].VarRegionCount
+
+	def _addRow(self, vsIndex, masters):
+		"""Adds a row with the default value and its deltas; returns
+		a placeholder for the blended value."""
+		default = masters[0]
+		defaults = self.defaults.setdefault(vsIndex, [])
+		self.deltas.setdefault(vsIndex, []).append(
+			[master - default for master in masters[1:]])
+		self.integral.setdefault(vsIndex, []).append(
+			all(isinstance(v, int) for v in masters))
+		defaults.append(default)
+		return _Blend(vsIndex, len(defaults) - 1)
+
+	def _parseCharStrings(self):
+		# Glyphs first, so that subroutines are parsed with the vsindex in
+		# effect where they are called.
+		pending = []
+		for entry in _glyphEntries(self.cff):
+			entry[0].decompile()
+			self._parse(entry, getattr(entry[3], "vsindex", 0), pending)
+		while pending:
+			entry, vsIndex = pending.pop()
+			if id(entry[0]) not in self._templates:
+				entry[0].decompile()
+				self._parse(entry, vsIndex, pending)
+		# Subroutines called with different vsindex values are fine as long
+		# as they have no blends.
+		for subr in self._mixedVsIndexSubrs:
+			if self._templates[id(subr)] is not None:
+				raise CFF2InstancerError(
+					"subroutine called with different vsindex values")
+		# Subroutines that are never called.
+		for entry in _subrEntries(self.cff):
+			if id(entry[0]) not in self._templates:
+				entry[0].decompile()
+				self._parse(entry, getattr(entry[3], "vsindex", 0), None)
+
+	def _parse(self, entry, vsIndex, pending):
+		"""Stores the template of entry's charstring, or None if it has no
+		blends.  Subroutines it calls are added to `pending`, unless that
+		is None."""
+		charString, localSubrs, globalSubrs, private = entry
+		program = charString.program
+		template = []
+		hasBlend = False
+		stackStart = 0
+		i = 0
+		end = len(program)
+		while i < end:
+			token = program[i]
+			i += 1
+			if not isinstance(token, basestring):
+				template.append(token)
+				continue
+			if token == 'blend':
+				numRegions = self._numRegions(vsIndex)
+				numBlends = template[-1] if len(template) > stackStart else None
+				if not isinstance(numBlends, int):
+					raise CFF2InstancerError("computed number of blends")
+				count = numBlends * (numRegions + 1) + 1
+				if len(template) - stackStart < count:
+					raise CFF2InstancerError(
+						"blend operands not in the same charstring")
+				args = template[-count:-1]
+				del template[-count:]
+				for j in range(numBlends):
+					masters = [args[j]]
+					deltaStart = numBlends + j * numRegions
+					for delta in args[deltaStart:deltaStart+numRegions]:
+						masters.append(args[j] + delta)
+					if any(isinstance(v, _Blend) for v in masters):
+						raise CFF2InstancerError("nested blend")
+					template.append(self._addRow(vsIndex, masters))
+				hasBlend = True
+				continue
+			if token == 'vsindex':
+				vsIndex = template.pop()
+				stackStart = len(template)
+				hasBlend = True  # the operator has to go
+				continue
+			template.append(token)
+			if token in ('callsubr', 'callgsubr') and pending is not None:
+				subrIndex = template[-2]
+				if not isinstance(subrIndex, int):
+					raise CFF2InstancerError("computed subroutine number")
+				subrs = localSubrs if token == 'callsubr' else globalSubrs
+				subr = subrs[subrIndex + psCharStrings.calcSubrBias(subrs)]
+				if self._subrVsIndex.setdefault(id(subr), vsIndex) != vsIndex:
+					self._mixedVsIndexSubrs.append(subr)
+				pending.append(((subr, localSubrs, globalSubrs, private),
+						vsIndex))
+			elif token in ('hintmask', 'cntrmask'):
+				template.append(program[i])
+				i += 1
+			stackStart = len(template)
+		self._templates[id(charString)] = template if hasBlend else None
+
+	def regionScalars(self, location):
+		"""Returns a dict mapping each vsindex of the VarStore to the list
+		of scalars of its regions at the normalized `location`."""
+		regionScalars = [supportScalar(location, support, ot=True)
+				for support in self._regions]
+		scalars = {}
+		for vsIndex, regions in enumerate(self._varDataRegions):
+			scalars[vsIndex] = [regionScalars[r] for r in regions]
+		return scalars
+
+	def blendValues(self, location, regionScalars=None):
+		"""Returns a dict mapping each vsindex to the list of the values of
+		all its CharString blends at the normalized `location`."""
+		if regionScalars is None:
+			regionScalars = self.regionScalars(location)
+		roundValues = self.roundValues
+		values = {}
+		for vsIndex in self.defaults:
+			scalars = regionScalars[vsIndex]
+			out = values[vsIndex] = []
+			active = [(r, s) for r, s in enumerate(scalars) if s]
+			for default, deltas, integral in zip(self.defaults[vsIndex],
+					self.deltas[vsIndex], self.integral[vsIndex]):
+				value = default
+				for r, s in active:
+					value += s * deltas[r]
+				if roundValues and integral:
+					value = _round(value)
+				out.append(value)
+		return values
+
+	def _resolveMasters(self, masters, scalars):
+		default = masters[0]
+		value = default
+		for s, master in zip(scalars, masters[1:]):
+			if s:
+				value += s * (master - default)
+		if self.roundValues and all(isinstance(v, int) for v in masters):
+			value = _round(value)
+		return value
+
+	def _instantiatePrivate(self, private, regionScalars):
+		vsIndex = getattr(private, "vsindex", 0)
+		for op, name, argType, _, _ in privateDictOperators2:
+			if argType not in ('number', 'delta') or name == 'Subrs':
+				continue
+			value = getattr(private, name, None)
+			if not isinstance(value, list) or not value:
+				continue
+			if argType == 'number':
+				value = self._resolveMasters(value, regionScalars[vsIndex])
+			elif isinstance(value[0], list):
+				value = [self._resolveMasters(v, regionScalars[vsIndex])
+						for v in value]
+			else:
+				continue
+			setattr(private, name, value)
+		for name in ("vsindex", "blend"):
+			private.rawDict.pop(name, None)
+			private.__dict__.pop(name, None)
+		private.vstore = None
+
+	def instantiate(self, location):
+		"""Returns a static copy of the CFF2 font set at the normalized
+		`location`, a dict mapping axis tags to values."""
+		cff = self.cff
+		if cff is None:
+			raise CFF2InstancerError("unpickled instancer has no font set")
+		otFont = cff.otFont
+		if self._data is None:
+			file = BytesIO()
+			cff.compile(file, otFont, isCFF2=True)
+			self._data = file.getvalue()
+		instance = CFFFontSet()
+		instance.decompile(BytesIO(self._data), otFont, isCFF2=True)
+		self.apply(instance, location)
+		return instance
+
+	def apply(self, cff, location):
+		"""Instantiates, in place, `cff` (the font set the instancer was
+		built from, or a copy of it) at the normalized `location`."""
+		regionScalars = self.regionScalars(location)
+		values = self.blendValues(location, regionScalars)
+		for template, charString in zip(self._charStringTemplates,
+				_allCharStrings(cff)):
+			if template is None:
+				continue
+			charString.setProgram([values[t.vsIndex][t.row]
+					if isinstance(t, _Blend) else t for t in template])
+
+		for fontName in cff.keys():
+			topDict = cff[fontName]
+			for fontDict in _fontDicts(topDict):
+				self._instantiatePrivate(fontDict.Private, regionScalars)
+			if hasattr(topDict, "FDArray"):
+				topDict.FDArray.vstore = None
+				for fontDict in topDict.FDArray:
+					fontDict.vstore = None
+			topDict.rawDict.pop("VarStore", None)
+			topDict.__dict__.pop("VarStore", None)
+
+
+def instantiateCFF2(otFont, location, roundValues=True):
+	"""Instantiates the 'CFF2' table of `otFont` in place at the normalized
+	`location`, using the axis order of its 'fvar' table."""
+	cff = otFont['CFF2'].cff
+	axisTags = [axis.axisTag for axis in otFont['fvar'].axes]
+	CFF2Instancer(cff, axisTags, roundValues=roundValues).apply(cff, location)
@@ -269,7 +269,8 @@ def specializeCommands(commands,
 		       ignoreErrors=False,
 		       generalizeFirst=True,
 		       preserveTopology=False,
-		       maxstack=48):
+		       maxstack=48,
+		       optimal=False):
 
 	# We perform several rounds of optimizations.  They are carefully ordered and are:
 	#
@@ -300,83 +301,161 @@ def specializeCommands(commands,
 	# I have convinced myself that this produces optimal bytecode (except for, possibly
 	# one byte each time maxstack size prohibits combining.)  YMMV, but you'd be wrong. :-)
 	# A dynamic-programming approach can do the same but would be significantly slower.
+	# That is what optimal=True does instead of rounds 4 to 6, for the guaranteed smallest
+	# bytecode.
+	#
+	# The merge decisions of round 5 (and of optimal=True) are cached across calls, so
+	# specializing all glyphs of a font by calling this once per glyph already shares
+	# that work; nothing else is per-font, which is why there is no batch entry point.
 
 
 	# 0. Generalize commands.
 	if generalizeFirst:
 		commands = generalizeCommands(commands, ignoreErrors=ignoreErrors)
-	else:
-		commands = list(commands) # Make copy since we modify in-place later.
 
-	# 1. Combine successive rmoveto operations.
-	for i in range(len(commands)-1, 0, -1):
-		if 'rmoveto' == commands[i][0] == commands[i-1][0]:
-			v1, v2 = commands[i-1][1], commands[i][1]
-			commands[i-1] = ('rmoveto', [v1[0]+v2[0], v1[1]+v2[1]])
-			del commands[i]
+	# Rounds 1 to 3 are done in one pass over the commands, from the end,
+	# producing the commands in reverse order.
+	commands = _specializeSegments(commands, preserveTopology)
+	if optimal:
+		return _combineOptimal(commands[::-1], maxstack)
 
-	# 2. Specialize rmoveto/rlineto/rrcurveto operators into horizontal/vertical variants.
-	#
-	# We, in fact, specialize into more, made-up, variants that special-case when both
-	# X and Y components are zero.  This simplifies the following optimization passes.
-	# This case is rare, but OCD does not let me skip it.
-	#
-	# After this round, we will have four variants that use the following mnemonics:
-	#
-	#  - 'r' for relative,   ie. non-zero X and non-zero Y,
-	#  - 'h' for horizontal, ie. zero X and non-zero Y,
-	#  - 'v' for vertical,   ie. non-zero X and zero Y,
-	#  - '0' for zeros,      ie. zero X and zero Y.
-	#
-	# The '0' pseudo-operators are not part of the spec, but help simplify the following
-	# optimization rounds.  We resolve them at the end.  So, after this, we will have four
-	# moveto and four lineto variants:
-	#
-	#  - 0moveto, 0lineto
-	#  - hmoveto, hlineto
-	#  - vmoveto, vlineto
-	#  - rmoveto, rlineto
-	#
-	# and sixteen curveto variants.  For example, a '0hcurveto' operator means a curve
-	# dx0,dy0,dx1,dy1,dx2,dy2,dx3,dy3 where dx0, dx1, and dy3 are zero but not dx3.
-	# An 'rvcurveto' means dx3 is zero but not dx0,dy0,dy3.
-	#
-	# There are nine different variants of curves without the '0'.  Those nine map exactly
-	# to the existing curve variants in the spec: rrcurveto, and the four variants hhcurveto,
-	# vvcurveto, hvcurveto, and vhcurveto each cover two cases, one with an odd number of
-	# arguments and one without.  Eg. an hhcurveto with an extra argument (odd number of
-	# arguments) is in fact an rhcurveto.  The operators in the spec are designed such that
-	# all four of rhcurveto, rvcurveto, hrcurveto, and vrcurveto are encodable for one curve.
+	# 4. Peephole optimization to revert back some of the h/v variants back into their
+	#    original "relative" operator (rline/rrcurveto) if that saves a byte.
 	#
-	# Of the curve types with '0', the 00curveto is equivalent to a lineto variant.  The rest
-	# of the curve types with a 0 need to be encoded as a h or v variant.  Ie. a '0' can be
-	# thought of a "don't care" and can be used as either an 'h' or a 'v'.  As such, we always
-	# encode a number 0 as argument when we use a '0' variant.  Later on, we can just substitute
-	# the '0' with either 'h' or 'v' and it works.
+	# 5. Combine adjacent operators when possible, minding not to go over max stack size.
 	#
-	# When we get to curve splines however, things become more complicated...  XXX finish this.
-	# There's one more complexity with splines.  If one side of the spline is not horizontal or
-	# vertical (or zero), ie. if it's 'r', then it limits which spline types we can encode.
-	# Only hhcurveto and vvcurveto operators can encode a spline starting with 'r', and
-	# only hvcurveto and vhcurveto operators can encode a spline ending with 'r'.
-	# This limits our merge opportunities later.
+	# 6. Resolve any remaining made-up operators into real operators.
 	#
-	for i in range(len(commands)):
-		op,args = commands[i]
+	# Rounds 4 and 5 walk the commands from the end together, the peephole only
+	# looking at the (unmodified) neighbors of each command, and each command is
+	# resolved as it's done with.
+	result = []
+	last = len(commands) - 1
+	if last < 0:
+		return result
+	mergeOps = _mergeOps
+	madeUpOperators = _madeUpOperators
+	op2, args2 = commands[0]
+	for i in range(1, last + 1):
+		op1, args1 = commands[i]
+		if i != last:
+			prv, nxt = commands[i+1][0], commands[i-1][0]
+			if prv == nxt and (prv == 'rlineto' or prv == 'rrcurveto'):
+				op1, args1 = _revertToRelative(op1, args1, prv, nxt)
+		new_op = mergeOps(op1, op2, len(args2))
+		if new_op and len(args1) + len(args2) <= maxstack:
+			op2, args2 = new_op, args1+args2
+		else:
+			result.append(_resolveCommand(op2, args2)
+				      if op2 in madeUpOperators else (op2, args2))
+			op2, args2 = op1, args1
+	result.append(_resolveCommand(op2, args2)
+		      if op2 in madeUpOperators else (op2, args2))
+	result.reverse()
+	return result
 
-		if op in {'rmoveto', 'rlineto'}:
-			c, args = _categorizeVector(args)
-			commands[i] = c+op[1:], args
+def _specializeSegments(commands, preserveTopology):
+	"""Combines rmoveto operations, specializes the commands and merges or
+	deletes redundant ones (rounds 1 to 3 of specializeCommands()), in one
+	pass from the end.  Returns the resulting commands in reverse order."""
+	result = []
+	# Round 3 looks at the command before the one it works on, so it lags
+	# one command behind: this is the command it has yet to do.
+	pending = None
+	categorizeVector = _categorizeVector
+	i = len(commands) - 1
+	while i >= 0:
+		op, args = commands[i]
+		i -= 1
+
+		# 1. Combine successive rmoveto operations.
+		if op == 'rmoveto':
+			while i >= 0 and commands[i][0] == 'rmoveto':
+				v1 = commands[i][1]
+				args = [v1[0]+args[0], v1[1]+args[1]]
+				i -= 1
+
+		# 2. Specialize rmoveto/rlineto/rrcurveto operators into horizontal/vertical variants.
+		#
+		# We, in fact, specialize into more, made-up, variants that special-case when both
+		# X and Y components are zero.  This simplifies the following optimization passes.
+		# This case is rare, but OCD does not let me skip it.
+		#
+		# After this round, we will have four variants that use the following mnemonics:
+		#
+		#  - 'r' for relative,   ie. non-zero X and non-zero Y,
+		#  - 'h' for horizontal, ie. zero X and non-zero Y,
+		#  - 'v' for vertical,   ie. non-zero X and zero Y,
+		#  - '0' for zeros,      ie. zero X and zero Y.
+		#
+		# The '0' pseudo-operators are not part of the spec, but help simplify the following
+		# optimization rounds.  We resolve them at the end.  So, after this, we will have four
+		# moveto and four lineto variants:
+		#
+		#  - 0moveto, 0lineto
+		#  - hmoveto, hlineto
+		#  - vmoveto, vlineto
+		#  - rmoveto, rlineto
+		#
+		# and sixteen curveto variants.  For example, a '0hcurveto' operator means a curve
+		# dx0,dy0,dx1,dy1,dx2,dy2,dx3,dy3 where dx0, dx1, and dy3 are zero but not dx3.
+		# An 'rvcurveto' means dx3 is zero but not dx0,dy0,dy3.
+		#
+		# There are nine different variants of curves without the '0'.  Those nine map exactly
+		# to the existing curve variants in the spec: rrcurveto, and the four variants hhcurveto,
+		# vvcurveto, hvcurveto, and vhcurveto each cover two cases, one with an odd number of
+		# arguments and one without.  Eg. an hhcurveto with an extra argument (odd number of
+		# arguments) is in fact an rhcurveto.  The operators in the spec are designed such that
+		# all four of rhcurveto, rvcurveto, hrcurveto, and vrcurveto are encodable for one curve.
+		#
+		# Of the curve types with '0', the 00curveto is equivalent to a lineto variant.  The rest
+		# of the curve types with a 0 need to be encoded as a h or v variant.  Ie. a '0' can be
+		# thought of a "don't care" and can be used as either an 'h' or a 'v'.  As such, we always
+		# encode a number 0 as argument when we use a '0' variant.  Later on, we can just substitute
+		# the '0' with either 'h' or 'v' and it works.
+		#
+		# When we get to curve splines however, things become more complicated...  XXX finish this.
+		# There's one more complexity with splines.  If one side of the spline is not horizontal or
+		# vertical (or zero), ie. if it's 'r', then it limits which spline types we can encode.
+		# Only hhcurveto and vvcurveto operators can encode a spline starting with 'r', and
+		# only hvcurveto and vhcurveto operators can encode a spline ending with 'r'.
+		# This limits our merge opportunities later.
+		#
+		if op == 'rmoveto' or op == 'rlineto':
+			c, args = categorizeVector(args)
+			op = c+op[1:]
+		elif op == 'rrcurveto':
+			c1, args1 = categorizeVector(args[:2])
+			c2, args2 = categorizeVector(args[-2:])
+			op, args = c1+c2+'curveto', args1+args[2:4]+args2
+
+		if preserveTopology:
+			result.append((op, args))
 			continue
 
-		if op == 'rrcurveto':
-			c1, args1 = _categorizeVector(args[:2])
-			c2, args2 = _categorizeVector(args[-2:])
-			commands[i] = c1+c2+'curveto', args1+args[2:4]+args2
-			continue
+		# 3. Merge or delete redundant operations, to the extent requested.
+		if pending is not None:
+			pending_op, pending_args = pending
+			# Merge adjacent hlineto's and vlineto's.
+			if pending_op == op and op in {'hlineto', 'vlineto'}:
+				assert len(args) == 1 and len(pending_args) == 1
+				args = [args[0]+pending_args[0]]
+			elif pending_op != '0lineto':
+				result.append(pending)
+
+		# A 00curveto is demoted to a (specialized) lineto.
+		if op == '00curveto':
+			assert len(args) == 4
+			c, args = _categorizeVector(args[1:3])
+			op = c+'lineto'
+			# and then...
+
+		# A 0lineto can be deleted, once the command before it has been done.
+		pending = op, args
+
+	if pending is not None and pending[0] != '0lineto':
+		result.append(pending)
 
-	# 3. Merge or delete redundant operations, to the extent requested.
-	#
 	# TODO
 	# A 0moveto that comes before all other path operations can be removed.
 	# though I find conflicting evidence for this.
@@ -395,140 +474,221 @@ def specializeCommands(commands,
 	# For Type2 CharStrings the sequence is:
 	# w? {hs* vs* cm* hm* mt subpath}? {mt subpath}* endchar"
 
+	return result
 
-	# Some other redundancies change topology (point numbers).
-	if not preserveTopology:
-		for i in range(len(commands)-1, -1, -1):
-			op, args = commands[i]
-
-			# A 00curveto is demoted to a (specialized) lineto.
-			if op == '00curveto':
-				assert len(args) == 4
-				c, args = _categorizeVector(args[1:3])
-				op = c+'lineto'
-				commands[i] = op, args
-				# and then...
-
-			# A 0lineto can be deleted.
-			if op == '0lineto':
-				del commands[i]
-				continue
-
-			# Merge adjacent hlineto's and vlineto's.
-			if i and op in {'hlineto', 'vlineto'} and op == commands[i-1][0]:
-				_, other_args = commands[i-1]
-				assert len(args) == 1 and len(other_args) == 1
-				commands[i-1] = (op, [other_args[0]+args[0]])
-				del commands[i]
-				continue
-
-	# 4. Peephole optimization to revert back some of the h/v variants back into their
-	#    original "relative" operator (rline/rrcurveto) if that saves a byte.
-	for i in range(1, len(commands)-1):
-		op,args = commands[i]
-		prv,nxt = commands[i-1][0], commands[i+1][0]
-
-		if op in {'0lineto', 'hlineto', 'vlineto'} and prv == nxt == 'rlineto':
-			assert len(args) == 1
-			args = [0, args[0]] if op[0] == 'v' else [args[0], 0]
-			commands[i] = ('rlineto', args)
-			continue
-
-		if op[2:] == 'curveto' and len(args) == 5 and prv == nxt == 'rrcurveto':
-			assert (op[0] == 'r') ^ (op[1] == 'r')
-			args = list(args)
-			if op[0] == 'v':
-				pos = 0
-			elif op[0] != 'r':
-				pos = 1
-			elif op[1] == 'v':
-				pos = 4
-			else:
-				pos = 5
-			args.insert(pos, 0)
-			commands[i] = ('rrcurveto', args)
-			continue
-
-	# 5. Combine adjacent operators when possible, minding not to go over max stack size.
-	for i in range(len(commands)-1, 0, -1):
-		op1,args1 = commands[i-1]
-		op2,args2 = commands[i]
-		new_op = None
-
-		# Merge logic...
-		if {op1, op2} <= {'rlineto', 'rrcurveto'}:
-			if op1 == op2:
-				new_op = op1
-			else:
-				if op2 == 'rrcurveto' and len(args2) == 6:
-					new_op = 'rlinecurve'
-				elif len(args2) == 2:
-					new_op = 'rcurveline'
-
-		elif (op1, op2) in {('rlineto', 'rlinecurve'), ('rrcurveto', 'rcurveline')}:
-			new_op = op2
+def _revertToRelative(op, args, prv, nxt):
+	"""Peephole optimization of round 4 of specializeCommands() for the
+	command (op, args), between commands with operators prv and nxt."""
+	if op in {'0lineto', 'hlineto', 'vlineto'} and prv == nxt == 'rlineto':
+		assert len(args) == 1
+		args = [0, args[0]] if op[0] == 'v' else [args[0], 0]
+		return 'rlineto', args
+
+	if op[2:] == 'curveto' and len(args) == 5 and prv == nxt == 'rrcurveto':
+		return 'rrcurveto', _relativeCurveArgs(op, args)
+
+	return op, args
+
+def _relativeCurveArgs(op, args):
+	"""Returns the rrcurveto arguments of the one-curve made-up curveto
+	command (op, args) that has exactly one 'r' side."""
+	assert (op[0] == 'r') ^ (op[1] == 'r')
+	args = list(args)
+	if op[0] == 'v':
+		pos = 0
+	elif op[0] != 'r':
+		pos = 1
+	elif op[1] == 'v':
+		pos = 4
+	else:
+		pos = 5
+	args.insert(pos, 0)
+	return args
+
+_mergeOpsCache = {}
+
+def _mergeOps(op1, op2, numArgs2):
+	"""Returns the operator for the commands with operators op1 and op2
+	combined, numArgs2 being the number of arguments of the latter, or None
+	if they can't be combined."""
+	# Only whether numArgs2 is 2 or 6 matters.
+	key = op1, op2, min(numArgs2, 7)
+	try:
+		return _mergeOpsCache[key]
+	except KeyError:
+		new_op = _mergeOpsCache[key] = _mergeOpsUncached(op1, op2, numArgs2)
+		return new_op
+
+def _mergeOpsUncached(op1, op2, numArgs2):
+	# Merge logic...
+	if {op1, op2} <= {'rlineto', 'rrcurveto'}:
+		if op1 == op2:
+			return op1
+		if op2 == 'rrcurveto' and numArgs2 == 6:
+			return 'rlinecurve'
+		if numArgs2 == 2:
+			return 'rcurveline'
+		return None
+
+	if (op1, op2) in {('rlineto', 'rlinecurve'), ('rrcurveto', 'rcurveline')}:
+		return op2
+
+	if {op1, op2} == {'vlineto', 'hlineto'}:
+		return op1
+
+	if 'curveto' == op1[2:] == op2[2:]:
+		d0, d1 = op1[:2]
+		d2, d3 = op2[:2]
+
+		if d1 == 'r' or d2 == 'r' or d0 == d3 == 'r':
+			return None
+
+		d = _mergeCategories(d1, d2)
+		if d is None: return None
+		if d0 == 'r':
+			d = _mergeCategories(d, d3)
+			if d is None: return None
+			return 'r'+d+'curveto'
+		elif d3 == 'r':
+			d0 = _mergeCategories(d0, _negateCategory(d))
+			if d0 is None: return None
+			return d0+'r'+'curveto'
+		else:
+			d0 = _mergeCategories(d0, d3)
+			if d0 is None: return None
+			return d0+d+'curveto'
 
-		elif {op1, op2} == {'vlineto', 'hlineto'}:
-			new_op = op1
+	return None
 
-		elif 'curveto' == op1[2:] == op2[2:]:
-			d0, d1 = op1[:2]
-			d2, d3 = op2[:2]
+_madeUpOperators = frozenset(['0moveto', '0lineto'] +
+	[c1+c2+'curveto' for c1 in 'rhv0' for c2 in 'rhv0'
+	 if c1+c2 not in {'rr', 'hh', 'vv', 'vh', 'hv'}])
+
+def _resolveCommand(op, args):
+	"""Resolves the made-up operator of (op, args) into a real one, for
+	round 6 of specializeCommands()."""
+	if op in {'0moveto', '0lineto'}:
+		return 'h'+op[1:], args
+
+	if op[2:] == 'curveto' and op[:2] not in {'rr', 'hh', 'vv', 'vh', 'hv'}:
+		op0, op1 = op[:2]
+		if (op0 == 'r') ^ (op1 == 'r'):
+			assert len(args) % 2 == 1
+		if op0 == '0': op0 = 'h'
+		if op1 == '0': op1 = 'h'
+		if op0 == 'r': op0 = op1
+		if op1 == 'r': op1 = _negateCategory(op0)
+		assert {op0,op1} <= {'h','v'}, (op0, op1)
+
+		if len(args) % 2:
+			if op0 != op1: # vhcurveto / hvcurveto
+				if (op0 == 'h') ^ (len(args) % 8 == 1):
+					# Swap last two args order
+					args = args[:-2]+args[-1:]+args[-2:-1]
+			else: # hhcurveto / vvcurveto
+				if op0 == 'h': # hhcurveto
+					# Swap first two args order
+					args = args[1:2]+args[:1]+args[2:]
+
+		return op0+op1+'curveto', args
+
+	return op, args
+
+def _relativeCommand(op, args):
+	"""Returns the specialized one-segment line or curve (op, args) as
+	an rlineto or rrcurveto, or None if it's not a line or curve."""
+	if op[1:] == 'lineto':
+		if op == 'rlineto':
+			return op, args
+		return 'rlineto', [0, args[0]] if op[0] == 'v' else [args[0], 0]
+	if op[2:] == 'curveto':
+		if op == 'rrcurveto':
+			return op, args
+		c0, c1 = op[:2]
+		if c0 == 'r':
+			result = list(args[:2])
+			pos = 2
+		else:
+			result = [0, args[0]] if c0 == 'v' else [args[0], 0]
+			pos = 1
+		result.extend(args[pos:pos+2])
+		pos += 2
+		if c1 == 'r':
+			result.extend(args[pos:pos+2])
+		else:
+			result.extend([0, args[pos]] if c1 == 'v' else [args[pos], 0])
+		return 'rrcurveto', result
+	return None
 
-			if d1 == 'r' or d2 == 'r' or d0 == d3 == 'r':
+def _argumentsSize(args):
+	size = 0
+	for arg in args:
+		if isinstance(arg, bytes):
+			size += len(arg)  # hint mask
+		elif isinstance(arg, float):
+			size += 5
+		elif -107 <= arg <= 107:
+			size += 1
+		elif -1131 <= arg <= 1131:
+			size += 2
+		else:
+			size += 3
+	return size
+
+def _combineOptimal(commands, maxstack):
+	"""Combines the specialized commands into the shortest bytecode (rounds 4
+	to 6 of specializeCommands(), by dynamic programming instead of the
+	peephole optimization and greedy combining)."""
+	# Lines and curves can be written in their specialized form, or in the
+	# relative one.  Relative forms only ever combine with relative forms,
+	# and other specialized forms with specialized forms, so it is enough
+	# to look at runs of adjacent commands that are all written in one of
+	# the two forms.  best[j] is the size of the shortest encoding of the
+	# first j commands, and choice[j] its last run: (start, relative).
+	relative = [_relativeCommand(op, args) for op, args in commands]
+	count = len(commands)
+	best = [0] * (count + 1)
+	choice = [None] * (count + 1)
+	for end in range(count):
+		bestSize = None
+		# On ties, prefer longer runs, and specialized forms.
+		for forms in (relative, commands):
+			if forms[end] is None:
 				continue
+			op2, args2 = forms[end]
+			numArgs = len(args2)
+			size = _argumentsSize(args2) + 1
+			start = end
+			while True:
+				total = best[start] + size
+				if bestSize is None or total <= bestSize:
+					bestSize = total
+					choice[end + 1] = (start, forms is relative)
+				if not start or forms[start - 1] is None:
+					break
+				op1, args1 = forms[start - 1]
+				op2 = _mergeOps(op1, op2, numArgs)
+				numArgs += len(args1)
+				if not op2 or numArgs > maxstack:
+					break
+				size += _argumentsSize(args1)
+				start -= 1
+		best[end + 1] = bestSize
 
-			d = _mergeCategories(d1, d2)
-			if d is None: continue
-			if d0 == 'r':
-				d = _mergeCategories(d, d3)
-				if d is None: continue
-				new_op = 'r'+d+'curveto'
-			elif d3 == 'r':
-				d0 = _mergeCategories(d0, _negateCategory(d))
-				if d0 is None: continue
-				new_op = d0+'r'+'curveto'
-			else:
-				d0 = _mergeCategories(d0, d3)
-				if d0 is None: continue
-				new_op = d0+d+'curveto'
-
-		if new_op and len(args1) + len(args2) <= maxstack:
-			commands[i-1] = (new_op, args1+args2)
-			del commands[i]
-
-	# 6. Resolve any remaining made-up operators into real operators.
-	for i in range(len(commands)):
-		op,args = commands[i]
-
-		if op in {'0moveto', '0lineto'}:
-			commands[i] = 'h'+op[1:], args
-			continue
-
-		if op[2:] == 'curveto' and op[:2] not in {'rr', 'hh', 'vv', 'vh', 'hv'}:
-			op0, op1 = op[:2]
-			if (op0 == 'r') ^ (op1 == 'r'):
-				assert len(args) % 2 == 1
-			if op0 == '0': op0 = 'h'
-			if op1 == '0': op1 = 'h'
-			if op0 == 'r': op0 = op1
-			if op1 == 'r': op1 = _negateCategory(op0)
-			assert {op0,op1} <= {'h','v'}, (op0, op1)
-
-			if len(args) % 2:
-				if op0 != op1: # vhcurveto / hvcurveto
-					if (op0 == 'h') ^ (len(args) % 8 == 1):
-						# Swap last two args order
-						args = args[:-2]+args[-1:]+args[-2:-1]
-				else: # hhcurveto / vvcurveto
-					if op0 == 'h': # hhcurveto
-						# Swap first two args order
-						args = args[1:2]+args[:1]+args[2:]
-
-			commands[i] = op0+op1+'curveto', args
-			continue
-
-	return commands
+	result = []
+	end = count
+	while end:
+		start, isRelative = choice[end]
+		forms = relative if isRelative else commands
+		op, args = forms[end - 1]
+		for i in range(end - 2, start - 1, -1):
+			op1, args1 = forms[i]
+			op = _mergeOps(op1, op, len(args))
+			args = args1 + args
+		result.append(_resolveCommand(op, args))
+		end = start
+	result.reverse()
+	return result
 
 def specializeProgram(program, **kwargs):
 	return commandsToProgram(specializeCommands(programToCommands(program), **kwargs))
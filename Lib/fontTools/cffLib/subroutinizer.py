@@ -0,0 +1,533 @@
+# -*- coding: utf-8 -*-
+
+"""Subroutinizer for CFF and CFF2 CharStrings.
+
+The subroutinizer expands all existing subroutine calls, then repeatedly
+looks for command sequences that occur more than once across the
+CharStrings of a font (using a suffix array over the tokenized programs)
+and moves the profitable ones into local or global subroutines.
+
+Sequences shared only by glyphs (and subroutines) of one Private dict go
+into that dict's local Subrs; sequences shared across Private dicts (for
+example, by glyphs in different FDArray entries of a CID-keyed font) go
+into the GlobalSubrs.  Each pass can add at most one level of subroutine
+nesting, so running at most `maxNesting` passes keeps the output within
+the Type 2 subroutine nesting limit.
+"""
+
+from __future__ import print_function, division, absolute_import
+from fontTools.misc.py23 import *
+from fontTools.misc import psCharStrings
+from fontTools.cffLib import SubrsIndex
+from bisect import bisect_right
+import heapq
+import logging
+
+log = logging.getLogger(__name__)
+
+__all__ = ["subroutinize"]
+
+
+# Type 2 Charstring Format, Appendix B: subr nesting, stack limit.
+maxSubrNesting = 10
+
+maxSubrs = 65535
+
+# Estimated cost, in bytes, of a subroutine beyond its body: the 'return'
+# operator and its INDEX offset.
+_subrOverhead = 3
+
+
+def _expandProgram(program, localSubrs, globalSubrs, localBias, globalBias,
+		out):
+	"""Appends `program` to `out`, inlining subroutine calls.  Returns True
+	if an 'endchar' was reached."""
+	i = 0
+	end = len(program)
+	while i < end:
+		token = program[i]
+		i += 1
+		if not isinstance(token, basestring):
+			out.append(token)
+		elif token in ('hintmask', 'cntrmask'):
+			out.append(token)
+			out.append(program[i])
+			i += 1
+		elif token == 'callsubr':
+			subr = localSubrs[out.pop() + localBias]
+			if _expandProgram(subr.program, localSubrs, globalSubrs,
+					localBias, globalBias, out):
+				return True
+		elif token == 'callgsubr':
+			subr = globalSubrs[out.pop() + globalBias]
+			if _expandProgram(subr.program, localSubrs, globalSubrs,
+					localBias, globalBias, out):
+				return True
+		elif token == 'return':
+			return False
+		elif token == 'endchar':
+			out.append(token)
+			return True
+		else:
+			out.append(token)
+	return False
+
+
+def _expandCharString(charString, globalSubrs):
+	"""Returns the program of `charString` with all subroutines inlined."""
+	localSubrs = getattr(charString.private, "Subrs", [])
+	# Running the charstring decompiles it and every subroutine it calls
+	# with the right hint count, which hintmask parsing depends on.
+	decompiler = psCharStrings.SimpleT2Decompiler(localSubrs, globalSubrs,
+			charString.private)
+	decompiler.execute(charString)
+	program = []
+	_expandProgram(charString.program, localSubrs, globalSubrs,
+			psCharStrings.calcSubrBias(localSubrs),
+			psCharStrings.calcSubrBias(globalSubrs), program)
+	return program
+
+
+def _splitCommands(program):
+	"""Splits a program into commands: each command is a tuple of operands
+	followed by an operator (and, for hintmask and cntrmask, the mask)."""
+	commands = []
+	start = 0
+	i = 0
+	end = len(program)
+	while i < end:
+		token = program[i]
+		i += 1
+		if isinstance(token, basestring):
+			if token in ('hintmask', 'cntrmask'):
+				i += 1
+			commands.append(tuple(program[start:i]))
+			start = i
+	if start < end:
+		commands.append(tuple(program[start:]))
+	return commands
+
+
+# Operators that can take the width operand in a CFF (not CFF2) glyph,
+# mapped to the parity of their operand count when there is no width.
+_widthOperators = {
+	'hstem': 0, 'vstem': 0, 'hstemhm': 0, 'vstemhm': 0,
+	'hintmask': 0, 'cntrmask': 0,
+	'rmoveto': 0, 'hmoveto': 1, 'vmoveto': 1,
+	'endchar': 0,
+}
+
+
+def _splitWidth(commands):
+	"""Returns the width operand of the glyph `commands` as a command of
+	its own (or None if the glyph has no width), and the commands without
+	it."""
+	if not commands:
+		return None, commands
+	first = commands[0]
+	for numArgs, token in enumerate(first):
+		if isinstance(token, basestring):
+			break
+	else:
+		return None, commands
+	evenOdd = _widthOperators.get(token)
+	if evenOdd is None or not (numArgs % 2) ^ evenOdd:
+		return None, commands
+	return first[:1], [first[1:]] + commands[1:]
+
+
+def _commandLength(command, opcodes=psCharStrings.T2CharString.opcodes,
+		encodeInt=psCharStrings.encodeIntT2):
+	length = 0
+	i = 0
+	end = len(command)
+	while i < end:
+		token = command[i]
+		i += 1
+		if isinstance(token, basestring):
+			length += len(opcodes[token])
+			if token in ('hintmask', 'cntrmask'):
+				length += len(command[i])
+				i += 1
+		elif isinstance(token, float):
+			length += 5
+		else:
+			length += len(encodeInt(token))
+	return length
+
+
+def _numberLength(n):
+	"""Encoded length of the n-th cheapest biased subroutine number."""
+	if n < 215:
+		return 1
+	if n < 2263:
+		return 2
+	return 3
+
+
+def _suffixArray(seq):
+	"""Returns the suffix array of a list of non-negative ints, built by
+	prefix doubling."""
+	n = len(seq)
+	sa = sorted(range(n), key=seq.__getitem__)
+	rank = [0] * n
+	r = 0
+	for j in range(1, n):
+		if seq[sa[j]] != seq[sa[j - 1]]:
+			r += 1
+		rank[sa[j]] = r
+	k = 1
+	while r < n - 1:
+		m = n + 1
+		key = [rank[i] * m + (rank[i + k] + 1 if i + k < n else 0)
+		       for i in range(n)]
+		sa.sort(key=key.__getitem__)
+		r = 0
+		rank[sa[0]] = 0
+		for j in range(1, n):
+			if key[sa[j]] != key[sa[j - 1]]:
+				r += 1
+			rank[sa[j]] = r
+		k *= 2
+	return sa, rank
+
+
+def _lcpArray(seq, sa, rank):
+	"""Kasai's algorithm: lcp[i] is the length of the longest common prefix
+	of the suffixes sa[i-1] and sa[i]."""
+	n = len(seq)
+	lcp = [0] * n
+	h = 0
+	for i in range(n):
+		r = rank[i]
+		if r == 0:
+			h = 0
+			continue
+		j = sa[r - 1]
+		while i + h < n and j + h < n and seq[i + h] == seq[j + h]:
+			h += 1
+		lcp[r] = h
+		if h:
+			h -= 1
+	return lcp
+
+
+def _lcpIntervals(lcp):
+	"""Yields (length, lb, rb) for every LCP interval: the suffixes
+	sa[lb:rb+1] share a prefix of `length`."""
+	n = len(lcp)
+	stack = [(0, 0)]
+	for i in range(1, n + 1):
+		cur = lcp[i] if i < n else 0
+		lb = i - 1
+		while cur < stack[-1][0]:
+			length, lb = stack.pop()
+			yield length, lb, i - 1
+		if cur > stack[-1][0]:
+			stack.append((cur, lb))
+
+
+class _Subroutinizer(object):
+
+	def __init__(self):
+		self.commands = []	# command id -> command tuple; calls are (None, subr)
+		self.commandIds = {}
+		self.lengths = []	# command id -> encoded length
+		self.streams = []	# lists of command ids
+		self.contexts = []	# stream -> pool: Private index, or None for global
+		self.subrs = []		# subr -> (pool, stream)
+		self.poolSizes = {}
+
+	def commandId(self, command, shared=True):
+		cid = self.commandIds.get(command) if shared else None
+		if cid is None:
+			cid = len(self.commands)
+			self.commands.append(command)
+			self.lengths.append(_commandLength(command))
+			# CFF2 allows vsindex only once per charstring, ahead of any
+			# blend, so never move it into a shared subroutine.
+			if shared and 'vsindex' not in command:
+				self.commandIds[command] = cid
+		return cid
+
+	def callId(self, subr):
+		command = (None, subr)
+		cid = self.commandIds.get(command)
+		if cid is None:
+			cid = len(self.commands)
+			self.commands.append(command)
+			self.lengths.append(3)
+			self.commandIds[command] = cid
+		return cid
+
+	def addStream(self, program, context, hasWidth=False):
+		commands = _splitCommands(program)
+		stream = []
+		if hasWidth:
+			width, commands = _splitWidth(commands)
+			if width is not None:
+				# The width must stay the first operand of the glyph, where
+				# readers (and the CFF2 converter) look for it: give it a
+				# command id of its own, so it never repeats.
+				stream.append(self.commandId(width, shared=False))
+		stream.extend(self.commandId(c) for c in commands)
+		self.streams.append(stream)
+		self.contexts.append(context)
+
+	def isCall(self, cid):
+		return self.commands[cid][0] is None
+
+	def run(self, maxNesting):
+		for i in range(maxNesting):
+			if not self.subroutinizePass():
+				break
+			log.debug("subroutinizer pass %d: %d subroutines", i + 1,
+					len(self.subrs))
+		self.inlineSingleUse()
+
+	def subroutinizePass(self):
+		streams = self.streams
+		numCommands = len(self.commands)
+		seq = []
+		starts = []
+		for i, stream in enumerate(streams):
+			starts.append(len(seq))
+			seq.extend(stream)
+			seq.append(numCommands + i)	# unique separator
+		if not seq:
+			return False
+		lengths = self.lengths
+		prefix = [0]
+		total = 0
+		for cid in seq:
+			if cid < numCommands:
+				total += lengths[cid]
+			prefix.append(total)
+
+		sa, rank = _suffixArray(seq)
+		lcp = _lcpArray(seq, sa, rank)
+		del rank
+
+		commands = self.commands
+		used = bytearray(len(seq))
+		numSubrs = len(self.subrs)
+
+		def evaluate(length, lb, rb):
+			positions = sorted(sa[lb:rb + 1])
+			valid = []
+			last = -1
+			for p in positions:
+				if p >= last and used.find(b'\x01', p, p + length) == -1:
+					valid.append(p)
+					last = p + length
+			p = positions[0]
+			size = prefix[p + length] - prefix[p]
+			callCost = 1 + _numberLength(numSubrs)
+			overhead = _subrOverhead
+			if commands[seq[p + length - 1]][-1] == 'endchar':
+				overhead -= 1
+			return len(valid) * (size - callCost) - size - overhead, valid
+
+		heap = []
+		callCost = 1 + _numberLength(numSubrs)
+		for length, lb, rb in _lcpIntervals(lcp):
+			p = sa[lb]
+			size = prefix[p + length] - prefix[p]
+			savings = (rb - lb + 1) * (size - callCost) - size - _subrOverhead
+			if savings > 0:
+				heap.append((-savings, lb, length, rb))
+		heapq.heapify(heap)
+
+		replacements = {}
+		accepted = 0
+		while heap:
+			negSavings, lb, length, rb = heapq.heappop(heap)
+			savings, valid = evaluate(length, lb, rb)
+			if savings <= 0:
+				continue
+			if heap and savings < -heap[0][0]:
+				heapq.heappush(heap, (-savings, lb, length, rb))
+				continue
+
+			body = seq[valid[0]:valid[0] + length]
+			pools = set(self.contexts[bisect_right(starts, p) - 1] for p in valid)
+			pool = pools.pop() if len(pools) == 1 else None
+			if self.poolSizes.get(pool, 0) >= maxSubrs:
+				# Local subrs are full; fall back to a global subr unless
+				# the body calls local subrs.
+				if pool is None or self.poolSizes.get(None, 0) >= maxSubrs:
+					continue
+				if any(self.isCall(cid) and self.subrs[commands[cid][1]][0] is not None
+				       for cid in body):
+					continue
+				pool = None
+
+			subr = len(self.subrs)
+			self.subrs.append((pool, len(streams)))
+			self.poolSizes[pool] = self.poolSizes.get(pool, 0) + 1
+			numSubrs += 1
+			streams.append(body)
+			self.contexts.append(pool)
+			callId = self.callId(subr)
+			for p in valid:
+				used[p:p + length] = b'\x01' * length
+				replacements[p] = (length, callId)
+			accepted += 1
+
+		if not accepted:
+			return False
+
+		# Rewrite the streams that existed at the start of the pass; the
+		# bodies of the new subroutines are already final for this pass.
+		for i in range(len(starts)):
+			stream = streams[i]
+			start = starts[i]
+			out = []
+			j = 0
+			end = len(stream)
+			while j < end:
+				repl = replacements.get(start + j)
+				if repl is None:
+					out.append(stream[j])
+					j += 1
+				else:
+					out.append(repl[1])
+					j += repl[0]
+			streams[i] = out
+		return True
+
+	def callCounts(self):
+		counts = [0] * len(self.subrs)
+		commands = self.commands
+		for stream in self.streams:
+			if stream is None:
+				continue
+			for cid in stream:
+				command = commands[cid]
+				if command[0] is None:
+					counts[command[1]] += 1
+		return counts
+
+	def inlineSingleUse(self):
+		"""Inlines subroutines that ended up called only once, because a
+		later pass moved their other call sites into a new subroutine."""
+		streams = self.streams
+		commands = self.commands
+		counts = self.callCounts()
+		callers = {}
+		for i, stream in enumerate(streams):
+			for cid in stream:
+				command = commands[cid]
+				if command[0] is None and counts[command[1]] == 1:
+					callers[command[1]] = i
+		for subr, (pool, stream) in enumerate(self.subrs):
+			if counts[subr] > 1:
+				continue
+			if counts[subr] == 1:
+				body = streams[stream]
+				caller = streams[callers[subr]]
+				k = caller.index(self.callId(subr))
+				caller[k:k + 1] = body
+				for cid in body:
+					command = commands[cid]
+					if command[0] is None and counts[command[1]] == 1:
+						callers[command[1]] = callers[subr]
+			streams[stream] = None
+
+	def assignNumbers(self):
+		"""Returns subr -> (pool, index) with the most used subroutines in
+		each pool getting the cheapest biased numbers, and pool -> ordered
+		list of subrs."""
+		counts = self.callCounts()
+		byPool = {}
+		for subr, (pool, stream) in enumerate(self.subrs):
+			if self.streams[stream] is not None:
+				byPool.setdefault(pool, []).append(subr)
+		numbers = {}
+		ordered = {}
+		for pool, subrs in byPool.items():
+			subrs.sort(key=lambda s: -counts[s])
+			n = len(subrs)
+			bias = psCharStrings.calcSubrBias(subrs)
+			slots = sorted(range(n), key=lambda i: (abs(i - bias), i))
+			items = [None] * n
+			for subr, slot in zip(subrs, slots):
+				items[slot] = subr
+				numbers[subr] = slot - bias
+			ordered[pool] = items
+		return numbers, ordered
+
+	def program(self, stream, numbers):
+		program = []
+		commands = self.commands
+		for cid in self.streams[stream]:
+			command = commands[cid]
+			if command[0] is None:
+				subr = command[1]
+				program.append(numbers[subr])
+				if self.subrs[subr][0] is None:
+					program.append('callgsubr')
+				else:
+					program.append('callsubr')
+			else:
+				program.extend(command)
+		return program
+
+
+def subroutinize(cff, maxNesting=maxSubrNesting):
+	"""Rewrites the CharStrings of all fonts in the CFFFontSet `cff`
+	to share repeated command sequences through subroutines.  Existing
+	local and global subroutines are expanded and replaced."""
+	isCFF2 = cff.major == 2
+	globalSubrs = cff.GlobalSubrs
+	maxNesting = min(maxNesting, maxSubrNesting)
+
+	privates = []
+	privateIndices = {}
+	for fontName in cff.keys():
+		topDict = cff[fontName]
+		if hasattr(topDict, "FDArray"):
+			fdPrivates = [fd.Private for fd in topDict.FDArray]
+		else:
+			fdPrivates = [topDict.Private]
+		for private in fdPrivates:
+			if id(private) not in privateIndices:
+				privateIndices[id(private)] = len(privates)
+				privates.append(private)
+
+	subroutinizer = _Subroutinizer()
+	charStrings = []
+	for fontName in cff.keys():
+		topDict = cff[fontName]
+		for charString in topDict.CharStrings.values():
+			program = _expandCharString(charString, globalSubrs)
+			subroutinizer.addStream(program,
+					privateIndices[id(charString.private)], not isCFF2)
+			charStrings.append(charString)
+
+	subroutinizer.run(maxNesting)
+	numbers, ordered = subroutinizer.assignNumbers()
+
+	for i, charString in enumerate(charStrings):
+		charString.setProgram(subroutinizer.program(i, numbers))
+
+	def buildSubrs(index, pool, private):
+		index.items = []
+		for subr in ordered.get(pool, []):
+			program = subroutinizer.program(subroutinizer.subrs[subr][1], numbers)
+			if not isCFF2 and program[-1] != 'endchar':
+				program.append('return')
+			index.append(psCharStrings.T2CharString(program=program,
+					private=private, globalSubrs=globalSubrs))
+		for attr in ("file", "offsets"):
+			if hasattr(index, attr):
+				delattr(index, attr)
+
+	buildSubrs(globalSubrs, None, None)
+	for pool, private in enumerate(privates):
+		if pool in ordered:
+			private.Subrs = SubrsIndex()
+			buildSubrs(private.Subrs, pool, private)
+		elif hasattr(private, "Subrs"):
+			del private.Subrs
+			private.rawDict.pop("Subrs", None)
@@ -5,8 +5,10 @@ CFF dictionary data and Type1/Type2 CharStrings.
 from __future__ import print_function, division, absolute_import
 from fontTools.misc.py23 import *
 from fontTools.misc.fixedTools import fixedToFloat
+from fontTools.misc.bezierTools import calcCubicBounds
 from fontTools.pens.boundsPen import BoundsPen
 import struct
+import array
 import logging
 
 
@@ -167,6 +169,76 @@ t2Operators = [
 	((12, 37),	'flex1'),
 ]
 
+# Operators are encoded as their byte value; two-byte (escaped) operators
+# as (12 << 8) | b1, so that a whole charstring can be decoded into arrays.
+t2OperatorNames = {}
+for _op, _name in t2Operators:
+	if isinstance(_op, tuple):
+		_op = (_op[0] << 8) | _op[1]
+	t2OperatorNames[_op] = _name
+del _op, _name
+
+_t2MaskOperators = frozenset([19, 20])
+
+
+def decodeT2(data, index=0):
+	"""Decode Type 2 charstring bytes from 'data' (a bytearray) at 'index'.
+
+	Returns (operands, opcodes, argEnds, opEnds, index).  'opcodes' holds
+	the encoded operators (see t2OperatorNames); the operands pushed before
+	opcodes[i] are operands[:argEnds[i]], and opEnds[i] is the byte offset
+	just past that operator.  Any trailing operands follow argEnds[-1].
+
+	Decoding stops after a hintmask or cntrmask operator, since the length
+	of the mask depends on the hint count, which only the caller knows; the
+	returned index is where decoding should resume.  It is None if an
+	unknown operator was met, in which case the charstring is considered
+	to end there.
+	"""
+	operands = []
+	push = operands.append
+	opcodes = array.array("H")
+	argEnds = array.array("L")
+	opEnds = array.array("L")
+	end = len(data)
+	while index < end:
+		b0 = data[index]
+		if b0 >= 32:
+			if b0 <= 246:
+				push(b0 - 139)
+				index += 1
+			elif b0 <= 250:
+				push((b0 - 247) * 256 + data[index+1] + 108)
+				index += 2
+			elif b0 <= 254:
+				push(-(b0 - 251) * 256 - data[index+1] - 108)
+				index += 2
+			else:
+				value, = struct.unpack(">l", bytes(data[index+1:index+5]))
+				push(fixedToFloat(value, precisionBits=16))
+				index += 5
+		elif b0 == 28:
+			value = (data[index+1] << 8) | data[index+2]
+			if value >= 0x8000:
+				value -= 0x10000
+			push(value)
+			index += 3
+		else:
+			if b0 == 12:
+				op = (12 << 8) | data[index+1]
+				index += 2
+			else:
+				op = b0
+				index += 1
+			if op not in t2OperatorNames:
+				return operands, opcodes, argEnds, opEnds, None
+			opcodes.append(op)
+			argEnds.append(len(operands))
+			opEnds.append(index)
+			if op in _t2MaskOperators:
+				break
+	return operands, opcodes, argEnds, opEnds, index
+
 def getIntEncoder(format):
 	if format == "cff":
 		fourByteOp = bytechr(29)
@@ -279,8 +351,33 @@ class SimpleT2Decompiler(object):
 			assert program[-1] in ("endchar", "return", "callsubr", "callgsubr",
 					"seac"), "illegal CharString"
 
+	@classmethod
+	def getOperatorHandlers(cls):
+		"""Return a dict mapping operator names to the class's op_ methods
+		(or None), filled in as operators are met."""
+		handlers = cls.__dict__.get("_operatorHandlers")
+		if handlers is None:
+			handlers = {}
+			cls._operatorHandlers = handlers
+		return handlers
+
+	def getOperatorHandler(self, handlers, name):
+		try:
+			return handlers[name]
+		except KeyError:
+			handler = getattr(self.__class__, "op_" + name, None)
+			handlers[name] = handler
+			return handler
+
 	def execute(self, charString):
 		self.callingStack.append(charString)
+		if (charString.bytecode is not None and
+				charString.operandEncoding is t2OperandEncoding):
+			program = self.executeBytecode(charString)
+			self.check_program(program)
+			charString.setDecompiledProgram(program)
+			del self.callingStack[-1]
+			return
 		needsDecompilation = charString.needsDecompilation()
 		if needsDecompilation:
 			program = []
@@ -288,6 +385,7 @@ class SimpleT2Decompiler(object):
 		else:
 			pushToProgram = lambda x: None
 		pushToStack = self.operandStack.append
+		handlers = self.getOperatorHandlers()
 		index = 0
 		while True:
 			token, isOperator, index = charString.getToken(index)
@@ -295,10 +393,9 @@ class SimpleT2Decompiler(object):
 				break  # we're done!
 			pushToProgram(token)
 			if isOperator:
-				handlerName = "op_" + token
-				handler = getattr(self, handlerName, None)
+				handler = self.getOperatorHandler(handlers, token)
 				if handler is not None:
-					rv = handler(index)
+					rv = handler(self, index)
 					if rv:
 						hintMaskBytes, index = rv
 						pushToProgram(hintMaskBytes)
@@ -308,9 +405,44 @@ class SimpleT2Decompiler(object):
 				pushToStack(token)
 		if needsDecompilation:
 			self.check_program(program)
-			charString.setProgram(program)
+			charString.setDecompiledProgram(program)
 		del self.callingStack[-1]
 
+	def executeBytecode(self, charString):
+		"""Run the Type 2 bytecode of charString, decoding it with decodeT2
+		rather than token by token.  Returns the decompiled program."""
+		data = bytearray(charString.bytecode)
+		end = len(data)
+		handlers = self.getOperatorHandlers()
+		program = []
+		index = 0
+		while index is not None and index < end:
+			operands, opcodes, argEnds, opEnds, index = decodeT2(data, index)
+			start = 0
+			for i in range(len(opcodes)):
+				argEnd = argEnds[i]
+				if argEnd > start:
+					args = operands[start:argEnd]
+					program.extend(args)
+					self.operandStack.extend(args)
+					start = argEnd
+				name = t2OperatorNames[opcodes[i]]
+				program.append(name)
+				handler = self.getOperatorHandler(handlers, name)
+				if handler is not None:
+					rv = handler(self, opEnds[i])
+					if rv:
+						hintMaskBytes, index = rv
+						program.append(hintMaskBytes)
+						break
+				else:
+					self.popall()
+			else:
+				args = operands[start:]
+				program.extend(args)
+				self.operandStack.extend(args)
+		return program
+
 	def pop(self):
 		value = self.operandStack[-1]
 		del self.operandStack[-1]
@@ -427,6 +559,142 @@ class SimpleT2Decompiler(object):
 		self.numRegions = self.private.getNumRegions(vi)
 
 
+class T2Tokenizer(object):
+
+	"""Decode Type 2 charstrings into flat parallel arrays.
+
+	After execute(charString), 'opcodes' holds the operators (encoded as in
+	t2OperatorNames), 'operands' all the operands, with those pushed
+	before opcodes[i] being operands[:argEnds[i]], and 'hintMasks' the
+	mask bytes of each hintmask and cntrmask operator, in order.
+
+	Subroutines are always followed, since the hint count they contribute
+	decides the length of later masks.  If inlineSubrs is true their
+	bodies replace the calls (without the subroutine index operand, the
+	call and the return), so the result is self-contained; otherwise only
+	the top-level charstring is recorded.  Arithmetic operators are not
+	evaluated.
+	"""
+
+	def __init__(self, localSubrs, globalSubrs, private=None, inlineSubrs=False):
+		self.localSubrs = localSubrs
+		self.localBias = calcSubrBias(localSubrs)
+		self.globalSubrs = globalSubrs
+		self.globalBias = calcSubrBias(globalSubrs)
+		self.private = private
+		self.inlineSubrs = inlineSubrs
+		self.operands = []
+		self.opcodes = array.array("H")
+		self.argEnds = array.array("L")
+		self.hintMasks = []
+		self.stack = []
+		self.depth = 0
+		self.hintCount = 0
+		self.hintMaskBytes = 0
+		self.numRegions = 0
+
+	def execute(self, charString):
+		self.depth += 1
+		if charString.bytecode is not None:
+			self._executeBytecode(charString.bytecode)
+		else:
+			self._executeProgram(charString.program)
+		self.depth -= 1
+
+	def _executeBytecode(self, bytecode):
+		data = bytearray(bytecode)
+		end = len(data)
+		index = 0
+		while index is not None and index < end:
+			operands, opcodes, argEnds, _, index = decodeT2(data, index)
+			start = 0
+			for i in range(len(opcodes)):
+				argEnd = argEnds[i]
+				nBytes = self._operator(operands[start:argEnd], opcodes[i])
+				start = argEnd
+				if nBytes:
+					self._hintMask(bytecode[index:index+nBytes])
+					index += nBytes
+			self._push(operands[start:])
+
+	def _executeProgram(self, program):
+		opcodes = T2CharString.opcodes
+		args = []
+		i = 0
+		end = len(program)
+		while i < end:
+			token = program[i]
+			i += 1
+			if not isinstance(token, basestring):
+				args.append(token)
+				continue
+			op = opcodes[token]
+			op = op[0] if len(op) == 1 else (op[0] << 8) | op[1]
+			if self._operator(args, op):
+				self._hintMask(program[i])
+				i += 1
+			args = []
+		self._push(args)
+
+	def _emitting(self):
+		return self.inlineSubrs or self.depth == 1
+
+	def _push(self, args):
+		self.stack.extend(args)
+		if self._emitting():
+			self.operands.extend(args)
+
+	def _record(self, op):
+		if self._emitting():
+			self.opcodes.append(op)
+			self.argEnds.append(len(self.operands))
+
+	def _hintMask(self, mask):
+		if self._emitting():
+			self.hintMasks.append(mask)
+
+	def _operator(self, args, op):
+		"""Run one operator; return the length of the mask that follows
+		it, if any."""
+		self._push(args)
+		stack = self.stack
+		if op == 10 or op == 29:  # callsubr, callgsubr
+			subrIndex = stack.pop()
+			if self.inlineSubrs:
+				self.operands.pop()
+			else:
+				self._record(op)
+			if op == 10:
+				subr = self.localSubrs[subrIndex + self.localBias]
+			else:
+				subr = self.globalSubrs[subrIndex + self.globalBias]
+			self.execute(subr)
+			return 0
+		if op == 11 and self.inlineSubrs and self.depth > 1:  # return
+			return 0
+		self._record(op)
+		if op in (1, 3, 18, 23):  # hstem, vstem, hstemhm, vstemhm
+			self.hintCount += len(stack) // 2
+			del stack[:]
+		elif op in _t2MaskOperators:
+			if not self.hintMaskBytes:
+				self.hintCount += len(stack) // 2
+				del stack[:]
+				self.hintMaskBytes = (self.hintCount + 7) // 8
+			return self.hintMaskBytes
+		elif op == 16:  # blend
+			if self.numRegions == 0:
+				self.numRegions = self.private.getNumRegions()
+			numBlends = stack.pop()
+			numOps = numBlends * (self.numRegions + 1)
+			del stack[:-(numOps-numBlends)]
+		elif op == 15:  # vsindex
+			self.numRegions = self.private.getNumRegions(stack.pop())
+		else:
+			del stack[:]
+		return 0
+
+
 t1Operators = [
 #	opcode		name
 	(1,		'hstem'),
@@ -795,6 +1063,210 @@ class T2OutlineExtractor(T2WidthExtractor):
 		self.rCurveTo((dxa, 0), (dxb, dyb), (dxc, dyc))
 		return args
 
+def _t2VCurve(args, curves):
+	dya, dxb, dyb, dxc = args[:4]
+	args = args[4:]
+	if len(args) == 1:
+		dyc = args[0]
+		args = []
+	else:
+		dyc = 0
+	curves.append((2, 0, dya, dxb, dyb, dxc, dyc))
+	return args
+
+def _t2HCurve(args, curves):
+	dxa, dxb, dyb, dyc = args[:4]
+	args = args[4:]
+	if len(args) == 1:
+		dxc = args[0]
+		args = []
+	else:
+		dxc = 0
+	curves.append((2, dxa, 0, dxb, dyb, dxc, dyc))
+	return args
+
+def _t2RelativePath(operands, opcodes, argEnds):
+	"""Return the path of a flat, subroutine-free charstring as a list of
+	relative segments, the way T2OutlineExtractor draws it: (0, dx, dy)
+	for a moveto, (1, dx, dy) for a lineto, (2, dx1, dy1, dx2, dy2, dx3,
+	dy3) for a curveto and (3,) where the current path is ended.  Returns
+	None if the charstring uses other operators (seac-like endchar,
+	blend, arithmetic)."""
+	path = []
+	append = path.append
+	gotWidth = False
+	hintCount = 0
+	hintMaskBytes = 0
+	stackStart = 0
+	for i in range(len(opcodes)):
+		op = opcodes[i]
+		argEnd = argEnds[i]
+		args = operands[stackStart:argEnd]
+		if op in (11, 3072):  # return, ignore
+			continue
+		if op in _t2MaskOperators and hintMaskBytes:
+			continue
+		stackStart = argEnd
+		if not gotWidth and op in (1, 3, 4, 14, 18, 19, 20, 21, 22, 23):
+			evenOdd = 1 if op in (4, 22) else 0
+			if evenOdd ^ (len(args) % 2):
+				args = args[1:]
+			gotWidth = True
+		if op == 8:  # rrcurveto
+			for j in range(0, len(args), 6):
+				dxa, dya, dxb, dyb, dxc, dyc = args[j:j+6]
+				append((2, dxa, dya, dxb, dyb, dxc, dyc))
+		elif op == 5:  # rlineto
+			for j in range(0, len(args), 2):
+				append((1, args[j], args[j+1]))
+		elif op == 6 or op == 7:  # hlineto, vlineto
+			isHorizontal = op == 6
+			for arg in args:
+				append((1, arg, 0) if isHorizontal else (1, 0, arg))
+				isHorizontal = not isHorizontal
+		elif op == 30:  # vhcurveto
+			while args:
+				args = _t2VCurve(args, path)
+				if args:
+					args = _t2HCurve(args, path)
+		elif op == 31:  # hvcurveto
+			while args:
+				args = _t2HCurve(args, path)
+				if args:
+					args = _t2VCurve(args, path)
+		elif op == 21:  # rmoveto
+			append((3,))
+			append((0, args[0], args[1]))
+		elif op == 22:  # hmoveto
+			append((3,))
+			append((0, args[0], 0))
+		elif op == 4:  # vmoveto
+			append((3,))
+			append((0, 0, args[0]))
+		elif op in (1, 3, 18, 23):  # stems
+			hintCount += len(args) // 2
+		elif op in _t2MaskOperators:
+			hintCount += len(args) // 2
+			hintMaskBytes = (hintCount + 7) // 8
+		elif op == 14:  # endchar
+			append((3,))
+			if args:
+				return None
+		elif op == 24:  # rcurveline
+			for j in range(0, len(args)-2, 6):
+				dxb, dyb, dxc, dyc, dxd, dyd = args[j:j+6]
+				append((2, dxb, dyb, dxc, dyc, dxd, dyd))
+			append((1, args[-2], args[-1]))
+		elif op == 25:  # rlinecurve
+			lineArgs = args[:-6]
+			for j in range(0, len(lineArgs), 2):
+				append((1, lineArgs[j], lineArgs[j+1]))
+			dxb, dyb, dxc, dyc, dxd, dyd = args[-6:]
+			append((2, dxb, dyb, dxc, dyc, dxd, dyd))
+		elif op == 26:  # vvcurveto
+			if len(args) % 2:
+				dx1 = args[0]
+				args = args[1:]
+			else:
+				dx1 = 0
+			for j in range(0, len(args), 4):
+				dya, dxb, dyb, dyc = args[j:j+4]
+				append((2, dx1, dya, dxb, dyb, 0, dyc))
+				dx1 = 0
+		elif op == 27:  # hhcurveto
+			if len(args) % 2:
+				dy1 = args[0]
+				args = args[1:]
+			else:
+				dy1 = 0
+			for j in range(0, len(args), 4):
+				dxa, dxb, dyb, dxc = args[j:j+4]
+				append((2, dxa, dy1, dxb, dyb, dxc, 0))
+				dy1 = 0
+		elif op == 3106:  # hflex
+			dx1, dx2, dy2, dx3, dx4, dx5, dx6 = args
+			dy1 = dy3 = dy4 = dy6 = 0
+			dy5 = -dy2
+			append((2, dx1, dy1, dx2, dy2, dx3, dy3))
+			append((2, dx4, dy4, dx5, dy5, dx6, dy6))
+		elif op == 3107:  # flex
+			dx1, dy1, dx2, dy2, dx3, dy3, dx4, dy4, dx5, dy5, dx6, dy6, fd = args
+			append((2, dx1, dy1, dx2, dy2, dx3, dy3))
+			append((2, dx4, dy4, dx5, dy5, dx6, dy6))
+		elif op == 3108:  # hflex1
+			dx1, dy1, dx2, dy2, dx3, dx4, dx5, dy5, dx6 = args
+			dy3 = dy4 = 0
+			dy6 = -(dy1 + dy2 + dy3 + dy4 + dy5)
+			append((2, dx1, dy1, dx2, dy2, dx3, dy3))
+			append((2, dx4, dy4, dx5, dy5, dx6, dy6))
+		elif op == 3109:  # flex1
+			dx1, dy1, dx2, dy2, dx3, dy3, dx4, dy4, dx5, dy5, d6 = args
+			dx = dx1 + dx2 + dx3 + dx4 + dx5
+			dy = dy1 + dy2 + dy3 + dy4 + dy5
+			if abs(dx) > abs(dy):
+				dx6 = d6
+				dy6 = -dy
+			else:
+				dx6 = -dx
+				dy6 = d6
+			append((2, dx1, dy1, dx2, dy2, dx3, dy3))
+			append((2, dx4, dy4, dx5, dy5, dx6, dy6))
+		else:
+			return None
+	return path
+
+def calcT2Bounds(operands, opcodes, argEnds):
+	"""Return the bounds of a charstring in the flat form returned by
+	T2CharString.tokenize(inlineSubrs=True), exactly as drawing it into a
+	BoundsPen would: curves whose control points lie within the bounds
+	so far can't extend them, so only the others have their extrema
+	solved.  Returns NotImplemented for charstrings that need the full
+	outline extractor."""
+	path = _t2RelativePath(operands, opcodes, argEnds)
+	if path is None:
+		return NotImplemented
+	x = y = 0
+	sawMoveTo = False
+	bounds = None
+	for segment in path:
+		kind = segment[0]
+		if kind == 3:
+			sawMoveTo = False
+			continue
+		if kind == 0 or not sawMoveTo:
+			# A moveto, or the implicit "0 0 rmoveto" before a drawing
+			# operator that has none.
+			if kind == 0:
+				x, y = x + segment[1], y + segment[2]
+			if bounds is None:
+				bounds = (x, y, x, y)
+			else:
+				xMin, yMin, xMax, yMax = bounds
+				bounds = (min(xMin, x), min(yMin, y), max(xMax, x), max(yMax, y))
+			sawMoveTo = True
+			if kind == 0:
+				continue
+		xMin, yMin, xMax, yMax = bounds
+		if kind == 1:
+			x, y = x + segment[1], y + segment[2]
+			bounds = (min(xMin, x), min(yMin, y), max(xMax, x), max(yMax, y))
+			continue
+		x0, y0 = x, y
+		x1, y1 = x + segment[1], y + segment[2]
+		x2, y2 = x1 + segment[3], y1 + segment[4]
+		x, y = x2 + segment[5], y2 + segment[6]
+		xMin, yMin, xMax, yMax = (min(xMin, x), min(yMin, y),
+				max(xMax, x), max(yMax, y))
+		if not (xMin <= x1 <= xMax and yMin <= y1 <= yMax and
+				xMin <= x2 <= xMax and yMin <= y2 <= yMax):
+			cxMin, cyMin, cxMax, cyMax = calcCubicBounds(
+				(x0, y0), (x1, y1), (x2, y2), (x, y))
+			xMin, yMin, xMax, yMax = (min(xMin, cxMin), min(yMin, cyMin),
+					max(xMax, cxMax), max(yMax, cyMax))
+		bounds = (xMin, yMin, xMax, yMax)
+	return bounds
+
+
 class T1OutlineExtractor(T2OutlineExtractor):
 
 	def __init__(self, pen, subrs):
@@ -937,6 +1409,36 @@ class T1OutlineExtractor(T2OutlineExtractor):
 	def op_vstem3(self, index):
 		self.popall()  # XXX
 
+class _DecompiledProgram(list):
+
+	"""The program of a decompiled charstring, holding the bytecode it was
+	decoded from until the program is modified."""
+
+	__slots__ = ('bytecode',)
+
+	def __init__(self, program, bytecode):
+		list.__init__(self, program)
+		self.bytecode = bytecode
+
+	def __reduce__(self):
+		return list, (list(self),)
+
+def _dropsBytecode(name):
+	method = getattr(list, name)
+	def wrapper(self, *args, **kwargs):
+		self.bytecode = None
+		return method(self, *args, **kwargs)
+	wrapper.__name__ = name
+	return wrapper
+
+for _name in ('__setitem__', '__delitem__', '__setslice__', '__delslice__',
+		'__iadd__', '__imul__', 'append', 'extend', 'insert', 'pop',
+		'remove', 'reverse', 'sort', 'clear'):
+	if hasattr(list, _name):
+		setattr(_DecompiledProgram, _name, _dropsBytecode(_name))
+del _name
+
+
 class T2CharString(object):
 
 	operandEncoding = t2OperandEncoding
@@ -978,7 +1480,23 @@ class T2CharString(object):
 		extractor.execute(self)
 		self.width = extractor.width
 
+	def tokenize(self, inlineSubrs=False):
+		"""Return the charstring as flat (operands, opcodes, argEnds,
+		hintMasks) arrays; see T2Tokenizer."""
+		subrs = getattr(self.private, "Subrs", [])
+		tokenizer = T2Tokenizer(subrs, self.globalSubrs, self.private,
+				inlineSubrs=inlineSubrs)
+		tokenizer.execute(self)
+		return (tokenizer.operands, tokenizer.opcodes, tokenizer.argEnds,
+				tokenizer.hintMasks)
+
 	def calcBounds(self):
+		if (self.outlineExtractor is T2OutlineExtractor and
+				self.operandEncoding is t2OperandEncoding):
+			operands, opcodes, argEnds, _ = self.tokenize(inlineSubrs=True)
+			bounds = calcT2Bounds(operands, opcodes, argEnds)
+			if bounds is not NotImplemented:
+				return bounds
 		boundsPen = BoundsPen(None)
 		self.draw(boundsPen)
 		return boundsPen.bounds
@@ -994,6 +1512,19 @@ class T2CharString(object):
 	def compile(self, isCFF2=False):
 		if self.bytecode is not None:
 			return
+		bytecode = getattr(self.program, 'bytecode', None)
+		if bytecode is not None:
+			# Unchanged since it was decompiled; reuse the original bytecode.
+			self.setBytecode(bytecode)
+		else:
+			self.setBytecode(self.encodeProgram(isCFF2))
+
+		if isCFF2:
+			# If present, remove return and endchar operators.
+			if self.bytecode and (byteord(self.bytecode[-1]) in (11, 14)):
+				self.bytecode = self.bytecode[:-1]
+
+	def encodeProgram(self, isCFF2=False):
 		opcodes = self.opcodes
 		program = self.program
 		self.check_program(program, isCFF2=isCFF2)
@@ -1021,16 +1552,10 @@ class T2CharString(object):
 			else:
 				assert 0, "unsupported type: %s" % tp
 		try:
-			bytecode = bytesjoin(bytecode)
+			return bytesjoin(bytecode)
 		except TypeError:
 			log.error(bytecode)
 			raise
-		self.setBytecode(bytecode)
-
-		if isCFF2:
-			# If present, remove return and endchar operators.
-			if self.bytecode and (byteord(self.bytecode[-1]) in (11, 14)):
-				self.bytecode = self.bytecode[:-1]
 
 	def needsDecompilation(self):
 		return self.bytecode is not None
@@ -1039,6 +1564,13 @@ class T2CharString(object):
 		self.program = program
 		self.bytecode = None
 
+	def setDecompiledProgram(self, program):
+		"""Like setProgram, but the program keeps the bytecode it was
+		decoded from, so that compile() can reuse it.  The program drops
+		the bytecode as soon as it is modified in place."""
+		self.program = _DecompiledProgram(program, self.bytecode)
+		self.bytecode = None
+
 	def setBytecode(self, bytecode):
 		self.bytecode = bytecode
 		self.program = None
@@ -1166,7 +1698,7 @@ class T1CharString(T2CharString):
 			if token is None:
 				break
 			program.append(token)
-		self.setProgram(program)
+		self.setDecompiledProgram(program)
 
 	def draw(self, pen):
 		extractor = T1OutlineExtractor(pen, self.subrs)
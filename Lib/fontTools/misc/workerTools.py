@@ -0,0 +1,53 @@
+"""fontTools.misc.workerTools.py -- tools for spreading work over processes.
+"""
+
+from __future__ import print_function, division, absolute_import
+from fontTools.misc.py23 import *
+
+
+__all__ = ["mapInWorkers"]
+
+
+def mapInWorkers(func, items, workers=None, state=None, setup=None, chunkSize=1):
+	"""Returns [func(state, item) for item in items], computed in up to
+	`workers` processes.
+
+	state holds what all the items need; it is sent to each process only
+	once, and, if setup is given, replaced there by setup(state), eg. to
+	load fonts from their binary data.  The items are sent in chunks of
+	chunkSize.  func and setup must be module-level functions, so that
+	they can be pickled.
+
+	With workers None or less than 2, or with only one chunk of items,
+	everything is done in this process.
+	"""
+	items = list(items)
+	if workers is None or workers <= 1 or len(items) <= chunkSize:
+		if setup is not None:
+			state = setup(state)
+		return [func(state, item) for item in items]
+
+	import multiprocessing
+	chunks = [items[i:i+chunkSize] for i in range(0, len(items), chunkSize)]
+	pool = multiprocessing.Pool(min(workers, len(chunks)),
+			initializer=_initWorker, initargs=(func, state, setup))
+	try:
+		results = pool.map(_mapChunk, chunks, chunksize=1)
+	finally:
+		pool.close()
+		pool.join()
+	return [result for chunk in results for result in chunk]
+
+
+# State of the worker processes: the function to map and its state.
+_worker = None
+
+def _initWorker(func, state, setup):
+	global _worker
+	if setup is not None:
+		state = setup(state)
+	_worker = (func, state)
+
+def _mapChunk(chunk):
+	func, state = _worker
+	return [func(state, item) for item in chunk]
@@ -6,14 +6,22 @@ from __future__ import print_function, division, absolute_import
 from fontTools.misc.py23 import *
 from fontTools import ttLib
 from fontTools.ttLib.tables import otTables
+from fontTools.ttLib.tables.DefaultTable import DefaultTable
 from fontTools.misc import psCharStrings
+from fontTools.cffLib import dehinter, subroutinizer
+from fontTools.subset import hinting
 from fontTools.pens.basePen import NullPen
 from fontTools.misc.loggingTools import Timer
+from fontTools.misc.workerTools import mapInWorkers
 import sys
+import os
 import struct
+import hashlib
 import array
+import json
 import logging
-from collections import Counter
+import traceback
+from collections import Counter, OrderedDict, deque
 from types import MethodType
 
 __usage__ = "pyftsubset font-file [glyph...] [--option=value]..."
@@ -38,7 +46,8 @@ Usage:
 
 Arguments:
   font-file
-    The input font file.
+    The input font file.  This may also be a glob pattern, such as
+    'fonts/*.ttf', to subset several fonts with the same options.
   glyph
     Specify one or more glyph identifiers to include in the subset. Must be
     PS glyph names, or the special string '*' to keep the entire glyph set.
@@ -109,6 +118,17 @@ Output options:
   --output-file=<path>
       The output font file. If not specified, the subsetted font
       will be saved in as font-file.subset.
+      When subsetting several fonts, this is a template in which '{dir}',
+      '{name}' and '{ext}' are replaced with the directory, the name
+      without extension and the extension of each input font file,
+      eg. --output-file=subset/{name}.woff2.  Missing directories are
+      created.  [default: {dir}/{name}.subset{ext}]
+  --font-file=<path>
+      Another input font file or glob pattern to subset with the same
+      options.  May be given several times.  The glyphs, characters and
+      options given are parsed once and used for every font, and the
+      result of each one is reported separately.  Can't be used with
+      --xml.
   --flavor=<type>
       Specify flavor of output font file. May be 'woff' or 'woff2'.
       Note that WOFF2 requires the Brotli Python extension, available
@@ -118,6 +138,19 @@ Output options:
       smaller than pure zlib, but the compression speed is much slower.
       The Zopfli Python bindings are available at:
       https://pypi.python.org/pypi/zopfli
+  --batch=<path>
+      Produce several subsets of the font in one run, eg. the unicode-range
+      slices of a webfont.  <path> is a JSON file containing a list of
+      objects, one per subset, each with an "output-file" key and any of
+      the "glyphs", "gids", "text" and "unicodes" keys, whose values are
+      given as for the command-line options of the same name (lists are
+      accepted too).  Glyphs and characters specified on the command line
+      are added to every subset.  The font is loaded and pruned only once.
+      --output-file and --xml can't be given with --batch.  Failed subsets
+      are reported, and make the exit status 1.
+  --jobs=<N>
+      Use up to N worker processes to subset and save the fonts of --batch,
+      or the font files, if several are given.  [default: 1]
 
 Glyph set expansion:
   These options control how additional glyphs are added to the subset.
@@ -178,6 +211,22 @@ Hinting options:
       respectively. This produces (sometimes up to 30%) smaller fonts that
       are suitable for extremely high-resolution systems, like high-end
       mobile devices and retina displays.
+  --prune-functions
+      Remove the bodies of 'fpgm' and 'prep' functions that can not be
+      called by 'prep' or by the instructions of the remaining glyphs.  The
+      function definitions themselves are kept, empty, so that function
+      numbers don't change.  Hinting is left untouched if some function
+      number is not pushed right before its call, unless --interpret-hinting
+      is given.
+  --no-prune-functions [default]
+      Keep all 'fpgm' and 'prep' functions.
+  --interpret-hinting
+      With --prune-functions, follow the function numbers that the hinting
+      programs compute or keep in the storage area, as those made by
+      ttfautohint do, by interpreting the programs.  This can take several
+      seconds per hundred glyphs.
+  --no-interpret-hinting [default]
+      Only follow the function numbers pushed right before their call.
 
 Optimization options:
   --desubroutinize
@@ -188,6 +237,13 @@ Optimization options:
       Also see note under --no-hinting.
   --no-desubroutinize [default]
       Leave CFF subroutinizes as is, only throw away unused subroutinizes.
+  --subroutinize
+      Recompute CFF subroutines for the subsetted glyphs: existing
+      subroutines are expanded and repeated code shared by the remaining
+      glyphs is moved into new local and global subroutines.  Produces
+      smaller CFF tables than only throwing away unused subroutines.
+  --no-subroutinize [default]
+      Do not recompute CFF subroutines.
 
 Font table options:
   --drop-tables[+|-]=<table>[,<table>...]
@@ -298,6 +354,23 @@ Other font-specific options:
       required by the standard, nor by any known implementation.
   --no-canonical-order
       Keep original order of font tables. This is faster. [default]
+  --release-tables
+      Load, subset and compile the tables that the glyph closure doesn't
+      need ('name', 'post', 'GDEF', 'GPOS', 'kern', 'vmtx', 'hdmx', 'hmtx'
+      and 'OS/2') one at a time, after the other tables are subset, and
+      only keep their compiled data until the font is saved.  This lowers
+      peak memory use on large fonts with big layout or 'name' tables, as
+      only one of them is decompiled at a time.  The font is still saved
+      as a whole: the tables the closure reads ('cmap', 'GSUB', 'glyf',
+      'CFF ', etc.) stay decompiled, and the compiled tables stay in memory
+      until then.  The 'hmtx' and 'vmtx' tables are kept if bounds are
+      recalculated, as saving the font reads them.  Ignored with --xml,
+      which needs the tables decompiled.  When subsetting through the API,
+      the released tables are left in the font as DefaultTable objects
+      holding their compiled data: save the font and load it again to
+      access them.
+  --no-release-tables
+      Keep all tables decompiled until the font is saved. [default]
   --prune-unicode-ranges
       Update the 'OS/2 ulUnicodeRange*' bits after subsetting. The Unicode
       ranges defined in the OpenType specification v1.7 are intersected with
@@ -333,6 +406,8 @@ Example:
 log = logging.getLogger("fontTools.subset")
 
 def _log_glyphs(self, glyphs, font=None):
+    if not self.isEnabledFor(logging.INFO):
+        return
     self.info("Glyph names: %s", sorted(glyphs))
     if font:
         reverseGlyphMap = font.getReverseGlyphMap()
@@ -376,6 +451,104 @@ def _dict_subset(d, glyphs):
     return {g:d[g] for g in glyphs}
 
 
+class _GlyphSet(object):
+    """Set of glyph names of a font, stored as a map indexed by glyph ID.
+
+    Names that are not in the font's glyph order are ignored when added,
+    so there is no need to intersect with the font's glyphs after each
+    closure step.  Copying, comparing and hashing work on the underlying
+    bytes, which is much cheaper than doing the same on sets of glyph
+    names for fonts with tens of thousands of glyphs.  Use frozen() to
+    get an immutable, hashable snapshot.
+
+    If the 'added' attribute is set to a list, the glyph IDs of newly
+    added glyphs are appended to it, in the order they were added."""
+
+    __slots__ = ('_glyphOrder', '_reverseGlyphMap', '_map', 'added')
+
+    def __init__(self, glyphOrder, reverseGlyphMap, map=None):
+        self._glyphOrder = glyphOrder
+        self._reverseGlyphMap = reverseGlyphMap
+        if map is None:
+            map = bytearray(len(glyphOrder))
+        self._map = map
+        self.added = None
+
+    @classmethod
+    def fromFont(cls, font, glyphs=()):
+        self = cls(font.getGlyphOrder(), font.getReverseGlyphMap())
+        self.update(glyphs)
+        return self
+
+    def __contains__(self, glyph):
+        gid = self._reverseGlyphMap.get(glyph)
+        return gid is not None and self._map[gid] == 1
+
+    def __iter__(self):
+        glyphOrder = self._glyphOrder
+        for gid in self.gids():
+            yield glyphOrder[gid]
+
+    def __len__(self):
+        return self._map.count(b'\x01')
+
+    def __eq__(self, other):
+        if not isinstance(other, _GlyphSet):
+            return NotImplemented
+        return self._map == other._map
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __hash__(self):
+        # Only frozen sets are hashable; hashing a bytearray raises TypeError.
+        return hash(self._map)
+
+    def __repr__(self):
+        return "<%s %d glyphs>" % (self.__class__.__name__, len(self))
+
+    def gids(self):
+        """Yields the glyph IDs in the set, in ascending order."""
+        m = self._map
+        gid = m.find(b'\x01')
+        while gid != -1:
+            yield gid
+            gid = m.find(b'\x01', gid + 1)
+
+    def add(self, glyph):
+        gid = self._reverseGlyphMap.get(glyph)
+        if gid is not None and not self._map[gid]:
+            self._map[gid] = 1
+            if self.added is not None:
+                self.added.append(gid)
+
+    def update(self, *others):
+        m = self._map
+        reverseGlyphMap = self._reverseGlyphMap
+        added = self.added
+        for other in others:
+            if isinstance(other, _GlyphSet):
+                gids = other.gids()
+            else:
+                gids = (reverseGlyphMap.get(glyph) for glyph in other)
+            for gid in gids:
+                if gid is not None and not m[gid]:
+                    m[gid] = 1
+                    if added is not None:
+                        added.append(gid)
+
+    def copy(self):
+        return self.__class__(self._glyphOrder, self._reverseGlyphMap,
+                              bytearray(self._map))
+
+    def frozen(self):
+        if isinstance(self._map, bytes):
+            return self
+        return self.__class__(self._glyphOrder, self._reverseGlyphMap,
+                              bytes(self._map))
+
+
 @_add_method(otTables.Coverage)
 def intersect(self, glyphs):
     """Returns ascending list of matching coverage values."""
@@ -756,6 +929,35 @@ def may_have_non_1to1(self):
 def may_have_non_1to1(self):
     return True
 
+@_add_method(otTables.SingleSubst,
+             otTables.MultipleSubst)
+def closure_deps(self):
+    """Returns set of glyphs whose presence may affect closure_glyphs(),
+    or None if any glyph might."""
+    return set(self.mapping.keys())
+
+@_add_method(otTables.AlternateSubst)
+def closure_deps(self):
+    return set(self.alternates.keys())
+
+@_add_method(otTables.LigatureSubst)
+def closure_deps(self):
+    deps = set(self.ligatures.keys())
+    for seqs in self.ligatures.values():
+        for seq in seqs:
+            deps.update(seq.Component)
+    return deps
+
+@_add_method(otTables.ReverseChainSingleSubst)
+def closure_deps(self):
+    if self.Format == 1:
+        deps = set(self.Coverage.glyphs)
+        for c in self.LookAheadCoverage + self.BacktrackCoverage:
+            deps.update(c.glyphs)
+        return deps
+    else:
+        return None
+
 @_add_method(otTables.ContextSubst,
              otTables.ChainContextSubst,
              otTables.ContextPos,
@@ -977,6 +1179,45 @@ def closure_glyphs(self, s, cur_glyphs):
     else:
         assert 0, "unknown format: %s" % self.Format
 
+@_add_method(otTables.ContextSubst,
+             otTables.ChainContextSubst)
+def closure_deps(self):
+    c = self.__subset_classify_context()
+    if c is None:
+        return None
+
+    if self.Format == 1:
+        deps = set(c.Coverage(self).glyphs)
+        for rs in getattr(self, c.RuleSet):
+            if not rs: continue
+            for r in getattr(rs, c.Rule):
+                if not r: continue
+                for glist in c.RuleData(r):
+                    deps.update(glist)
+        return deps
+    elif self.Format == 2:
+        deps = set(c.Coverage(self).glyphs)
+        ContextData = c.ContextData(self)
+        for rs in getattr(self, c.RuleSet):
+            if not rs: continue
+            for r in getattr(rs, c.Rule):
+                if not r: continue
+                for klist in c.RuleData(r):
+                    # Class 0 matches any glyph not in the ClassDef
+                    if 0 in klist:
+                        return None
+        for cd in ContextData:
+            if cd:
+                deps.update(cd.classDefs.keys())
+        return deps
+    elif self.Format == 3:
+        deps = set()
+        for cov in c.RuleData(self):
+            deps.update(cov.glyphs)
+        return deps
+    else:
+        return None
+
 @_add_method(otTables.ContextSubst,
              otTables.ContextPos,
              otTables.ChainContextSubst,
@@ -1105,6 +1346,13 @@ def closure_glyphs(self, s, cur_glyphs):
     else:
         assert 0, "unknown format: %s" % self.Format
 
+@_add_method(otTables.ExtensionSubst)
+def closure_deps(self):
+    if self.Format == 1:
+        return self.ExtSubTable.closure_deps()
+    else:
+        return None
+
 @_add_method(otTables.ExtensionSubst)
 def may_have_non_1to1(self):
     if self.Format == 1:
@@ -1147,7 +1395,7 @@ def collect_lookups(self):
 @_add_method(otTables.Lookup)
 def closure_glyphs(self, s, cur_glyphs=None):
     if cur_glyphs is None:
-        cur_glyphs = frozenset(s.glyphs)
+        cur_glyphs = s.glyphs.frozen()
 
     # Memoize
     if (id(self), cur_glyphs) in s._doneLookups:
@@ -1163,6 +1411,17 @@ def closure_glyphs(self, s, cur_glyphs=None):
     assert(s._activeLookups[-1] == self)
     del s._activeLookups[-1]
 
+@_add_method(otTables.Lookup)
+def closure_deps(self):
+    deps = set()
+    for st in self.SubTable:
+        if not st: continue
+        st_deps = st.closure_deps()
+        if st_deps is None:
+            return None
+        deps.update(st_deps)
+    return deps
+
 @_add_method(otTables.Lookup)
 def subset_glyphs(self, s):
     self.SubTable = [st for st in self.SubTable if st and st.subset_glyphs(s)]
@@ -1377,8 +1636,10 @@ def subset_glyphs(self, s):
   return True
 
 @_add_method(ttLib.getTableClass('GSUB'))
-def closure_glyphs(self, s):
-    s.table = self.table
+def closure_lookup_deps(self, reverse_glyph_map):
+    """Returns the indices of the lookups of the closure, a map from each
+    glyph ID to the lookups whose closure may change when that glyph is
+    added, and the lookups that depend on any glyph."""
     if self.table.ScriptList:
         feature_indices = self.table.ScriptList.collect_features()
     else:
@@ -1390,18 +1651,81 @@ def closure_glyphs(self, s):
     if getattr(self.table, 'FeatureVariations', None):
         lookup_indices += self.table.FeatureVariations.collect_lookups(feature_indices)
     lookup_indices = _uniq_sort(lookup_indices)
-    if self.table.LookupList:
-        while True:
-            orig_glyphs = frozenset(s.glyphs)
-            s._activeLookups = []
-            s._doneLookups = set()
-            for i in lookup_indices:
-                if i >= self.table.LookupList.LookupCount: continue
-                if not self.table.LookupList.Lookup[i]: continue
-                self.table.LookupList.Lookup[i].closure_glyphs(s)
-            del s._activeLookups, s._doneLookups
-            if orig_glyphs == s.glyphs:
+    if not self.table.LookupList:
+        return [], {}, []
+    lookups = self.table.LookupList.Lookup
+    lookup_indices = [i for i in lookup_indices
+                      if i < self.table.LookupList.LookupCount and lookups[i]]
+
+    # Dependencies include glyphs that nested lookups of contextual lookups
+    # depend on.  Lookups that depend on any glyph (eg. contextual rules
+    # matching class 0) are always revisited.
+    own_deps = {}
+    gid_lookups = {}
+    any_glyph_lookups = []
+    for i in lookup_indices:
+        deps = set()
+        for j in self.table.LookupList.closure_lookups([i]):
+            if not lookups[j]: continue
+            if j not in own_deps:
+                own_deps[j] = lookups[j].closure_deps()
+            if own_deps[j] is None:
+                deps = None
                 break
+            deps.update(own_deps[j])
+        if deps is None:
+            any_glyph_lookups.append(i)
+            continue
+        for g in deps:
+            gid = reverse_glyph_map.get(g)
+            if gid is not None:
+                gid_lookups.setdefault(gid, []).append(i)
+    return lookup_indices, gid_lookups, any_glyph_lookups
+
+@_add_method(ttLib.getTableClass('GSUB'))
+def closure_glyphs(self, s):
+    s.table = self.table
+    # A ClosureCache hands the dependencies of an earlier closure of the
+    # same font to the subsetters it computes closures with.
+    cached = s.closure_data
+    deps = cached.get('GSUB') if cached is not None else None
+    if deps is None:
+        deps = self.closure_lookup_deps(s.glyphs._reverseGlyphMap)
+        if cached is not None:
+            cached['GSUB'] = deps
+    lookup_indices, gid_lookups, any_glyph_lookups = deps
+    if self.table.LookupList:
+        lookups = self.table.LookupList.Lookup
+
+        # Process lookups off a worklist, revisiting a lookup only when a
+        # glyph it depends on was added since it was last processed.
+        s.glyphs.added = added = []
+        queue = deque(lookup_indices)
+        queued = set(lookup_indices)
+        s._activeLookups = []
+        s._doneLookups = set()
+        done_mark = 0
+        while queue:
+            i = queue.popleft()
+            queued.discard(i)
+            if done_mark != len(added):
+                # Memoized results are only valid for the glyph set
+                # they were computed with.
+                s._doneLookups = set()
+                done_mark = len(added)
+            start = len(added)
+            lookups[i].closure_glyphs(s)
+            if start == len(added):
+                continue
+            triggered = set(any_glyph_lookups)
+            for gid in added[start:]:
+                triggered.update(gid_lookups.get(gid, ()))
+            for j in sorted(triggered):
+                if j not in queued:
+                    queue.append(j)
+                    queued.add(j)
+        del s._activeLookups, s._doneLookups
+        s.glyphs.added = None
     del s.table
 
 @_add_method(ttLib.getTableClass('GSUB'),
@@ -1790,8 +2114,8 @@ def closure_glyphs(self, s):
         layers = set()
         for g in decompose:
             for l in self.ColorLayers.get(g, []):
-                layers.add(l.name)
-        layers -= s.glyphs
+                if l.name not in s.glyphs:
+                    layers.add(l.name)
         s.glyphs.update(layers)
         decompose = layers
 
@@ -1817,7 +2141,7 @@ def closure_glyphs(self, glyphs):
 
 @_add_method(otTables.MathVariants)
 def closure_glyphs(self, s):
-    glyphs = frozenset(s.glyphs)
+    glyphs = s.glyphs.frozen()
     variants = set()
 
     if self.VertGlyphCoverage:
@@ -1891,7 +2215,7 @@ def subset_glyphs(self, s):
     return True
 
 @_add_method(ttLib.getTableModule('glyf').Glyph)
-def remapComponentsFast(self, indices):
+def remapComponentsFast(self, glyphidmap):
     if not self.data or struct.unpack(">h", self.data[:2])[0] >= 0:
         return    # Not composite
     data = array.array("B", self.data)
@@ -1901,7 +2225,7 @@ def remapComponentsFast(self, indices):
         flags =(data[i] << 8) | data[i+1]
         glyphID =(data[i+2] << 8) | data[i+3]
         # Remap
-        glyphID = indices.index(glyphID)
+        glyphID = glyphidmap[glyphID]
         data[i+2] = glyphID >> 8
         data[i+3] = glyphID & 0xFF
         i += 4
@@ -1926,8 +2250,8 @@ def closure_glyphs(self, s):
                 continue
             gl = self.glyphs[g]
             for c in gl.getComponentNames(self):
-                components.add(c)
-        components -= s.glyphs
+                if c not in s.glyphs:
+                    components.add(c)
         s.glyphs.update(components)
         decompose = components
 
@@ -1943,10 +2267,11 @@ def prune_pre_subset(self, font, options):
 @_add_method(ttLib.getTableClass('glyf'))
 def subset_glyphs(self, s):
     self.glyphs = _dict_subset(self.glyphs, s.glyphs)
-    indices = [i for i,g in enumerate(self.glyphOrder) if g in s.glyphs]
+    glyphidmap = {o:n for n,o in enumerate(i for i,g in enumerate(self.glyphOrder)
+                                             if g in s.glyphs)}
     for v in self.glyphs.values():
         if hasattr(v, "data"):
-            v.remapComponentsFast(indices)
+            v.remapComponentsFast(glyphidmap)
         else:
             pass    # No need
     self.glyphOrder = [g for g in self.glyphOrder if g in s.glyphs]
@@ -1960,6 +2285,242 @@ def prune_post_subset(self, options):
         v.trim(remove_hinting=remove_hinting)
     return True
 
+@_add_method(ttLib.getTableClass('glyf'))
+def glyph_programs(self):
+    """Yields (glyph index, bytecode) for the glyphs with instructions."""
+    for gid, g in enumerate(self.glyphOrder):
+        glyph = self.glyphs[g]
+        if hasattr(glyph, 'data'):
+            span = _instructions_span(glyph.data)
+            bytecode = glyph.data[span[0]:span[1]] if span else b''
+        elif hasattr(glyph, 'program'):
+            bytecode = glyph.program.getBytecode()
+        else:
+            continue
+        if bytecode:
+            yield gid, bytecode
+
+def _instructions_span(data):
+    """Returns the (start, end) offsets of the instructions in raw glyph
+    data, or None if the glyph has no instructions."""
+    if not data:
+        return None
+    numContours = struct.unpack(">h", data[:2])[0]
+    if numContours >= 0:
+        i = 10 + 2 * numContours
+    else:
+        i = 10
+        more = 1
+        we_have_instructions = False
+        while more:
+            flags = struct.unpack(">H", data[i:i+2])[0]
+            if flags & 0x0100:    # WE_HAVE_INSTRUCTIONS
+                we_have_instructions = True
+            i += 4
+            if flags & 0x0001: i += 4    # ARG_1_AND_2_ARE_WORDS
+            else: i += 2
+            if flags & 0x0008: i += 2    # WE_HAVE_A_SCALE
+            elif flags & 0x0040: i += 4    # WE_HAVE_AN_X_AND_Y_SCALE
+            elif flags & 0x0080: i += 8    # WE_HAVE_A_TWO_BY_TWO
+            more = flags & 0x0020    # MORE_COMPONENTS
+        if not we_have_instructions:
+            return None
+    instructionLen = struct.unpack(">H", data[i:i+2])[0]
+    return i + 2, i + 2 + instructionLen
+
+def _component_gids(data):
+    """Yields the component glyph IDs of raw composite glyph data."""
+    i = 10
+    more = 1
+    while more:
+        flags, glyphID = struct.unpack(">HH", data[i:i+4])
+        yield glyphID
+        i += 4
+        if flags & 0x0001: i += 4    # ARG_1_AND_2_ARE_WORDS
+        else: i += 2
+        if flags & 0x0008: i += 2    # WE_HAVE_A_SCALE
+        elif flags & 0x0040: i += 4    # WE_HAVE_AN_X_AND_Y_SCALE
+        elif flags & 0x0080: i += 8    # WE_HAVE_A_TWO_BY_TWO
+        more = flags & 0x0020    # MORE_COMPONENTS
+
+def _trim_glyph_data(data, glyphidmap, remove_hinting):
+    """Same as Glyph.remapComponentsFast() followed by Glyph.trim(),
+    on raw glyph data.  Component glyph IDs are not remapped if
+    glyphidmap is None."""
+    if not data:
+        return data
+    numContours = struct.unpack(">h", data[:2])[0]
+    data = bytearray(data)
+    i = 10
+    if numContours >= 0:
+        i += 2 * numContours # endPtsOfContours
+        nCoordinates = ((data[i-2] << 8) | data[i-1]) + 1
+        instructionLen = (data[i] << 8) | data[i+1]
+        if remove_hinting:
+            # Zero instruction length and splice the instructions out
+            data[i] = data[i+1] = 0
+            i += 2
+            del data[i:i+instructionLen]
+        else:
+            i += 2 + instructionLen
+
+        coordBytes = 0
+        j = 0
+        while j < nCoordinates:
+            flag = data[i]
+            i += 1
+            repeat = 1
+            if flag & 0x08: # flagRepeat
+                repeat = data[i] + 1
+                i += 1
+            xBytes = yBytes = 0
+            if flag & 0x02: xBytes = 1 # flagXShort
+            elif not flag & 0x10: xBytes = 2 # flagXsame
+            if flag & 0x04: yBytes = 1 # flagYShort
+            elif not flag & 0x20: yBytes = 2 # flagYsame
+            coordBytes += (xBytes + yBytes) * repeat
+            j += repeat
+        assert j == nCoordinates, "bad glyph flags"
+        i += coordBytes
+    else:
+        more = 1
+        we_have_instructions = False
+        while more:
+            flags = (data[i] << 8) | data[i+1]
+            if remove_hinting:
+                flags &= ~0x0100    # WE_HAVE_INSTRUCTIONS
+                data[i] = flags >> 8
+            if flags & 0x0100:
+                we_have_instructions = True
+            if glyphidmap is not None:
+                glyphID = glyphidmap[(data[i+2] << 8) | data[i+3]]
+                data[i+2] = glyphID >> 8
+                data[i+3] = glyphID & 0xFF
+            i += 4
+            if flags & 0x0001: i += 4    # ARG_1_AND_2_ARE_WORDS
+            else: i += 2
+            if flags & 0x0008: i += 2    # WE_HAVE_A_SCALE
+            elif flags & 0x0040: i += 4    # WE_HAVE_AN_X_AND_Y_SCALE
+            elif flags & 0x0080: i += 8    # WE_HAVE_A_TWO_BY_TWO
+            more = flags & 0x0020    # MORE_COMPONENTS
+        if we_have_instructions:
+            instructionLen = (data[i] << 8) | data[i+1]
+            i += 2 + instructionLen
+    # Remove padding
+    del data[i:]
+    return bytes(data)
+
+class _RawGlyfTable(ttLib.getTableClass('glyf')):
+    """A 'glyf' table that the subsetter works on without decompiling it:
+    glyphs stay slices of the original table data, and are only turned
+    into Glyph objects if something other than the subsetter accesses
+    the 'glyphs' attribute, or if bounding boxes need recalculating.
+
+    When saving to WOFF2, the writer makes the glyphs it transforms from
+    the compiled data instead; the transform still expands every glyph
+    to read its coordinates."""
+
+    @classmethod
+    def fromFont(cls, font):
+        self = cls('glyf')
+        self._data = font.reader['glyf']
+        self._locations = font['loca'].locations
+        self.glyphOrder = font.getGlyphOrder()
+        self._overrides = {}
+        return self
+
+    def __getattr__(self, attr):
+        if attr != 'glyphs' or '_data' not in self.__dict__:
+            raise AttributeError(attr)
+        glyphOrder = self.glyphOrder
+        glyphs = {}
+        for gid in range(min(len(glyphOrder), len(self._locations) - 1)):
+            glyphs[glyphOrder[gid]] = ttLib.getTableModule('glyf').Glyph(
+                self._glyph_data(gid))
+        self.glyphs = glyphs
+        del self._data, self._locations, self._overrides
+        return glyphs
+
+    def _glyph_data(self, gid):
+        data = self._overrides.get(gid)
+        if data is None:
+            data = self._data[self._locations[gid]:self._locations[gid+1]]
+        return data
+
+    def _rebuild(self, gids, glyphidmap, remove_hinting):
+        dataList = [_trim_glyph_data(self._glyph_data(gid), glyphidmap,
+                                     remove_hinting)
+                    for gid in gids]
+        self._data, self._locations = self.joinGlyphData(dataList)
+        self._overrides = {}
+        self._trimmed = True
+
+    def prune_pre_subset(self, font, options):
+        if 'glyphs' in self.__dict__:
+            return super(_RawGlyfTable, self).prune_pre_subset(font, options)
+        if options.notdef_glyph and not options.notdef_outline:
+            self._overrides[0] = b''
+        return True
+
+    def closure_glyphs(self, s):
+        if 'glyphs' in self.__dict__:
+            return super(_RawGlyfTable, self).closure_glyphs(s)
+        glyphOrder = self.glyphOrder
+        numGlyphs = min(len(glyphOrder), len(self._locations) - 1)
+        stack = [gid for gid in s.glyphs.gids() if gid < numGlyphs]
+        while stack:
+            data = self._glyph_data(stack.pop())
+            if not data or struct.unpack(">h", data[:2])[0] >= 0:
+                continue    # Not composite
+            for gid in _component_gids(data):
+                if gid < numGlyphs and glyphOrder[gid] not in s.glyphs:
+                    s.glyphs.add(glyphOrder[gid])
+                    stack.append(gid)
+
+    def subset_glyphs(self, s):
+        if 'glyphs' in self.__dict__:
+            return super(_RawGlyfTable, self).subset_glyphs(s)
+        glyphOrder = self.glyphOrder
+        gids = [i for i in range(min(len(glyphOrder), len(self._locations) - 1))
+                if glyphOrder[i] in s.glyphs]
+        glyphidmap = {o:n for n,o in enumerate(gids)}
+        self._rebuild(gids, glyphidmap, not s.options.hinting)
+        self.glyphOrder = [glyphOrder[i] for i in gids]
+        # Don't drop empty 'glyf' tables, otherwise 'loca' doesn't get subset.
+        return True
+
+    def prune_post_subset(self, options):
+        if 'glyphs' in self.__dict__:
+            return super(_RawGlyfTable, self).prune_post_subset(options)
+        if not getattr(self, '_trimmed', False):
+            numGlyphs = min(len(self.glyphOrder), len(self._locations) - 1)
+            self._rebuild(range(numGlyphs), None, not options.hinting)
+        return True
+
+    def glyph_programs(self):
+        if 'glyphs' in self.__dict__:
+            for item in super(_RawGlyfTable, self).glyph_programs():
+                yield item
+            return
+        for gid in range(min(len(self.glyphOrder), len(self._locations) - 1)):
+            data = self._glyph_data(gid)
+            span = _instructions_span(data)
+            if span and span[1] > span[0]:
+                yield gid, data[span[0]:span[1]]
+
+    def compile(self, ttFont):
+        if ttFont.recalcBBoxes or 'glyphs' in self.__dict__:
+            self.glyphs    # Decompile
+            return super(_RawGlyfTable, self).compile(ttFont)
+        if self._overrides or len(self._locations) != len(self.glyphOrder) + 1:
+            numGlyphs = min(len(self.glyphOrder), len(self._locations) - 1)
+            self._rebuild(range(numGlyphs), None, False)
+        if 'loca' in ttFont:
+            ttFont['loca'].set(self._locations)
+        if 'maxp' in ttFont:
+            ttFont['maxp'].numGlyphs = len(self._locations) - 1
+        return self._data
+
 @_add_method(ttLib.getTableClass('CFF '))
 def prune_pre_subset(self, font, options):
     cff = self.cff
@@ -2019,8 +2580,9 @@ def subset_glyphs(self, s):
                 # https://github.com/khaledhosny/ots/pull/31
                 #sel.format = None
                 sel.format = 3
-                sel.gidArray = [sel.gidArray[i] for i in indices]
-            cs.charStrings = {g:indices.index(v)
+                sel.gidArray = array.array('B', [sel.gidArray[i] for i in indices])
+            indexmap = {o:n for n,o in enumerate(indices)}
+            cs.charStrings = {g:indexmap[v]
                               for g,v in cs.charStrings.items()
                               if g in s.glyphs}
         else:
@@ -2039,41 +2601,10 @@ def subset_subroutines(self, subrs, gsubrs):
     for i in range(1, len(p)):
         if p[i] == 'callsubr':
             assert isinstance(p[i-1], int)
-            p[i-1] = subrs._used.index(p[i-1] + subrs._old_bias) - subrs._new_bias
+            p[i-1] = subrs._usedmap[p[i-1] + subrs._old_bias] - subrs._new_bias
         elif p[i] == 'callgsubr':
             assert isinstance(p[i-1], int)
-            p[i-1] = gsubrs._used.index(p[i-1] + gsubrs._old_bias) - gsubrs._new_bias
-
-@_add_method(psCharStrings.T2CharString)
-def drop_hints(self):
-    hints = self._hints
-
-    if hints.deletions:
-        p = self.program
-        for idx in reversed(hints.deletions):
-            del p[idx-2:idx]
-
-    if hints.has_hint:
-        assert not hints.deletions or hints.last_hint <= hints.deletions[0]
-        self.program = self.program[hints.last_hint:]
-        if hasattr(self, 'width'):
-            # Insert width back if needed
-            if self.width != self.private.defaultWidthX:
-                self.program.insert(0, self.width - self.private.nominalWidthX)
-
-    if hints.has_hintmask:
-        i = 0
-        p = self.program
-        while i < len(p):
-            if p[i] in ['hintmask', 'cntrmask']:
-                assert i + 1 <= len(p)
-                del p[i:i+2]
-                continue
-            i += 1
-
-    assert len(self.program)
-
-    del self._hints
+            p[i-1] = gsubrs._usedmap[p[i-1] + gsubrs._old_bias] - gsubrs._new_bias
 
 class _MarkingT2Decompiler(psCharStrings.SimpleT2Decompiler):
 
@@ -2093,144 +2624,6 @@ class _MarkingT2Decompiler(psCharStrings.SimpleT2Decompiler):
         self.globalSubrs._used.add(self.operandStack[-1]+self.globalBias)
         psCharStrings.SimpleT2Decompiler.op_callgsubr(self, index)
 
-class _DehintingT2Decompiler(psCharStrings.T2WidthExtractor):
-
-    class Hints(object):
-        def __init__(self):
-            # Whether calling this charstring produces any hint stems
-            # Note that if a charstring starts with hintmask, it will
-            # have has_hint set to True, because it *might* produce an
-            # implicit vstem if called under certain conditions.
-            self.has_hint = False
-            # Index to start at to drop all hints
-            self.last_hint = 0
-            # Index up to which we know more hints are possible.
-            # Only relevant if status is 0 or 1.
-            self.last_checked = 0
-            # The status means:
-            # 0: after dropping hints, this charstring is empty
-            # 1: after dropping hints, there may be more hints
-            #    continuing after this
-            # 2: no more hints possible after this charstring
-            self.status = 0
-            # Has hintmask instructions; not recursive
-            self.has_hintmask = False
-            # List of indices of calls to empty subroutines to remove.
-            self.deletions = []
-        pass
-
-    def __init__(self, css, localSubrs, globalSubrs, nominalWidthX, defaultWidthX):
-        self._css = css
-        psCharStrings.T2WidthExtractor.__init__(
-            self, localSubrs, globalSubrs, nominalWidthX, defaultWidthX)
-
-    def execute(self, charString):
-        old_hints = charString._hints if hasattr(charString, '_hints') else None
-        charString._hints = self.Hints()
-
-        psCharStrings.T2WidthExtractor.execute(self, charString)
-
-        hints = charString._hints
-
-        if hints.has_hint or hints.has_hintmask:
-            self._css.add(charString)
-
-        if hints.status != 2:
-            # Check from last_check, make sure we didn't have any operators.
-            for i in range(hints.last_checked, len(charString.program) - 1):
-                if isinstance(charString.program[i], str):
-                    hints.status = 2
-                    break
-                else:
-                    hints.status = 1 # There's *something* here
-            hints.last_checked = len(charString.program)
-
-        if old_hints:
-            assert hints.__dict__ == old_hints.__dict__
-
-    def op_callsubr(self, index):
-        subr = self.localSubrs[self.operandStack[-1]+self.localBias]
-        psCharStrings.T2WidthExtractor.op_callsubr(self, index)
-        self.processSubr(index, subr)
-
-    def op_callgsubr(self, index):
-        subr = self.globalSubrs[self.operandStack[-1]+self.globalBias]
-        psCharStrings.T2WidthExtractor.op_callgsubr(self, index)
-        self.processSubr(index, subr)
-
-    def op_hstem(self, index):
-        psCharStrings.T2WidthExtractor.op_hstem(self, index)
-        self.processHint(index)
-    def op_vstem(self, index):
-        psCharStrings.T2WidthExtractor.op_vstem(self, index)
-        self.processHint(index)
-    def op_hstemhm(self, index):
-        psCharStrings.T2WidthExtractor.op_hstemhm(self, index)
-        self.processHint(index)
-    def op_vstemhm(self, index):
-        psCharStrings.T2WidthExtractor.op_vstemhm(self, index)
-        self.processHint(index)
-    def op_hintmask(self, index):
-        rv = psCharStrings.T2WidthExtractor.op_hintmask(self, index)
-        self.processHintmask(index)
-        return rv
-    def op_cntrmask(self, index):
-        rv = psCharStrings.T2WidthExtractor.op_cntrmask(self, index)
-        self.processHintmask(index)
-        return rv
-
-    def processHintmask(self, index):
-        cs = self.callingStack[-1]
-        hints = cs._hints
-        hints.has_hintmask = True
-        if hints.status != 2:
-            # Check from last_check, see if we may be an implicit vstem
-            for i in range(hints.last_checked, index - 1):
-                if isinstance(cs.program[i], str):
-                    hints.status = 2
-                    break
-            else:
-                # We are an implicit vstem
-                hints.has_hint = True
-                hints.last_hint = index + 1
-                hints.status = 0
-        hints.last_checked = index + 1
-
-    def processHint(self, index):
-        cs = self.callingStack[-1]
-        hints = cs._hints
-        hints.has_hint = True
-        hints.last_hint = index
-        hints.last_checked = index
-
-    def processSubr(self, index, subr):
-        cs = self.callingStack[-1]
-        hints = cs._hints
-        subr_hints = subr._hints
-
-        # Check from last_check, make sure we didn't have
-        # any operators.
-        if hints.status != 2:
-            for i in range(hints.last_checked, index - 1):
-                if isinstance(cs.program[i], str):
-                    hints.status = 2
-                    break
-            hints.last_checked = index
-
-        if hints.status != 2:
-            if subr_hints.has_hint:
-                hints.has_hint = True
-
-            # Decide where to chop off from
-            if subr_hints.status == 0:
-                hints.last_hint = index
-            else:
-                hints.last_hint = index - 2 # Leave the subr call in
-        elif subr_hints.status == 0:
-            hints.deletions.append(index)
-
-        hints.status = max(hints.status, subr_hints.status)
-
 class _DesubroutinizingT2Decompiler(psCharStrings.SimpleT2Decompiler):
 
     def __init__(self, localSubrs, globalSubrs):
@@ -2296,7 +2689,7 @@ def prune_post_subset(self, options):
         if hasattr(font, "FDSelect"):
             sel = font.FDSelect
             indices = _uniq_sort(sel.gidArray)
-            sel.gidArray = [indices.index (ss) for ss in sel.gidArray]
+            sel.gidArray = array.array('B', [indices.index (ss) for ss in sel.gidArray])
             arr = font.FDArray
             arr.items = [arr[i] for i in indices]
             del arr.file, arr.offsets
@@ -2326,36 +2719,13 @@ def prune_post_subset(self, options):
             #         last call to a stem op or a stem-calling subroutine,
             #     * Drop all hintmask operations.
             # - It's trickier... A hintmask right after hints and a few numbers
-            #     will act as an implicit vstemhm. As such, we track whether
+            #     will act as an implicit vstem. As such, we track whether
             #     we have seen any non-hint operators so far and do the right
             #     thing, recursively... Good luck understanding that :(
-            css = set()
-            for g in font.charset:
-                c, _ = cs.getItemAndSelector(g)
-                c.decompile()
-                subrs = getattr(c.private, "Subrs", [])
-                decompiler = _DehintingT2Decompiler(css, subrs, c.globalSubrs,
-                                                    c.private.nominalWidthX,
-                                                    c.private.defaultWidthX)
-                decompiler.execute(c)
-                c.width = decompiler.width
-            for charstring in css:
-                charstring.drop_hints()
-            del css
-
-            # Drop font-wide hinting values
-            all_privs = []
-            if hasattr(font, 'FDSelect'):
-                all_privs.extend(fd.Private for fd in font.FDArray)
-            else:
-                all_privs.append(font.Private)
-            for priv in all_privs:
-                for k in ['BlueValues', 'OtherBlues',
-                          'FamilyBlues', 'FamilyOtherBlues',
-                          'BlueScale', 'BlueShift', 'BlueFuzz',
-                          'StemSnapH', 'StemSnapV', 'StdHW', 'StdVW']:
-                    if hasattr(priv, k):
-                        setattr(priv, k, None)
+            #
+            # cffLib.dehinter does all that on the charstrings' bytecode,
+            # and drops the font-wide hinting values too.
+            dehinter.dehint(font, font.charset)
 
         # Renumber subroutines to remove unused ones
 
@@ -2379,6 +2749,7 @@ def prune_post_subset(self, options):
             if not hasattr(subrs, '_used'):
                 subrs._used = set()
             subrs._used = _uniq_sort(subrs._used)
+            subrs._usedmap = {o:n for n,o in enumerate(subrs._used)}
             subrs._old_bias = psCharStrings.calcSubrBias(subrs)
             subrs._new_bias = psCharStrings.calcSubrBias(subrs._used)
 
@@ -2409,7 +2780,10 @@ def prune_post_subset(self, options):
 
         # Cleanup
         for subrs in all_subrs:
-            del subrs._used, subrs._old_bias, subrs._new_bias
+            del subrs._used, subrs._usedmap, subrs._old_bias, subrs._new_bias
+
+    if options.subroutinize:
+        subroutinizer.subroutinize(cff)
 
     return True
 
@@ -2426,14 +2800,15 @@ def closure_glyphs(self, s):
                     glyphs.remove(None)
                 s.glyphs.update(glyphs)
         else:
+            # Look up the requested unicodes rather than walking the cmap,
+            # as closures of small requests are computed over and over by a
+            # ClosureCache.
             cmap = table.cmap
-            intersection = s.unicodes_requested.intersection(cmap.keys())
-            s.glyphs.update(cmap[u] for u in intersection)
+            s.glyphs.update(cmap[u] for u in s.unicodes_requested if u in cmap)
 
     # Calculate unicodes_missing
-    s.unicodes_missing = s.unicodes_requested.copy()
-    for table in tables:
-        s.unicodes_missing.difference_update(table.cmap)
+    s.unicodes_missing = {u for u in s.unicodes_requested
+                          if not any(u in table.cmap for table in tables)}
 
 @_add_method(ttLib.getTableClass('cmap'))
 def prune_pre_subset(self, font, options):
@@ -2593,6 +2968,8 @@ class Options(object):
         self.ignore_missing_glyphs = False
         self.ignore_missing_unicodes = True
         self.hinting = True
+        self.prune_functions = False # Empty unreachable 'fpgm'/'prep' functions
+        self.interpret_hinting = False # Interpret hinting programs to find the called functions
         self.glyph_names = False
         self.legacy_cmap = False
         self.symbol_cmap = False
@@ -2611,6 +2988,8 @@ class Options(object):
         self.flavor = None  # May be 'woff' or 'woff2'
         self.with_zopfli = False  # use zopfli instead of zlib for WOFF 1.0
         self.desubroutinize = False # Desubroutinize CFF CharStrings
+        self.subroutinize = False # Recompute CFF subroutines
+        self.release_tables = False # Compile and release non-closure tables early
         self.verbose = False
         self.timing = False
         self.xml = False
@@ -2699,18 +3078,159 @@ class Options(object):
         return posargs + passthru_options
 
 
+def _closure_is_decomposable(font):
+    """Returns whether the closure of a union of requests is the union of
+    their closures, that is, whether no rule of the font's (pruned) tables
+    acts on several glyphs at once.  Only 'GSUB' has such rules."""
+    if 'GSUB' not in font or not font['GSUB'].table.LookupList:
+        return True
+    for lookup in font['GSUB'].table.LookupList.Lookup:
+        if not lookup:
+            continue
+        for st in lookup.SubTable:
+            if isinstance(st, otTables.ExtensionSubst):
+                st = st.ExtSubTable
+            if not isinstance(st, (otTables.SingleSubst,
+                                   otTables.MultipleSubst,
+                                   otTables.AlternateSubst)):
+                return False
+    return True
+
+class ClosureCache(object):
+    """Remembers the glyph closures computed by subsetters, to reuse them
+    when the same font is subset again.
+
+    Give the same cache to the Subsetter of every request.  Fonts are told
+    apart by their table directory, with the table checksums, 'head' table
+    and glyph order, so they must be loaded from a file; the options that
+    change the closure are part of the key.  The GSUB lookup dependencies
+    are worked out once per font and options, and shared by its closures.  Changes made to a font in other ways between subsets are
+    not noticed.
+
+    Closures are remembered per request, and per block of 256 code points
+    within a request.  Unless the font has ligature or contextual
+    substitutions, which make glyphs of different blocks interact, the
+    closure of a request is the union of the closures of its blocks: new
+    requests then only compute the blocks that earlier requests didn't
+    have.  Otherwise only identical requests are reused.
+
+    The hits and misses attributes count the closures that were reused
+    and computed."""
+
+    # Options that change the closure of a request.
+    closure_options = ('drop_tables', 'hinting', 'hinting_tables',
+                       'layout_features', 'legacy_cmap', 'symbol_cmap',
+                       'notdef_glyph', 'notdef_outline', 'recommended_glyphs')
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._closures = OrderedDict()
+        self._fonts = {}
+
+    @staticmethod
+    def _font_key(font):
+        reader = font.reader
+        if reader is None or 'head' not in reader:
+            return None
+        # The glyph names depend on how the font was loaded, eg. with
+        # dontLoadGlyphNames, and closures are sets of glyph names.
+        glyphOrder = hashlib.sha1(
+            tobytes('\0'.join(font.getGlyphOrder()), 'utf-8')).digest()
+        return (bytes(reader['head']),
+                tuple(sorted((tag, reader.tables[tag].length,
+                              reader.tables[tag].checkSum)
+                             for tag in reader.keys())),
+                glyphOrder)
+
+    def _options_key(self, options):
+        key = []
+        for name in self.closure_options:
+            value = getattr(options, name)
+            if isinstance(value, list):
+                value = tuple(sorted(value))
+            key.append(value)
+        return tuple(key)
+
+    def _get(self, key):
+        closure = self._closures.pop(key, None)
+        if closure is not None:
+            self._closures[key] = closure
+            self.hits += 1
+        return closure
+
+    def _put(self, key, closure):
+        self._closures[key] = closure
+        while len(self._closures) > self.maxsize:
+            self._closures.popitem(last=False)
+
+    def _compute(self, part, font, unicodes, glyphs):
+        self.misses += 1
+        part.unicodes_requested = set(unicodes)
+        part.glyphs_requested = set(glyphs)
+        return part._compute_closure(font)
+
+    def closure(self, subsetter, font):
+        """Returns the closure of subsetter's request on font, as a dict
+        of subsetter attributes, or None if font can't be cached."""
+        fontKey = self._font_key(font)
+        if fontKey is None:
+            return None
+        key = (fontKey, self._options_key(subsetter.options))
+        unicodes = frozenset(subsetter.unicodes_requested)
+        glyphs = frozenset(subsetter.glyphs_requested)
+
+        requestKey = key + ('request', unicodes, glyphs)
+        closure = self._get(requestKey)
+        if closure is not None:
+            return closure
+
+        # What the closures of a font have in common, eg. the GSUB lookup
+        # dependencies, is worked out by the first one and kept here.
+        data = self._fonts.get(key)
+        if data is None:
+            data = self._fonts[key] = {
+                'decomposable': _closure_is_decomposable(font)}
+        part = Subsetter(options=subsetter.options)
+        part.closure_data = data
+        if not data['decomposable']:
+            closure = self._compute(part, font, unicodes, glyphs)
+        else:
+            blocks = {}
+            for u in unicodes:
+                blocks.setdefault(u >> 8, set()).add(u)
+            parts = [(block, frozenset(us), frozenset())
+                     for block, us in blocks.items()]
+            if glyphs or not parts:
+                parts.append((None, frozenset(), glyphs))
+            closures = []
+            for block, us, gs in parts:
+                partKey = key + ('block', block, us, gs)
+                closure = self._get(partKey)
+                if closure is None:
+                    closure = self._compute(part, font, us, gs)
+                    self._put(partKey, closure)
+                closures.append(closure)
+            closure = {attr: frozenset().union(*(c[attr] for c in closures))
+                       for attr in closures[0]}
+        self._put(requestKey, closure)
+        return closure
+
 class Subsetter(object):
 
     class SubsettingError(Exception): pass
     class MissingGlyphsSubsettingError(SubsettingError): pass
     class MissingUnicodesSubsettingError(SubsettingError): pass
 
-    def __init__(self, options=None):
+    def __init__(self, options=None, closure_cache=None):
 
         if not options:
             options = Options()
 
         self.options = options
+        self.closure_cache = closure_cache
+        self.closure_data = None
         self.unicodes_requested = set()
         self.glyph_names_requested = set()
         self.glyph_ids_requested = set()
@@ -2726,33 +3246,52 @@ class Subsetter(object):
         self.glyph_names_requested.update(glyphs)
         self.glyph_ids_requested.update(gids)
 
+    def _load_table(self, font, tag):
+        # The subsetter only needs 'glyf' as raw data; skip decompiling
+        # it into Glyph objects unless something else already did.
+        if (tag == 'glyf' and not font.isLoaded(tag) and
+                font.reader is not None and font.flavor != 'woff2' and
+                'loca' in font):
+            font[tag] = _RawGlyfTable.fromFont(font)
+        return font[tag]
+
     def _prune_pre_subset(self, font):
+        released = self._released_tables(font)
         for tag in self._sort_tables(font):
-            if(tag.strip() in self.options.drop_tables or
-                 (tag.strip() in self.options.hinting_tables and not self.options.hinting) or
-                 (tag == 'kern' and (not self.options.legacy_kern and 'GPOS' in font))):
-                log.info("%s dropped", tag)
-                del font[tag]
+            # Released tables are dropped here too, without loading them,
+            # so that dropping 'kern' sees the same 'GPOS' either way.
+            if self._drop_pre_subset_table(font, tag):
                 continue
-
-            clazz = ttLib.getTableClass(tag)
-
-            if hasattr(clazz, 'prune_pre_subset'):
-                with timer("load '%s'" % tag):
-                    table = font[tag]
-                with timer("prune '%s'" % tag):
-                    retain = table.prune_pre_subset(font, self.options)
-                if not retain:
-                    log.info("%s pruned to empty; dropped", tag)
-                    del font[tag]
-                    continue
-                else:
-                    log.info("%s pruned", tag)
+            if tag not in released:
+                self._prune_pre_subset_table(font, tag)
+
+    def _drop_pre_subset_table(self, font, tag):
+        if(tag.strip() in self.options.drop_tables or
+             (tag.strip() in self.options.hinting_tables and not self.options.hinting) or
+             (tag == 'kern' and (not self.options.legacy_kern and 'GPOS' in font))):
+            log.info("%s dropped", tag)
+            del font[tag]
+            return True
+        return False
+
+    def _prune_pre_subset_table(self, font, tag):
+        clazz = ttLib.getTableClass(tag)
+
+        if hasattr(clazz, 'prune_pre_subset'):
+            with timer("load '%s'" % tag):
+                table = self._load_table(font, tag)
+            with timer("prune '%s'" % tag):
+                retain = table.prune_pre_subset(font, self.options)
+            if not retain:
+                log.info("%s pruned to empty; dropped", tag)
+                del font[tag]
+            else:
+                log.info("%s pruned", tag)
 
     def _closure_glyphs(self, font):
 
-        realGlyphs = set(font.getGlyphOrder())
         glyph_order = font.getGlyphOrder()
+        reverse_glyph_map = font.getReverseGlyphMap()
 
         self.glyphs_requested = set()
         self.glyphs_requested.update(self.glyph_names_requested)
@@ -2761,7 +3300,8 @@ class Subsetter(object):
                                      if i < len(glyph_order))
 
         self.glyphs_missing = set()
-        self.glyphs_missing.update(self.glyphs_requested.difference(realGlyphs))
+        self.glyphs_missing.update(g for g in self.glyphs_requested
+                                   if g not in reverse_glyph_map)
         self.glyphs_missing.update(i for i in self.glyph_ids_requested
                                    if i >= len(glyph_order))
         if self.glyphs_missing:
@@ -2769,14 +3309,14 @@ class Subsetter(object):
             if not self.options.ignore_missing_glyphs:
                 raise self.MissingGlyphsSubsettingError(self.glyphs_missing)
 
-        self.glyphs = self.glyphs_requested.copy()
+        closure = None
+        if self.closure_cache is not None:
+            closure = self.closure_cache.closure(self, font)
+        if closure is None:
+            closure = self._compute_closure(font)
+        for attr, value in closure.items():
+            setattr(self, attr, value)
 
-        self.unicodes_missing = set()
-        if 'cmap' in font:
-            with timer("close glyph list over 'cmap'"):
-                font['cmap'].closure_glyphs(self)
-                self.glyphs.intersection_update(realGlyphs)
-        self.glyphs_cmaped = frozenset(self.glyphs)
         if self.unicodes_missing:
             missing = ["U+%04X" % u for u in self.unicodes_missing]
             log.info("Missing glyphs for requested Unicodes: %s", missing)
@@ -2784,6 +3324,22 @@ class Subsetter(object):
                 raise self.MissingUnicodesSubsettingError(missing)
             del missing
 
+        log.info("Retaining %d glyphs", len(self.glyphs_all))
+
+    def _compute_closure(self, font):
+        """Closes the requested unicodes and glyphs over the font tables;
+        returns the glyph sets of the closure stages."""
+
+        # During closure, glyphs are tracked in a glyph-ID map; glyphs not
+        # in the font are dropped as they are added.
+        self.glyphs = _GlyphSet.fromFont(font, self.glyphs_requested)
+
+        self.unicodes_missing = set()
+        if 'cmap' in font:
+            with timer("close glyph list over 'cmap'"):
+                font['cmap'].closure_glyphs(self)
+        self.glyphs_cmaped = self.glyphs.frozen()
+
         if self.options.notdef_glyph:
             if 'glyf' in font:
                 self.glyphs.add(font.getGlyphName(0))
@@ -2803,11 +3359,10 @@ class Subsetter(object):
                          len(self.glyphs))
                 log.glyphs(self.glyphs, font=font)
                 font['GSUB'].closure_glyphs(self)
-                self.glyphs.intersection_update(realGlyphs)
                 log.info("Closed glyph list over 'GSUB': %d glyphs after",
                          len(self.glyphs))
                 log.glyphs(self.glyphs, font=font)
-        self.glyphs_gsubed = frozenset(self.glyphs)
+        self.glyphs_gsubed = self.glyphs.frozen()
 
         if 'MATH' in font:
             with timer("close glyph list over 'MATH'"):
@@ -2815,11 +3370,10 @@ class Subsetter(object):
                          len(self.glyphs))
                 log.glyphs(self.glyphs, font=font)
                 font['MATH'].closure_glyphs(self)
-                self.glyphs.intersection_update(realGlyphs)
                 log.info("Closed glyph list over 'MATH': %d glyphs after",
                          len(self.glyphs))
                 log.glyphs(self.glyphs, font=font)
-        self.glyphs_mathed = frozenset(self.glyphs)
+        self.glyphs_mathed = self.glyphs.frozen()
 
         for table in ('COLR', 'bsln'):
             if table in font:
@@ -2828,7 +3382,6 @@ class Subsetter(object):
                              table, len(self.glyphs))
                     log.glyphs(self.glyphs, font=font)
                     font[table].closure_glyphs(self)
-                    self.glyphs.intersection_update(realGlyphs)
                     log.info("Closed glyph list over '%s': %d glyphs after",
                              table, len(self.glyphs))
                     log.glyphs(self.glyphs, font=font)
@@ -2839,71 +3392,192 @@ class Subsetter(object):
                          len(self.glyphs))
                 log.glyphs(self.glyphs, font=font)
                 font['glyf'].closure_glyphs(self)
-                self.glyphs.intersection_update(realGlyphs)
                 log.info("Closed glyph list over 'glyf': %d glyphs after",
                          len(self.glyphs))
                 log.glyphs(self.glyphs, font=font)
-        self.glyphs_glyfed = frozenset(self.glyphs)
-
-        self.glyphs_all = frozenset(self.glyphs)
+        self.glyphs_glyfed = self.glyphs.frozen()
 
-        log.info("Retaining %d glyphs", len(self.glyphs_all))
+        self.glyphs_all = self.glyphs.frozen()
 
         del self.glyphs
 
+        # Table subsetting works on glyph names, and membership tests are
+        # fastest on plain frozensets.
+        return {attr: frozenset(getattr(self, attr))
+                for attr in ('unicodes_missing', 'glyphs_cmaped',
+                             'glyphs_gsubed', 'glyphs_mathed',
+                             'glyphs_glyfed', 'glyphs_all')}
+
     def _subset_glyphs(self, font):
+        released = self._released_tables(font)
         for tag in self._sort_tables(font):
-            clazz = ttLib.getTableClass(tag)
-
-            if tag.strip() in self.options.no_subset_tables:
-                log.info("%s subsetting not needed", tag)
-            elif hasattr(clazz, 'subset_glyphs'):
-                with timer("subset '%s'" % tag):
-                    table = font[tag]
-                    self.glyphs = self.glyphs_all
-                    retain = table.subset_glyphs(self)
-                    del self.glyphs
-                if not retain:
-                    log.info("%s subsetted to empty; dropped", tag)
-                    del font[tag]
-                else:
-                    log.info("%s subsetted", tag)
-            elif self.options.passthrough_tables:
-                log.info("%s NOT subset; don't know how to subset", tag)
-            else:
-                log.info("%s NOT subset; don't know how to subset; dropped", tag)
-                del font[tag]
+            if tag not in released:
+                self._subset_glyphs_table(font, tag)
 
         with timer("subset GlyphOrder"):
             glyphOrder = font.getGlyphOrder()
+            if released:
+                # The released tables still have to be decompiled with it.
+                self._unsubset_glyph_order = glyphOrder
             glyphOrder = [g for g in glyphOrder if g in self.glyphs_all]
             font.setGlyphOrder(glyphOrder)
             font._buildReverseGlyphOrderDict()
 
+    def _subset_glyphs_table(self, font, tag):
+        clazz = ttLib.getTableClass(tag)
+
+        if tag.strip() in self.options.no_subset_tables:
+            log.info("%s subsetting not needed", tag)
+        elif hasattr(clazz, 'subset_glyphs'):
+            with timer("subset '%s'" % tag):
+                table = self._load_table(font, tag)
+                self.glyphs = self.glyphs_all
+                retain = table.subset_glyphs(self)
+                del self.glyphs
+            if not retain:
+                log.info("%s subsetted to empty; dropped", tag)
+                del font[tag]
+            else:
+                log.info("%s subsetted", tag)
+        elif self.options.passthrough_tables:
+            log.info("%s NOT subset; don't know how to subset", tag)
+        else:
+            log.info("%s NOT subset; don't know how to subset; dropped", tag)
+            del font[tag]
+
     def _prune_post_subset(self, font):
+        released = self._released_tables(font)
         for tag in font.keys():
-            if tag == 'GlyphOrder': continue
-            if tag == 'OS/2' and self.options.prune_unicode_ranges:
-                old_uniranges = font[tag].getUnicodeRanges()
-                new_uniranges = font[tag].recalcUnicodeRanges(font, pruneOnly=True)
-                if old_uniranges != new_uniranges:
-                    log.info("%s Unicode ranges pruned: %s", tag, sorted(new_uniranges))
-                if self.options.recalc_average_width:
-                    widths = [m[0] for m in font["hmtx"].metrics.values() if m[0] > 0]
-                    avg_width = int(round(sum(widths) / len(widths)))
-                    if avg_width != font[tag].xAvgCharWidth:
-                        font[tag].xAvgCharWidth = avg_width
-                        log.info("%s xAvgCharWidth updated: %d", tag, avg_width)
-            clazz = ttLib.getTableClass(tag)
-            if hasattr(clazz, 'prune_post_subset'):
-                with timer("prune '%s'" % tag):
-                    table = font[tag]
-                    retain = table.prune_post_subset(self.options)
-                if not retain:
-                    log.info("%s pruned to empty; dropped", tag)
-                    del font[tag]
-                else:
-                    log.info("%s pruned", tag)
+            if tag != 'GlyphOrder' and tag not in released:
+                self._prune_post_subset_table(font, tag)
+        if (self.options.hinting and 'glyf' in font and
+            self.options.prune_functions):
+            with timer("prune hinting programs"):
+                self._prune_hinting_programs(font)
+
+    def _prune_hinting_programs(self, font):
+        options = self.options
+        glyf = font['glyf']
+        programs = {}
+        roots = []
+        for tag in ('fpgm', 'prep'):
+            if tag in font:
+                programs[tag] = font[tag].program.getBytecode()
+                roots.append(tag)
+        for gid, bytecode in glyf.glyph_programs():
+            programs[gid] = bytecode
+            roots.append(gid)
+        try:
+            analysis = hinting.HintingAnalysis(
+                programs, roots, interpret=options.interpret_hinting)
+        except hinting.HintingAnalysisError as e:
+            log.warning("Hinting programs not pruned: %s", e)
+            return
+
+        for tag in ('fpgm', 'prep'):
+            definitions = analysis.definitions.get(tag)
+            if not definitions:
+                continue
+            if tag in analysis.jumping:
+                log.info("'%s' functions not pruned: it jumps over them", tag)
+                continue
+            font[tag].program.fromBytecode(hinting.removeFunctionBodies(
+                programs[tag], definitions, analysis.functions))
+            log.info("'%s' functions pruned: %d of %d kept", tag,
+                     sum(1 for d in definitions if d[0] in analysis.functions),
+                     len(definitions))
+
+    def _prune_post_subset_table(self, font, tag):
+        if tag == 'OS/2' and self.options.prune_unicode_ranges:
+            old_uniranges = font[tag].getUnicodeRanges()
+            new_uniranges = font[tag].recalcUnicodeRanges(font, pruneOnly=True)
+            if old_uniranges != new_uniranges:
+                log.info("%s Unicode ranges pruned: %s", tag, sorted(new_uniranges))
+            if self.options.recalc_average_width:
+                widths = [m[0] for m in font["hmtx"].metrics.values() if m[0] > 0]
+                avg_width = int(round(sum(widths) / len(widths)))
+                if avg_width != font[tag].xAvgCharWidth:
+                    font[tag].xAvgCharWidth = avg_width
+                    log.info("%s xAvgCharWidth updated: %d", tag, avg_width)
+        clazz = ttLib.getTableClass(tag)
+        if hasattr(clazz, 'prune_post_subset'):
+            with timer("prune '%s'" % tag):
+                table = font[tag]
+                retain = table.prune_post_subset(self.options)
+            if not retain:
+                log.info("%s pruned to empty; dropped", tag)
+                del font[tag]
+            else:
+                log.info("%s pruned", tag)
+
+    # Tables that the glyph closure doesn't read, in the order they are
+    # released: 'OS/2' reads the subsetted 'hmtx' to recalculate
+    # xAvgCharWidth, so 'hmtx' is released after it.
+    _releasable_tables = ('name', 'post', 'GDEF', 'GPOS', 'kern', 'vmtx',
+                          'hdmx', 'hmtx', 'OS/2')
+
+    def _released_tables(self, font):
+        # XML output dumps the decompiled tables, not their data.
+        if not self.options.release_tables or self.options.xml:
+            return ()
+        released = self._releasable_tables
+        if self.options.recalc_bounds or font.recalcBBoxes:
+            # 'maxp', 'hhea' and 'vhea' read the metrics to recalculate
+            # their bounds when the font is saved.
+            released = tuple(t for t in released if t not in ('hmtx', 'vmtx'))
+        return [t for t in released if t in font]
+
+    def _release_tables(self, font):
+        """Loads, subsets and compiles the released tables one at a time,
+        keeping only their compiled data."""
+        released = self._released_tables(font)
+        for tag in released:
+            with timer("load '%s'" % tag):
+                self._load_unsubset_table(font, tag)
+            # Already dropped, if needed, by _prune_pre_subset().
+            for step in (self._prune_pre_subset_table,
+                         self._subset_glyphs_table,
+                         self._prune_post_subset_table):
+                if tag not in font:
+                    break
+                step(font, tag)
+            if tag != 'hmtx':
+                self._release_table(font, tag)
+        if 'hmtx' in released:
+            self._release_table(font, 'hmtx')
+        if released:
+            del self._unsubset_glyph_order
+
+    def _load_unsubset_table(self, font, tag):
+        # Decompiling the tables needs the original glyph order and
+        # number of glyphs.  'maxp' is set to the subsetted one, as it
+        # will be when compiled, for compiling 'post'.  Lazy loading is
+        # turned off, as the layout tables would otherwise decompile
+        # their subtables later, with the subsetted glyph order.
+        glyphOrder = font.getGlyphOrder()
+        font.setGlyphOrder(self._unsubset_glyph_order)
+        if 'maxp' in font:
+            font['maxp'].numGlyphs = len(self._unsubset_glyph_order)
+        lazy = font.lazy
+        font.lazy = False
+        try:
+            font[tag]
+        finally:
+            font.lazy = lazy
+            font.setGlyphOrder(glyphOrder)
+            font._buildReverseGlyphOrderDict()
+            if 'maxp' in font:
+                font['maxp'].numGlyphs = len(glyphOrder)
+
+    @staticmethod
+    def _release_table(font, tag):
+        if tag not in font:
+            return
+        with timer("compile '%s'" % tag):
+            table = DefaultTable(tag)
+            table.data = font.getTableData(tag)
+        font[tag] = table
+        log.info("%s compiled and released", tag)
 
     def _sort_tables(self, font):
         tagOrder = ['fvar', 'avar', 'gvar', 'name', 'glyf']
@@ -2916,7 +3590,205 @@ class Subsetter(object):
         self._closure_glyphs(font)
         self._subset_glyphs(font)
         self._prune_post_subset(font)
+        self._release_tables(font)
+
+    # Attributes set by _closure_glyphs() that _subset_glyphs() and
+    # _prune_post_subset() need.
+    _closure_attrs = ('unicodes_requested', 'glyphs_requested',
+                      'unicodes_missing', 'glyphs_missing',
+                      'glyphs_cmaped', 'glyphs_gsubed', 'glyphs_mathed',
+                      'glyphs_glyfed', 'glyphs_all')
+
+    def subset_many(self, font, requests, workers=None, ignore_errors=False):
+        """Produces several subsets of font with the same options.
+
+        Each request is a dict with any of the 'glyphs', 'gids', 'unicodes'
+        and 'text' keys, taken as the arguments of populate(), plus an
+        optional 'output_file'.  The glyphs and unicodes populated into
+        this subsetter are added to every request.
+
+        The font is pruned (in place) only once, and the glyph closure of
+        every request is computed on it, sharing its decompiled tables and
+        a ClosureCache (this subsetter's closure_cache, if set).
+        Subsetting, pruning and saving the fonts is then done on fresh
+        copies of the pruned font, in up to 'workers' processes.
+
+        Returns a list with, for each request, its 'output_file' if given,
+        or the compiled subset font as bytes otherwise.  If ignore_errors
+        is true, the errors of failed requests are logged rather than
+        raised, and these requests get None in the list."""
+
+        with timer("prune font for batch"):
+            self._prune_pre_subset(font)
+
+        closure_cache = self.closure_cache
+        if closure_cache is None:
+            closure_cache = ClosureCache()
+        results = [None] * len(requests)
+        items = []
+        for i, request in enumerate(requests):
+            unknown = set(request) - {'glyphs', 'gids', 'unicodes', 'text',
+                                      'output_file'}
+            if unknown:
+                raise self.SubsettingError(
+                    "Unknown subset request keys: %s" % sorted(unknown))
+            subsetter = Subsetter(options=self.options,
+                                  closure_cache=closure_cache)
+            subsetter.populate(glyphs=self.glyph_names_requested,
+                               gids=self.glyph_ids_requested,
+                               unicodes=self.unicodes_requested)
+            subsetter.populate(glyphs=request.get('glyphs', []),
+                               gids=request.get('gids', []),
+                               unicodes=request.get('unicodes', []),
+                               text=request.get('text', ""))
+            try:
+                subsetter._closure_glyphs(font)
+            except Exception as e:
+                if not ignore_errors:
+                    raise
+                _log_request_error(i, request.get('output_file'),
+                                   _format_error(e), traceback.format_exc())
+                continue
+            closure = {k: getattr(subsetter, k) for k in self._closure_attrs}
+            items.append((i, closure, request.get('output_file'),
+                          ignore_errors))
+
+        with timer("compile pruned font"):
+            # Bounds and timestamp are recalculated, if requested, when
+            # saving each subset font.
+            saved = font.recalcBBoxes, font.recalcTimestamp
+            font.recalcBBoxes = font.recalcTimestamp = False
+            buf = BytesIO()
+            try:
+                font.save(buf, reorderTables=None)
+            finally:
+                font.recalcBBoxes, font.recalcTimestamp = saved
+            state = (buf.getvalue(), font.getGlyphOrder(), self.options)
+            del buf
+
+        for (i, _, outfile, _), (result, error, tb) in zip(
+                items, mapInWorkers(_subset_batch_item, items, workers, state)):
+            if error is not None:
+                _log_request_error(i, outfile, error, tb)
+            results[i] = result
+        return results
+
+
+def _format_error(e):
+    return "%s: %s" % (type(e).__name__, e)
+
+def _log_request_error(i, outfile, error, tb):
+    log.error("Failed to subset request %d%s: %s", i,
+              " (%s)" % outfile if outfile is not None else "", error)
+    log.debug("%s", tb)
+
+def _subset_batch_item(state, item):
+    """Subsets one request of subset_many(); returns the result, and None
+    twice, or, if errors are ignored and the request failed, None, the
+    error message and its traceback."""
+    _, _, _, ignore_errors = item
+    if not ignore_errors:
+        return _subset_batch_request(state, item), None, None
+    try:
+        return _subset_batch_request(state, item), None, None
+    except Exception as e:
+        return None, _format_error(e), traceback.format_exc()
+
+def _subset_batch_request(state, item):
+    fontdata, glyphOrder, options = state
+    _, closure, outfile, _ = item
+
+    font = load_font(BytesIO(fontdata), options)
+    # Glyph names may not survive the round-trip, eg. if 'post' format
+    # 3.0 was forced when loading the original font.
+    font.setGlyphOrder(glyphOrder)
+
+    subsetter = Subsetter(options=options)
+    for k, v in closure.items():
+        setattr(subsetter, k, v)
+    subsetter._subset_glyphs(font)
+    subsetter._prune_post_subset(font)
+    subsetter._release_tables(font)
+
+    if outfile is None:
+        buf = BytesIO()
+        save_font(font, buf, options)
+        result = buf.getvalue()
+    else:
+        save_font(font, outfile, options)
+        result = outfile
+    font.close()
+    return result
+
 
+def _subset_file(state, item):
+    """Subsets one of several font files; returns the input file, the
+    output file, and an error message and its traceback, or None twice if
+    it succeeded.  state holds the subsetting options and the parsed glyph
+    and character lists."""
+    options, populate_args, wildcards = state
+    wildcard_glyphs, wildcard_unicodes, dontLoadGlyphNames = wildcards
+    fontfile, outfile = item
+    try:
+        font = load_font(fontfile, options,
+                         dontLoadGlyphNames=dontLoadGlyphNames)
+        glyphs = list(populate_args['glyphs'])
+        unicodes = list(populate_args['unicodes'])
+        if wildcard_glyphs:
+            glyphs.extend(font.getGlyphOrder())
+        if wildcard_unicodes:
+            for t in font['cmap'].tables:
+                if t.isUnicode():
+                    unicodes.extend(t.cmap.keys())
+        subsetter = Subsetter(options=options)
+        subsetter.populate(glyphs=glyphs, gids=populate_args['gids'],
+                           unicodes=unicodes, text=populate_args['text'])
+        subsetter.subset(font)
+        outdir = os.path.dirname(outfile)
+        if outdir and not os.path.isdir(outdir):
+            try:
+                os.makedirs(outdir)
+            except OSError:
+                if not os.path.isdir(outdir):  # Made by another worker?
+                    raise
+        save_font(font, outfile, options)
+        font.close()
+    except Exception as e:
+        # Tracebacks don't survive pickling: the worker formats it.
+        return fontfile, outfile, _format_error(e), traceback.format_exc()
+    return fontfile, outfile, None, None
+
+def _expand_font_files(patterns):
+    """Returns the font files named by a list of paths and glob patterns,
+    in order and without duplicates."""
+    import glob
+    fontfiles = []
+    for pattern in patterns:
+        if os.path.exists(pattern) or not glob.has_magic(pattern):
+            matches = [pattern]
+        else:
+            matches = sorted(glob.glob(pattern))
+            if not matches:
+                raise ValueError("No font files match '%s'" % pattern)
+        for path in matches:
+            if path not in fontfiles:
+                fontfiles.append(path)
+    return fontfiles
+
+def _output_file_name(template, fontfile):
+    """Returns the output file of fontfile, from a template in which
+    '{dir}', '{name}' and '{ext}' stand for the directory, name without
+    extension and extension of fontfile.  The default template is
+    '{dir}/{name}.subset{ext}'."""
+    dirname, basename = os.path.split(fontfile)
+    name, ext = os.path.splitext(basename)
+    if template is None:
+        return os.path.join(dirname, name + '.subset' + ext)
+    import re
+    fields = {'dir': dirname or os.curdir, 'name': name, 'ext': ext}
+    # Not str.format(), so that other braces in paths are kept as they are.
+    return re.sub(r"\{(dir|name|ext)\}", lambda m: fields[m.group(1)],
+                  template)
 
 @timer("load font")
 def load_font(fontFile,
@@ -2990,13 +3862,31 @@ def parse_gids(s):
 def parse_glyphs(s):
     return s.replace(',', ' ').split()
 
+def parse_batch_request(d):
+    """Converts one entry of a --batch JSON file to a subset_many() request."""
+    parsers = {'glyphs': parse_glyphs,
+               'gids': parse_gids,
+               'unicodes': parse_unicodes}
+    request = {}
+    for k,v in d.items():
+        if k == 'output-file':
+            request['output_file'] = v
+        elif k == 'text':
+            request['text'] = v
+        elif k in parsers:
+            request[k] = parsers[k](v) if isinstance(v, basestring) else list(v)
+        else:
+            raise ValueError("Unknown key in subset batch request: '%s'" % k)
+    if 'output_file' not in request:
+        raise ValueError("Subset batch request lacks 'output-file': %s" % d)
+    return request
+
 def usage():
     print("usage:", __usage__, file=sys.stderr)
     print("Try pyftsubset --help for more information.\n", file=sys.stderr)
 
 @timer("make one with everything (TOTAL TIME)")
 def main(args=None):
-    from os.path import splitext
     from fontTools import configLogger
 
     if args is None:
@@ -3013,7 +3903,8 @@ def main(args=None):
                             'glyphs', 'glyphs-file',
                             'text', 'text-file',
                             'unicodes', 'unicodes-file',
-                            'output-file'])
+                            'output-file', 'batch', 'jobs',
+                            'font-file'])
     except options.OptionError as e:
         usage()
         print("ERROR:", e, file=sys.stderr)
@@ -3033,8 +3924,10 @@ def main(args=None):
     args = args[1:]
 
     subsetter = Subsetter(options=options)
-    basename, extension = splitext(fontfile)
-    outfile = basename + '.subset' + extension
+    fontfile_patterns = [fontfile]
+    outfile = None
+    batch = None
+    jobs = 1
     glyphs = []
     gids = []
     unicodes = []
@@ -3048,6 +3941,23 @@ def main(args=None):
         if g.startswith('--output-file='):
             outfile = g[14:]
             continue
+        if g.startswith('--font-file='):
+            fontfile_patterns.append(g[12:])
+            continue
+        if g.startswith('--batch='):
+            batch = g[8:]
+            continue
+        if g.startswith('--jobs='):
+            try:
+                jobs = int(g[7:])
+            except ValueError:
+                jobs = 0
+            if jobs < 1:
+                usage()
+                print("ERROR: --jobs must be a number of at least 1: '%s'"
+                      % g[7:], file=sys.stderr)
+                return 2
+            continue
         if g.startswith('--text='):
             text += g[7:]
             continue
@@ -3083,7 +3993,64 @@ def main(args=None):
             continue
         glyphs.append(g)
 
-    dontLoadGlyphNames = not options.glyph_names and not glyphs
+    if batch is not None and outfile is not None:
+        print("ERROR: --output-file can't be used with --batch; give "
+              "each subset its \"output-file\" in the batch file",
+              file=sys.stderr)
+        return 2
+    if batch is not None and options.xml:
+        print("ERROR: --xml can't be used with --batch", file=sys.stderr)
+        return 2
+
+    requests = None
+    if batch is not None:
+        with open(batch, encoding='utf-8') as f:
+            requests = [parse_batch_request(r) for r in json.load(f)]
+
+    dontLoadGlyphNames = (not options.glyph_names and not glyphs and
+                          not any(r.get('glyphs') for r in requests or []))
+
+    try:
+        fontfiles = _expand_font_files(fontfile_patterns)
+    except ValueError as e:
+        print("ERROR:", e, file=sys.stderr)
+        return 2
+    if fontfiles != [fontfile]:
+        if batch is not None:
+            print("ERROR: --batch needs a single font file", file=sys.stderr)
+            return 2
+        if options.xml:
+            print("ERROR: --xml needs a single font file", file=sys.stderr)
+            return 2
+        if len(fontfiles) > 1 and outfile is not None and '{name}' not in outfile:
+            print("ERROR: --output-file must contain '{name}' when "
+                  "subsetting several font files", file=sys.stderr)
+            return 2
+        log.info("Text: '%s'" % text)
+        log.info("Unicodes: %s", unicodes)
+        log.info("Glyphs: %s", glyphs)
+        log.info("Gids: %s", gids)
+        items = [(f, _output_file_name(outfile, f)) for f in fontfiles]
+        populate_args = {'glyphs': glyphs, 'gids': gids,
+                         'unicodes': unicodes, 'text': text}
+        wildcards = (wildcard_glyphs, wildcard_unicodes, dontLoadGlyphNames)
+        results = mapInWorkers(_subset_file, items, jobs,
+                               (options, populate_args, wildcards))
+        failed = 0
+        for infile, outfile, error, tb in results:
+            if error is not None:
+                failed += 1
+                log.error("Failed to subset %s: %s", infile, error)
+                log.debug("%s", tb)
+            else:
+                log.info("Subset %s (%d bytes) to %s (%d bytes)",
+                         infile, os.path.getsize(infile),
+                         outfile, os.path.getsize(outfile))
+        return 1 if failed else 0
+
+    if outfile is None:
+        outfile = _output_file_name(None, fontfile)
+
     font = load_font(fontfile, options, dontLoadGlyphNames=dontLoadGlyphNames)
 
     with timer("compile glyph list"):
@@ -3101,12 +4068,23 @@ def main(args=None):
     log.info("Gids: %s", gids)
 
     subsetter.populate(glyphs=glyphs, gids=gids, unicodes=unicodes, text=text)
+
+    if requests is not None:
+        outfiles = subsetter.subset_many(font, requests, workers=jobs,
+                                         ignore_errors=True)
+        if options.verbose:
+            log.info("Input font:% 7d bytes: %s" % (os.path.getsize(fontfile), fontfile))
+            for outfile in outfiles:
+                if outfile is not None:
+                    log.info("Subset font:% 7d bytes: %s" % (os.path.getsize(outfile), outfile))
+        font.close()
+        return 1 if None in outfiles else 0
+
     subsetter.subset(font)
 
     save_font(font, outfile, options)
 
     if options.verbose:
-        import os
         log.info("Input font:% 7d bytes: %s" % (os.path.getsize(fontfile), fontfile))
         log.info("Subset font:% 7d bytes: %s" % (os.path.getsize(outfile), outfile))
 
@@ -3119,11 +4097,13 @@ def main(args=None):
 __all__ = [
     'Options',
     'Subsetter',
+    'ClosureCache',
     'load_font',
     'save_font',
     'parse_gids',
     'parse_glyphs',
     'parse_unicodes',
+    'parse_batch_request',
     'main'
 ]
 
@@ -0,0 +1,856 @@
+"""Find the 'fpgm' and 'prep' functions that TrueType hinting can call.
+
+The programs that can run in a font are 'fpgm', 'prep' and the glyph
+programs.  Most fonts call their functions with numbers pushed right before
+the CALL or LOOPCALL instruction; the functions that can be called are then
+found by following those calls from the programs, without running anything.
+
+Programs that compute their function numbers, or keep them in the storage
+area as the ones made by ttfautohint do, can instead be interpreted
+abstractly: stack values are tracked as the numbers they can be, so that
+the function numbers passed to CALL and LOOPCALL are known.  Functions are
+analysed at each call, with the caller's stack.  Values read from the
+storage area and the 'cvt ' table are those last written at the same
+location on the way there, where that is known, and otherwise any of the
+values written there.  This is much slower.
+
+Simple arithmetic on such values is computed too, as long as it gives few
+enough results; beyond that, only a range is kept for the value.  This
+follows function numbers that are kept in the storage area even when other
+values are written at computed locations: a write at a range of locations
+only affects the reads in that range.
+
+Whenever a function number can not be traced (a number measured from the
+outline, a jump with a computed offset, an instruction defined with IDEF,
+...) the analysis gives up, and callers should then keep the hinting
+programs as they are.
+"""
+from __future__ import print_function, division, absolute_import
+from fontTools.misc.py23 import *
+from fontTools.ttLib.tables import ttProgram
+from collections import namedtuple
+import struct
+import logging
+
+log = logging.getLogger("fontTools.subset.hinting")
+
+
+class HintingAnalysisError(Exception):
+    pass
+
+
+class _NotPushedError(HintingAnalysisError):
+    """A function number that is not pushed right before its use."""
+
+
+def _makeStackEffects():
+    effects = {}
+    for op, mnemonic, argBits, name, pops, pushes in ttProgram.instructions:
+        for i in range(1 << argBits):
+            effects[op+i] = (mnemonic, pops, pushes)
+    return effects
+
+_stackEffects = _makeStackEffects()
+
+# Instructions that pop as many points as the loop variable says.
+_loopInstructions = frozenset(['ALIGNRP', 'FLIPPT', 'IP', 'SHP', 'SHPIX'])
+
+_callOps = frozenset([0x2a, 0x2b])    # LOOPCALL, CALL
+_jumpOps = frozenset([0x1c, 0x78, 0x79])    # JMPR, JROT, JROF
+
+def _mul(a, b):
+    # F26Dot6 multiplication, rounded as FreeType does.
+    product = a * b
+    result = (abs(product) + 32) // 64
+    return -result if product < 0 else result
+
+def _div(a, b):
+    # F26Dot6 division, truncated as FreeType does.
+    result = abs(a) * 64 // abs(b)
+    return -result if (a < 0) != (b < 0) else result
+
+_arithmetic = {
+    'ADD': lambda a, b: a + b,
+    'SUB': lambda a, b: a - b,
+    'MUL': _mul,
+    'DIV': lambda a, b: _div(a, b) if b else None,
+    'MAX': max,
+    'MIN': min,
+    'NEG': lambda a: -a,
+    'ABS': abs,
+    'FLOOR': lambda a: a // 64 * 64,
+    'CEILING': lambda a: -(-a // 64) * 64,
+    'LT': lambda a, b: int(a < b),
+    'LTEQ': lambda a, b: int(a <= b),
+    'GT': lambda a, b: int(a > b),
+    'GTEQ': lambda a, b: int(a >= b),
+    'EQ': lambda a, b: int(a == b),
+    'NEQ': lambda a, b: int(a != b),
+    'AND': lambda a, b: int(bool(a and b)),
+    'OR': lambda a, b: int(bool(a or b)),
+    'NOT': lambda a: int(not a),
+}
+
+# Stack values are a frozenset of the numbers they can be, a _Range of
+# numbers, or None if nothing is known about them.  A bound of None is
+# unbounded.
+_Range = namedtuple('_Range', ['lo', 'hi'])
+
+def _inRange(value, r):
+    return (r.lo is None or value >= r.lo) and (r.hi is None or value <= r.hi)
+
+# Returned for values that aren't known from the way a program went.
+_unknown = object()
+
+# The storage area starts out as zeros.
+_unwritten = frozenset([0])
+
+# Most functions are short and called with few values above the ones
+# they read; these limits only stop runaway recursion and pathological
+# programs.  The steps are counted for each of the programs run.
+MAX_CALL_DEPTH = 64
+MAX_STACK_DEPTHS = 32
+MAX_STEPS = 1000000
+# Values that can be more numbers than this are only kept as a range.
+MAX_VALUES = 64
+
+
+def decodeBytecode(bytecode):
+    """Splits bytecode into instructions.
+
+    Returns a list of (offset, opcode, pushed) tuples, where pushed is
+    None for instructions that don't read the instruction stream, and a
+    list of (value, offset, width) tuples for push instructions.
+    """
+    code = bytearray(bytecode)
+    n = len(code)
+    instructions = []
+    i = 0
+    while i < n:
+        op = code[i]
+        if op in (0x40, 0x41):    # NPUSHB, NPUSHW
+            if i + 1 >= n:
+                raise HintingAnalysisError("truncated push at %d" % i)
+            count = code[i+1]
+            start = i + 2
+            width = 1 if op == 0x40 else 2
+        elif 0xB0 <= op <= 0xBF:    # PUSHB, PUSHW
+            count = (op & 7) + 1
+            start = i + 1
+            width = 1 if op < 0xB8 else 2
+        else:
+            instructions.append((i, op, None))
+            i += 1
+            continue
+        end = start + count * width
+        if end > n:
+            raise HintingAnalysisError("truncated push at %d" % i)
+        if width == 1:
+            pushed = [(code[j], j, 1) for j in range(start, end)]
+        else:
+            pushed = [(struct.unpack(">h", bytes(code[j:j+2]))[0], j, 2)
+                      for j in range(start, end, 2)]
+        instructions.append((i, op, pushed))
+        i = end
+    return instructions
+
+
+class _Program(object):
+
+    def __init__(self, key, bytecode):
+        self.key = key
+        self.instructions = decodeBytecode(bytecode)
+        self.indices = {pos: i for i, (pos, _, _) in enumerate(self.instructions)}
+        self.ifs = {}        # IF index -> (ELSE index or None, EIF index)
+        self.elses = {}      # ELSE index -> EIF index
+        self.ends = {}       # FDEF index -> ENDF index
+        blocks = []
+        for i, (_, op, pushed) in enumerate(self.instructions):
+            if pushed is not None:
+                continue
+            if op == 0x58:    # IF
+                blocks.append([op, i, None])
+            elif op == 0x1b:    # ELSE
+                if not blocks or blocks[-1][0] != 0x58 or blocks[-1][2] is not None:
+                    raise HintingAnalysisError("unmatched ELSE in %s" % (key,))
+                blocks[-1][2] = i
+            elif op == 0x59:    # EIF
+                if not blocks or blocks[-1][0] != 0x58:
+                    raise HintingAnalysisError("unmatched EIF in %s" % (key,))
+                _, start, else_ = blocks.pop()
+                self.ifs[start] = (else_, i)
+                if else_ is not None:
+                    self.elses[else_] = i
+            elif op in (0x2c, 0x89):    # FDEF, IDEF
+                if blocks:
+                    raise HintingAnalysisError("nested definition in %s" % (key,))
+                blocks.append([op, i, None])
+            elif op == 0x2d:    # ENDF
+                if len(blocks) != 1 or blocks[-1][0] not in (0x2c, 0x89):
+                    raise HintingAnalysisError("unmatched ENDF in %s" % (key,))
+                self.ends[blocks.pop()[1]] = i
+        if blocks:
+            raise HintingAnalysisError("unterminated block in %s" % (key,))
+
+    def pushedNumber(self, i, start, what):
+        """Returns the number pushed right before instruction i, which
+        must be at or after start."""
+        if i > start:
+            pushed = self.instructions[i-1][2]
+            if pushed:
+                return pushed[-1][0]
+        raise _NotPushedError("%s not pushed before its use in %s"
+                              % (what, self.key))
+
+    def calls(self, start, end):
+        """Returns the numbers of the functions called by the instructions
+        start to end, and whether those jump."""
+        calls = set()
+        jumps = False
+        for i in range(start, end):
+            op, pushed = self.instructions[i][1:]
+            if pushed is not None:
+                continue
+            if op in _callOps:
+                calls.add(self.pushedNumber(i, start, "function number"))
+            elif op in _jumpOps:
+                jumps = True
+        if jumps and calls:
+            # A jump could land on a call, past its push.
+            raise _NotPushedError("jump among calls in %s" % (self.key,))
+        return calls, jumps
+
+
+def _exact(value):
+    """Returns the number that value is, or None if it can be several or
+    isn't known."""
+    if isinstance(value, frozenset) and len(value) == 1:
+        return next(iter(value))
+    return None
+
+def _constants(value, what):
+    if not isinstance(value, frozenset):
+        raise HintingAnalysisError("computed %s" % what)
+    return value
+
+def _constant(value, what):
+    values = _constants(value, what)
+    if len(values) != 1:
+        raise HintingAnalysisError("ambiguous %s" % what)
+    return next(iter(values))
+
+def _range(value):
+    """Returns value as a _Range, or None if it isn't known at all."""
+    if isinstance(value, frozenset):
+        return _Range(min(value), max(value))
+    return value
+
+def _fromValues(values):
+    if len(values) > MAX_VALUES:
+        return _Range(min(values), max(values))
+    return frozenset(values)
+
+def _join(old, new):
+    """Returns the values that are either old or new.  Ranges are widened
+    where new goes beyond old, so that repeated joins settle."""
+    if old is new or old == new:
+        return old
+    if old is None or new is None:
+        return None
+    if isinstance(old, frozenset) and isinstance(new, frozenset):
+        return _fromValues(old | new)
+    old = _range(old)
+    new = _range(new)
+    lo = old.lo
+    if lo is not None and (new.lo is None or new.lo < lo):
+        lo = None
+    hi = old.hi
+    if hi is not None and (new.hi is None or new.hi > hi):
+        hi = None
+    return _Range(lo, hi)
+
+def _widen(old, new):
+    if old is new or old == new or old is None or new is None:
+        return _join(old, new)
+    return _join(_range(old), _range(new))
+
+def _compute(mnemonic, args):
+    """Returns the result of an arithmetic instruction."""
+    if all(isinstance(a, frozenset) for a in args):
+        results = set([()])
+        for a in args:
+            results = set(r + (v,) for r in results for v in a)
+        values = set(_arithmetic[mnemonic](*r) for r in results)
+        values.discard(None)
+        if values:
+            return _fromValues(values)
+        return None
+    # Only sums and differences are followed on ranges, enough for
+    # indices stepping through the storage area.
+    if any(a is None for a in args) or mnemonic not in ('ADD', 'SUB', 'NEG'):
+        return None
+    ranges = [_range(a) for a in args]
+    def add(x, y):
+        return None if x is None or y is None else x + y
+    def neg(r):
+        return _Range(None if r.hi is None else -r.hi,
+                      None if r.lo is None else -r.lo)
+    if mnemonic == 'NEG':
+        return neg(ranges[0])
+    a, b = ranges
+    if mnemonic == 'SUB':
+        b = neg(b)
+    return _Range(add(a.lo, b.lo), add(a.hi, b.hi))
+
+def _merge(a, b, widen=False):
+    """Merges the states of two paths.  Where the stack depths differ, only
+    the top of the stacks is kept, and the values below become unknown.
+    With widen, only ranges are kept for the values that differ."""
+    if a is None or a == b:
+        return b
+    join = _widen if widen else _join
+    stackA, loopA, bottomA, localA = a
+    stackB, loopB, bottomB, localB = b
+    if stackA == stackB:
+        stack = stackA
+        bottom = bottomA or bottomB
+    else:
+        n = min(len(stackA), len(stackB))
+        bottom = bottomA or bottomB or len(stackA) != len(stackB)
+        stack = tuple(x if x is y else join(x, y)
+                      for x, y in zip(stackA[len(stackA)-n:],
+                                      stackB[len(stackB)-n:]))
+    if localA == localB:
+        local = localA
+    else:
+        # Locations written on only one of the paths are read as
+        # anything written there.
+        writtenB = dict(localB)
+        local = tuple(
+            (l, v if v is writtenB[l] else join(v, writtenB[l]))
+            for l, v in localA if l in writtenB)
+    return stack, (loopA if loopA == loopB else None), bottom, local
+
+
+# Marks, in the storage locations that a program read or that changed,
+# any of the locations.
+_anywhere = object()
+
+
+class HintingAnalysis(object):
+    """Results of analysing the hinting programs of a font.
+
+    functions: the numbers of the functions that can be called.
+    definitions: {program key: [(function number, FDEF offset, ENDF offset)]}
+        for the functions defined in each program.
+    jumping: the keys of the programs that jump outside of functions;
+        removing function bodies from those would break the jumps.
+    """
+
+    def __init__(self, programs, roots, interpret=False):
+        """programs maps keys to bytecode; roots lists the keys of the
+        programs that are run, in the order they are run.  Functions
+        defined in a program are available to those that follow.
+
+        The calls are followed from the function numbers pushed before
+        them.  If some function number isn't pushed right there, the
+        programs are interpreted if interpret is true, and
+        HintingAnalysisError is raised otherwise."""
+        self._programs = {}
+        for key in roots:
+            self._programs[key] = _Program(key, programs[key])
+        try:
+            self._followCalls(roots)
+        except _NotPushedError:
+            if not interpret:
+                raise
+            self._interpret(roots, programs)
+
+    def _followCalls(self, roots):
+        self.functions = set()
+        self.definitions = {}
+        self.jumping = set()
+        bodies = {}    # number -> [(program, FDEF index)]
+        work = []
+        for key in roots:
+            program = self._programs[key]
+            start = 0
+            for fdef in sorted(program.ends) + [len(program.instructions)]:
+                calls, jumps = program.calls(start, fdef)
+                work.extend(calls)
+                if jumps:
+                    self.jumping.add(key)
+                if fdef == len(program.instructions):
+                    break
+                if program.instructions[fdef][1] == 0x89:
+                    raise HintingAnalysisError("IDEF in %s" % (key,))
+                number = program.pushedNumber(fdef, start, "function number")
+                end = program.ends[fdef]
+                bodies.setdefault(number, []).append((program, fdef))
+                self.definitions.setdefault(key, []).append(
+                    (number, program.instructions[fdef][0],
+                     program.instructions[end][0]))
+                start = end + 1
+        while work:
+            number = work.pop()
+            if number in self.functions:
+                continue
+            if number not in bodies:
+                raise HintingAnalysisError("undefined function %d" % number)
+            self.functions.add(number)
+            for program, fdef in bodies[number]:
+                work.extend(program.calls(fdef + 1, program.ends[fdef])[0])
+
+    def _interpret(self, roots, programs):
+        """Finds the functions by interpreting the programs.
+
+        'fpgm' and 'prep', at the start of roots, run one after the other;
+        the programs that follow them (the glyph programs) can run in any
+        order, each starting from the storage area and 'cvt ' values
+        that 'prep' leaves, as changed by any of the others."""
+        self._storage = {}    # location -> values written there
+        self._storageRanges = {}    # range of locations -> values written
+        self._storageWild = False    # written at an unknown location
+        # Writes made by the glyph programs: (kind, location) -> values,
+        # and the (kind, range) and kinds written at computed locations.
+        self._glyphWrites = {}
+        self._glyphRanges = set()
+        self._glyphWild = set()
+        self.functions = set()
+        self.jumping = set()
+        setup = 0
+        while setup < len(roots) and roots[setup] in ('fpgm', 'prep'):
+            setup += 1
+        # Values read from the storage area are also any written at the
+        # same location elsewhere, so run the programs again until that
+        # is stable.  Only the glyph programs that read the locations that
+        # changed need to run again, and each glyph program only once.
+        reads = {}    # glyph program key -> storage locations read
+        entry = None
+        changed = None    # locations changed by the last pass; None for all
+        more = True
+        while more:
+            self._changed = set()
+            self._glyphsChanged = False
+            self._functions = {}    # number -> (program, FDEF index)
+            self._cache = {}
+            self.definitions = {}
+            ran = {}    # bytecode -> storage locations read
+            local = ()
+            for n, key in enumerate(roots):
+                self._inGlyph = n >= setup
+                if n == setup:
+                    local = self._glyphEntry(local)
+                    if local != entry:
+                        entry = local
+                        changed = None
+                if self._inGlyph:
+                    bytecode = programs[key]
+                    if bytecode in ran:
+                        reads[key] = ran[bytecode]
+                        continue
+                    if changed is not None and not self._affected(reads[key], changed):
+                        ran[bytecode] = reads[key]
+                        continue
+                program = self._programs[key]
+                self._steps = 0
+                self._reads = set()
+                exit = self._run(program, 0, len(program.instructions),
+                                 ((), 1, False, local), 0)
+                if self._inGlyph:
+                    reads[key] = ran[bytecode] = self._reads
+                else:
+                    local = exit[3] if exit is not None else ()
+            # The writes of the glyph programs only change what the next
+            # ones start from, which is compared above.
+            changed = self._changed
+            more = bool(changed) or self._glyphsChanged
+
+    @staticmethod
+    def _affected(reads, changed):
+        if not reads:
+            return False
+        return (_anywhere in changed or _anywhere in reads or
+                not reads.isdisjoint(changed))
+
+    def _glyphEntry(self, local):
+        """Returns the values known at the start of the glyph programs,
+        from those known at the end of 'prep'."""
+        entry = []
+        for (kind, l), value in local:
+            if kind in self._glyphWild or any(
+                    k == kind and _inRange(l, r) for k, r in self._glyphRanges):
+                continue
+            if (kind, l) in self._glyphWrites:
+                value = _join(value, self._glyphWrites[kind, l])
+            entry.append(((kind, l), value))
+        return tuple(entry)
+
+    def _recordGlyphWrite(self, kind, location, value):
+        if location is None:
+            if kind not in self._glyphWild:
+                self._glyphWild.add(kind)
+                self._glyphsChanged = True
+        elif isinstance(location, _Range):
+            if (kind, location) not in self._glyphRanges:
+                self._glyphRanges.add((kind, location))
+                self._glyphsChanged = True
+        else:
+            for l in _constants(location, "%s index" % kind):
+                old = self._glyphWrites.get((kind, l), value)
+                new = _join(old, value)
+                if (kind, l) not in self._glyphWrites or new != old:
+                    self._glyphWrites[kind, l] = new
+                    self._glyphsChanged = True
+
+    def _writeLocal(self, kind, location, value, local):
+        """Returns the values written on the way, local, updated with a
+        write of value at location."""
+        if self._inGlyph:
+            self._recordGlyphWrite(kind, location, value)
+        if location is None:
+            return tuple((k, v) for k, v in local if k[0] != kind)
+        if isinstance(location, _Range):
+            return tuple((k, v) for k, v in local
+                         if k[0] != kind or not _inRange(k[1], location))
+        written = dict(local)
+        locations = _constants(location, "%s index" % kind)
+        if len(locations) == 1:
+            written[kind, next(iter(locations))] = value
+        else:
+            for l in locations:
+                if (kind, l) in written:
+                    written[kind, l] = _join(written[kind, l], value)
+        return tuple(sorted(written.items()))
+
+    def _readLocal(self, kind, location, local):
+        """Returns the value at location written on the way, or _unknown
+        if that isn't known."""
+        if not isinstance(location, frozenset):
+            return _unknown
+        written = dict(local)
+        values = []
+        for l in location:
+            if (kind, l) not in written:
+                return _unknown
+            values.append(written[kind, l])
+        value = values[0]
+        for v in values[1:]:
+            value = _join(value, v)
+        return value
+
+    def _write(self, location, value, local):
+        """Records a write to the storage area, and returns the values
+        written on the way, local, updated with it."""
+        local = self._writeLocal('storage', location, value, local)
+        if location is None:
+            # Could be anywhere: all reads become unknown.
+            if not self._storageWild:
+                self._storageWild = True
+                self._changed.add(_anywhere)
+            return local
+        if isinstance(location, _Range):
+            storage, locations = self._storageRanges, [location]
+        else:
+            storage = self._storage
+            locations = _constants(location, "storage location")
+        for l in locations:
+            if l in storage:
+                old = storage[l]
+                new = _join(old, value)
+            elif storage is self._storage:
+                old = _unwritten
+                new = _join(old, value)
+            else:
+                old, new = None, value
+            if l not in storage or new != old:
+                storage[l] = new
+                self._changed.add(l if storage is self._storage else _anywhere)
+        return local
+
+    def _read(self, location, local):
+        value = self._readLocal('storage', location, local)
+        if value is not _unknown:
+            return value
+        if location is None or self._storageWild:
+            self._reads.add(_anywhere)
+            return None
+        if isinstance(location, _Range):
+            self._reads.add(_anywhere)
+            locations = [l for l in self._storage if _inRange(l, location)]
+            # Some of the range may not have been written.
+            values = [_unwritten]
+        else:
+            locations = _constants(location, "storage location")
+            self._reads.update(locations)
+            location = _range(location)
+            values = []
+        values.extend(self._storage.get(l, _unwritten) for l in locations)
+        lo, hi = location
+        for (rangeLo, rangeHi), written in self._storageRanges.items():
+            if ((lo is None or rangeHi is None or rangeHi >= lo) and
+                (hi is None or rangeLo is None or rangeLo <= hi)):
+                values.append(written)
+        value = values[0]
+        for written in values[1:]:
+            value = _join(value, written)
+        return value
+
+    def _readCvt(self, index, local):
+        # The 'cvt ' table values themselves aren't followed.
+        value = self._readLocal('cvt', index, local)
+        return None if value is _unknown else value
+
+    def _run(self, program, start, end, state, depth):
+        """Runs program.instructions[start:end] from state, and returns
+        the merged state at the end, or None if the end is not reached.
+
+        The states reaching an instruction with different stack depths
+        are kept apart, up to MAX_STACK_DEPTHS of them, so that loops
+        that take a value off the stack each time, until DEPTH says it
+        is done, are followed exactly."""
+        states = {}    # instruction index -> {stack depth: state}
+        work = []
+
+        def add(j, new):
+            split = states.setdefault(j, {})
+            key = (len(new[0]), new[2])
+            if key not in split and None not in split:
+                if len(split) < MAX_STACK_DEPTHS:
+                    split[key] = new
+                    work.append((j, key))
+                    return
+                # Too many: merge them all from now on.
+                for other in split.values():
+                    new = _merge(other, new)
+                split.clear()
+            if None in split:
+                key = None
+            old = split.get(key)
+            merged = _merge(old, new)
+            if merged != old:
+                split[key] = merged
+                work.append((j, key))
+
+        add(start, state)
+        exit = None
+        while work:
+            i, key = work.pop()
+            split = states[i]
+            if key not in split:
+                continue
+            for j, new in self._step(program, i, split[key], depth):
+                if j is None or j == end:
+                    exit = _merge(exit, new)
+                    continue
+                if not start <= j < end:
+                    raise HintingAnalysisError("jump out of %s" % (program.key,))
+                add(j, new)
+        return exit
+
+    def _call(self, number, state, depth):
+        if number not in self._functions:
+            raise HintingAnalysisError("undefined function %d" % number)
+        if depth >= MAX_CALL_DEPTH:
+            raise HintingAnalysisError("call depth exceeded")
+        self.functions.add(number)
+        key = (number, state)
+        if key not in self._cache:
+            program, fdef = self._functions[number]
+            reads = self._reads
+            self._reads = set()
+            exit = self._run(program, fdef + 1, program.ends[fdef],
+                             state, depth + 1)
+            self._cache[key] = (exit, self._reads)
+            self._reads = reads
+        exit, reads = self._cache[key]
+        self._reads.update(reads)
+        return exit
+
+    def _step(self, program, i, state, depth):
+        self._steps += 1
+        if self._steps > MAX_STEPS:
+            raise HintingAnalysisError("too many steps")
+        pos, op, pushed = program.instructions[i]
+        stack, loop, bottom, local = state
+        if pushed is not None:
+            values = tuple(frozenset([value]) for value, _, _ in pushed)
+            return [(i + 1, (stack + values, loop, bottom, local))]
+
+        try:
+            mnemonic, pops, pushes = _stackEffects[op]
+        except KeyError:
+            raise HintingAnalysisError("undefined instruction 0x%02x" % op)
+        stack = list(stack)
+
+        def pop():
+            if not stack:
+                if bottom:
+                    return None
+                raise HintingAnalysisError("stack underflow in %s" % (program.key,))
+            return stack.pop()
+
+        def jumpTarget(offset):
+            target = program.indices.get(pos + offset)
+            if target is None:
+                raise HintingAnalysisError("bad jump in %s" % (program.key,))
+            return target
+
+        if mnemonic in ('JMPR', 'JROT', 'JROF') and not depth:
+            self.jumping.add(program.key)
+
+        if mnemonic == 'IF':
+            value = pop()
+            else_, eif = program.ifs[i]
+            state = (tuple(stack), loop, bottom, local)
+            targets = []
+            if isinstance(value, frozenset):
+                conditions = set(bool(v) for v in value)
+            else:
+                conditions = (True, False)
+            if True in conditions:
+                targets.append((i + 1, state))
+            if False in conditions:
+                targets.append(((else_ if else_ is not None else eif) + 1, state))
+            return targets
+        elif mnemonic == 'ELSE':
+            return [(program.elses[i] + 1, (tuple(stack), loop, bottom, local))]
+        elif mnemonic in ('FDEF', 'IDEF'):
+            if depth or mnemonic == 'IDEF':
+                raise HintingAnalysisError("%s in %s" % (mnemonic, program.key))
+            number = _constant(pop(), "function number")
+            end = program.ends[i]
+            self._functions[number] = (program, i)
+            self.definitions.setdefault(program.key, []).append(
+                (number, pos, program.instructions[end][0]))
+            return [(end + 1, (tuple(stack), loop, bottom, local))]
+        elif mnemonic == 'ENDF':
+            raise HintingAnalysisError("ENDF outside a function")
+        elif mnemonic == 'JMPR':
+            target = jumpTarget(_constant(pop(), "jump offset"))
+            return [(target, (tuple(stack), loop, bottom, local))]
+        elif mnemonic in ('JROT', 'JROF'):
+            value = pop()
+            target = jumpTarget(_constant(pop(), "jump offset"))
+            state = (tuple(stack), loop, bottom, local)
+            if isinstance(value, frozenset):
+                conditions = set(bool(v) for v in value)
+            else:
+                conditions = (True, False)
+            jump = mnemonic == 'JROT'
+            targets = []
+            if (not jump) in conditions:
+                targets.append((i + 1, state))
+            if jump in conditions:
+                targets.append((target, state))
+            return targets
+        elif mnemonic == 'CALL':
+            value = pop()
+            state = (tuple(stack), loop, bottom, local)
+            exit = None
+            for number in _constants(value, "function number"):
+                new = self._call(number, state, depth)
+                if new is not None:
+                    exit = _merge(exit, new)
+            return [(i + 1, exit)] if exit is not None else []
+        elif mnemonic == 'LOOPCALL':
+            number = _constant(pop(), "function number")
+            count = _exact(pop())
+            state = (tuple(stack), loop, bottom, local)
+            if count is not None:
+                for _ in range(max(0, count)):
+                    state = self._call(number, state, depth)
+                    if state is None:
+                        return []
+                return [(i + 1, state)]
+            # Unknown count: iterate until the merged state is stable,
+            # keeping only ranges for the values that change.
+            while True:
+                new = self._call(number, state, depth)
+                if new is None:
+                    return [(i + 1, state)]
+                merged = _merge(state, new, widen=True)
+                if merged == state:
+                    return [(i + 1, state)]
+                state = merged
+        elif mnemonic == 'SLOOP':
+            loop = _exact(pop())
+            return [(i + 1, (tuple(stack), loop, bottom, local))]
+        elif mnemonic in _loopInstructions:
+            if loop is None:
+                raise HintingAnalysisError("computed loop count")
+            for _ in range(loop + (mnemonic == 'SHPIX')):
+                pop()
+            return [(i + 1, (tuple(stack), 1, bottom, local))]
+        elif mnemonic.startswith('DELTA'):
+            count = _constant(pop(), "delta count")
+            for _ in range(count):
+                if mnemonic.startswith('DELTAC'):
+                    local = self._writeLocal('cvt', pop(), None, local)
+                else:
+                    pop()
+                pop()
+        elif mnemonic == 'WS':
+            value = pop()
+            location = pop()
+            local = self._write(location, value, local)
+        elif mnemonic == 'RS':
+            stack.append(self._read(pop(), local))
+        elif mnemonic == 'CLEAR':
+            del stack[:]
+            bottom = False
+        elif mnemonic == 'DEPTH':
+            stack.append(None if bottom else frozenset([len(stack)]))
+        elif mnemonic == 'POP':
+            pop()
+        elif mnemonic == 'DUP':
+            value = pop()
+            stack.extend([value, value])
+        elif mnemonic == 'SWAP':
+            a = pop()
+            b = pop()
+            stack.extend([a, b])
+        elif mnemonic == 'ROLL':
+            a = pop()
+            b = pop()
+            c = pop()
+            stack.extend([b, a, c])
+        elif mnemonic in ('CINDEX', 'MINDEX'):
+            k = _constant(pop(), "stack index")
+            if 0 < k <= len(stack):
+                value = stack[-k]
+                if mnemonic == 'MINDEX':
+                    del stack[-k]
+            elif k > 0 and bottom:
+                value = None
+            else:
+                raise HintingAnalysisError("bad stack index in %s" % (program.key,))
+            stack.append(value)
+        elif mnemonic == 'RCVT':
+            stack.append(self._readCvt(pop(), local))
+        elif mnemonic in ('WCVTP', 'WCVTF'):
+            value = pop()
+            index = pop()
+            if mnemonic == 'WCVTF':
+                # Scaled from font units.
+                value = None
+            local = self._writeLocal('cvt', index, value, local)
+        elif mnemonic in _arithmetic:
+            args = [pop() for _ in range(pops)][::-1]
+            stack.append(_compute(mnemonic, args))
+        else:
+            for _ in range(pops):
+                pop()
+            stack.extend([None] * pushes)
+        return [(i + 1, (tuple(stack), loop, bottom, local))]
+
+
+def removeFunctionBodies(bytecode, definitions, keep):
+    """Returns bytecode with the bodies of the functions not in keep
+    removed.  The definitions, empty, stay in place so that the numbering
+    and the pushes of function numbers are unchanged."""
+    code = bytearray(bytecode)
+    for number, fdef, endf in sorted(definitions, key=lambda d: -d[1]):
+        if number not in keep:
+            del code[fdef+1:endf]
+    return bytes(code)
@@ -0,0 +1,379 @@
+"""Plan unicode-range slices of a webfont.
+
+Browsers only download the faces of a family whose unicode-range matches
+characters used on the page.  This module splits the characters of a font
+into slices such that the expected number of bytes downloaded per page is
+small, given how likely each character is to appear on a page.  Characters
+that interact through 'GSUB' (ligatures, alternates, contextual forms) are
+kept in the same slice, since shaping never crosses font boundaries.
+
+The resulting plan can be written out as a pyftsubset --batch file and as
+@font-face rules for the slices.
+"""
+from __future__ import print_function, division, absolute_import
+from fontTools.misc.py23 import *
+from fontTools import subset
+from fontTools.ttLib.tables import otTables
+import sys
+import json
+import math
+import logging
+
+log = logging.getLogger("fontTools.subset.slicer")
+
+
+# Approximate per-glyph cost beside outline data: 'hmtx' and 'loca'
+# entries, and some of the subset font's table overhead.
+GLYPH_OVERHEAD = 8
+
+
+def _find(parent, g):
+    root = g
+    while parent.get(root, root) != root:
+        root = parent[root]
+    while g != root:
+        parent[g], g = root, parent.get(g, g)
+    return root
+
+def _union(parent, glyphs):
+    glyphs = iter(glyphs)
+    try:
+        first = _find(parent, next(glyphs))
+    except StopIteration:
+        return
+    for g in glyphs:
+        root = _find(parent, g)
+        if root != first:
+            parent[root] = first
+
+def _union_subtable(parent, st):
+    """Merges the glyphs that a 'GSUB' subtable makes interact."""
+    if isinstance(st, otTables.ExtensionSubst):
+        _union_subtable(parent, st.ExtSubTable)
+    elif isinstance(st, otTables.SingleSubst):
+        for g,v in st.mapping.items():
+            _union(parent, (g, v))
+    elif isinstance(st, otTables.MultipleSubst):
+        for g,v in st.mapping.items():
+            _union(parent, [g] + list(v))
+    elif isinstance(st, otTables.AlternateSubst):
+        for g,v in st.alternates.items():
+            _union(parent, [g] + list(v))
+    elif isinstance(st, otTables.LigatureSubst):
+        for g,seqs in st.ligatures.items():
+            for seq in seqs:
+                _union(parent, [g, seq.LigGlyph] + list(seq.Component))
+    elif isinstance(st, otTables.ReverseChainSingleSubst):
+        if st.Format == 1:
+            for g,v in zip(st.Coverage.glyphs, st.Substitute):
+                _union(parent, (g, v))
+    else:
+        # Contextual; keep all glyphs that the rules look at together.
+        deps = st.closure_deps()
+        if deps is None:
+            log.warning("Contextual lookup matches any glyph; "
+                        "its rules may be split across slices")
+        else:
+            _union(parent, deps)
+
+def _glyph_sizes(font):
+    """Returns dict of estimated bytes each glyph adds to a font."""
+    sizes = {}
+    if 'glyf' in font:
+        glyf = font['glyf']
+        for g in font.getGlyphOrder():
+            glyph = glyf.glyphs.get(g)
+            if glyph is None:
+                size = 0
+            elif hasattr(glyph, 'data'):
+                size = len(glyph.data)
+            else:
+                size = len(glyph.compile(glyf, recalcBBoxes=False))
+            sizes[g] = size + GLYPH_OVERHEAD
+    elif 'CFF ' in font:
+        cff = font['CFF '].cff
+        cs = cff[cff.fontNames[0]].CharStrings
+        offsets = getattr(cs, 'charStringsIndex', None)
+        offsets = getattr(offsets, 'offsets', None)
+        for g in font.getGlyphOrder():
+            if g not in cs:
+                size = 0
+            elif cs.charStringsAreIndexed and offsets:
+                i = cs.charStrings[g]
+                size = offsets[i + 1] - offsets[i]
+            else:
+                c = cs[g]
+                c.compile()
+                size = len(c.bytecode)
+            sizes[g] = size + GLYPH_OVERHEAD
+    else:
+        for g in font.getGlyphOrder():
+            sizes[g] = GLYPH_OVERHEAD
+    return sizes
+
+def _glyph_components(font):
+    """Returns dict of the glyphs that each composite glyph uses."""
+    components = {}
+    if 'glyf' in font:
+        glyf = font['glyf']
+        for g,glyph in glyf.glyphs.items():
+            names = glyph.getComponentNames(glyf)
+            if names:
+                components[g] = names
+    return components
+
+def plan_slices(font, frequencies=None, options=None,
+                default_frequency=0.001, slice_overhead=2000,
+                rule_overhead=150, max_slice_size=64000):
+    """Splits the characters of font into unicode-range slices.
+
+    'frequencies' maps codepoints to the probability that a page uses
+    that character; characters not listed get 'default_frequency'.
+    The slices are chosen to minimize the expected bytes downloaded per
+    page, counting 'slice_overhead' bytes per slice that is downloaded,
+    and 'rule_overhead' bytes of @font-face rule per slice, which every
+    page downloads.  The components of composite glyphs are counted in
+    every slice that uses them, but once per slice.
+    Slices grow up to about 'max_slice_size' bytes of glyph data, but a
+    group of characters that must stay together is never split.
+
+    'options' are the subset.Options that the slices will be subset with;
+    the font is pruned with them in place.
+
+    Returns a list of slices, each a sorted list of codepoints."""
+
+    if frequencies is None:
+        frequencies = {}
+    if options is None:
+        options = subset.Options()
+    subsetter = subset.Subsetter(options=options)
+    subsetter._prune_pre_subset(font)
+
+    cmap = {}
+    for t in font['cmap'].tables:
+        if t.isUnicode() and t.format != 14:
+            cmap.update(t.cmap)
+
+    parent = {}
+    if 'GSUB' in font and font['GSUB'].table.LookupList:
+        for lookup in font['GSUB'].table.LookupList.Lookup:
+            if not lookup: continue
+            for st in lookup.SubTable:
+                if st:
+                    _union_subtable(parent, st)
+
+    # Group characters whose glyphs interact, and collect the glyphs each
+    # group pulls in, components included.
+    sizes = _glyph_sizes(font)
+    groups = {}
+    for u,g in cmap.items():
+        groups.setdefault(_find(parent, g), []).append(u)
+    group_glyphs = {}
+    for g in sizes:
+        root = _find(parent, g)
+        if root in groups:
+            group_glyphs.setdefault(root, set()).add(g)
+    components = _glyph_components(font)
+    users = {}
+    for root,glyphs in group_glyphs.items():
+        stack = list(glyphs)
+        while stack:
+            for c in components.get(stack.pop(), ()):
+                if c not in glyphs:
+                    glyphs.add(c)
+                    stack.append(c)
+        for g in glyphs:
+            users[g] = users.get(g, 0) + 1
+
+    # Most likely groups first; that way each slice collects characters of
+    # similar likelihood.  Without data, this keeps codepoint order, which
+    # keeps unicode-range descriptors compact.
+    # Each item has the size of the glyphs only its group uses, and the
+    # glyphs it shares with other groups, which are counted once per slice.
+    items = []
+    for root,unicodes in groups.items():
+        unicodes.sort()
+        log_q = 0.
+        for u in unicodes:
+            p = min(frequencies.get(u, default_frequency), 1. - 1e-12)
+            log_q += math.log1p(-p)
+        glyphs = group_glyphs.get(root, ())
+        size = sum(sizes.get(g, 0) for g in glyphs if users[g] == 1)
+        shared = [g for g in glyphs if users[g] > 1]
+        items.append((log_q, unicodes[0], unicodes, size, shared))
+    items.sort()
+
+    # Partition the sorted groups into runs, minimizing the sum over runs
+    # of rule_overhead + P(run needed) * (slice_overhead + size(run)).
+    # Runs ending at j are grown one group at a time, so each candidate
+    # run costs the number of glyphs its new group shares.
+    n = len(items)
+    log_q_sums = [0.]
+    for item in items:
+        log_q_sums.append(log_q_sums[-1] + item[0])
+    best = [0.] + [None] * n
+    start = [0] * (n + 1)
+    for j in range(1, n + 1):
+        i = j - 1
+        size = 0
+        seen = set()
+        while True:
+            item = items[i]
+            size += item[3]
+            for g in item[4]:
+                if g not in seen:
+                    seen.add(g)
+                    size += sizes.get(g, 0)
+            prob = -math.expm1(log_q_sums[j] - log_q_sums[i])
+            cost = best[i] + rule_overhead + prob * (slice_overhead + size)
+            if best[j] is None or cost < best[j]:
+                best[j] = cost
+                start[j] = i
+            i -= 1
+            if i < 0 or size + items[i][3] > max_slice_size:
+                break
+
+    slices = []
+    j = n
+    while j:
+        i = start[j]
+        slices.append(sorted(u for item in items[i:j] for u in item[2]))
+        j = i
+    slices.reverse()
+
+    log.info("Planned %d slices; expected %d bytes per page",
+             len(slices), best[n])
+    return slices
+
+def unicode_range(unicodes):
+    """Returns a CSS unicode-range value for the codepoints."""
+    ranges = []
+    for u in sorted(unicodes):
+        if ranges and ranges[-1][1] + 1 == u:
+            ranges[-1][1] = u
+        else:
+            ranges.append([u, u])
+    return ", ".join("U+%X" % s if s == e else "U+%X-%X" % (s, e)
+                     for s,e in ranges)
+
+def batch_requests(slices, output_file):
+    """Returns pyftsubset --batch entries for the slices.
+
+    'output_file' is a template for str.format(); '{index}' is replaced
+    with the index of the slice."""
+    return [{"output-file": output_file.format(index=i),
+             "unicodes": unicode_range(unicodes).replace("U+", "")}
+            for i,unicodes in enumerate(slices)]
+
+def font_face_rules(slices, family, url, format=None, descriptors=None):
+    """Returns CSS @font-face rules for the slices.
+
+    'url' is a template for str.format(); '{index}' is replaced with the
+    index of the slice.  'descriptors' is an optional dict of more
+    descriptors to add to each rule, eg. {'font-weight': '400'}."""
+    src = "url(%s)" % url
+    if format:
+        src += " format('%s')" % format
+    rules = []
+    for i,unicodes in enumerate(slices):
+        lines = ["@font-face {",
+                 "  font-family: '%s';" % family]
+        for k,v in sorted((descriptors or {}).items()):
+            lines.append("  %s: %s;" % (k, v))
+        lines.append("  src: %s;" % src.format(index=i))
+        lines.append("  unicode-range: %s;" % unicode_range(unicodes))
+        lines.append("}")
+        rules.append("\n".join(lines))
+    return "\n\n".join(rules) + "\n"
+
+def parse_frequencies(d):
+    """Converts a JSON object of character frequencies to a dict of
+    codepoints to frequencies.  Keys are either single characters, or
+    hexadecimal codepoints prefixed with 'U+', so that eg. "7" is the
+    digit seven and "U+7" is U+0007."""
+    frequencies = {}
+    for k,v in d.items():
+        if k[:2] in ("U+", "u+"):
+            u = int(k[2:], 16)
+        elif len(k) == 1:
+            u = ord(k)
+        else:
+            raise ValueError("Expected a single character or 'U+' and a "
+                             "hexadecimal codepoint; got %r" % k)
+        frequencies[u] = float(v)
+    return frequencies
+
+
+def main(args=None):
+    """Plan unicode-range slices of a webfont"""
+    from argparse import ArgumentParser
+    from fontTools import configLogger
+
+    parser = ArgumentParser(prog='fonttools subset.slicer',
+                            description=main.__doc__)
+    parser.add_argument('font', help="Input font file.")
+    parser.add_argument('--frequencies', metavar='JSON',
+                        help="JSON file mapping characters, or U+ hex "
+                        "codepoints, to the probability that a page uses them.")
+    parser.add_argument('--default-frequency', type=float, default=0.001,
+                        help="Probability assumed for characters not in "
+                        "--frequencies. [default: %(default)s]")
+    parser.add_argument('--slice-overhead', type=int, default=2000,
+                        help="Bytes each downloaded slice costs beside its "
+                        "glyphs. [default: %(default)s]")
+    parser.add_argument('--rule-overhead', type=int, default=150,
+                        help="Bytes of CSS each slice's @font-face rule "
+                        "costs every page. [default: %(default)s]")
+    parser.add_argument('--max-slice-size', type=int, default=64000,
+                        help="Approximate maximum bytes of glyph data per "
+                        "slice. [default: %(default)s]")
+    parser.add_argument('--output-file', default='slice.{index}.woff2',
+                        help="Subset font file name template for the batch "
+                        "file and CSS. [default: %(default)s]")
+    parser.add_argument('--batch-file', metavar='JSON',
+                        help="Write a pyftsubset --batch file here.")
+    parser.add_argument('--css-file', metavar='CSS',
+                        help="Write @font-face rules here.")
+    parser.add_argument('--family', help="font-family for the CSS rules.")
+    parser.epilog = ("Other --options are taken as pyftsubset options, "
+                     "eg. --layout-features, and affect which characters "
+                     "are grouped together.")
+
+    args, rest = parser.parse_known_args(args)
+    options = subset.Options()
+    rest = options.parse_opts(rest)
+    if rest:
+        parser.error("unrecognized arguments: %s" % " ".join(rest))
+    configLogger(level=logging.INFO if options.verbose else logging.WARNING)
+
+    frequencies = None
+    if args.frequencies:
+        with open(args.frequencies, encoding='utf-8') as f:
+            frequencies = parse_frequencies(json.load(f))
+
+    font = subset.load_font(args.font, options, dontLoadGlyphNames=True)
+    slices = plan_slices(font, frequencies, options=options,
+                         default_frequency=args.default_frequency,
+                         slice_overhead=args.slice_overhead,
+                         rule_overhead=args.rule_overhead,
+                         max_slice_size=args.max_slice_size)
+
+    if args.batch_file:
+        with open(args.batch_file, 'w', encoding='utf-8') as f:
+            f.write(tounicode(json.dumps(batch_requests(slices, args.output_file),
+                                         indent=2)))
+    if args.css_file:
+        family = args.family or font['name'].getDebugName(1)
+        ext = args.output_file.rsplit('.', 1)[-1]
+        fmt = {'woff2': 'woff2', 'woff': 'woff', 'otf': 'opentype',
+               'ttf': 'truetype'}.get(ext)
+        with open(args.css_file, 'w', encoding='utf-8') as f:
+            f.write(tounicode(font_face_rules(slices, family, args.output_file,
+                                              format=fmt)))
+    if not args.batch_file and not args.css_file:
+        for unicodes in slices:
+            print(unicode_range(unicodes))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -196,7 +196,7 @@ class TTFont(object):
 		"""
 		from fontTools.ttLib import sfnt
 		if not hasattr(file, "write"):
-			if self.lazy and self.reader.file.name == file:
+			if self.lazy and getattr(self.reader.file, "name", None) == file:
 				raise TTLibError(
 					"Can't overwrite TTFont when 'lazy' attribute is True")
 			closeStream = True
@@ -215,6 +215,10 @@ class TTFont(object):
 		# write to a temporary stream to allow saving to unseekable streams
 		tmp = BytesIO()
 		writer = sfnt.SFNTWriter(tmp, numTables, self.sfntVersion, self.flavor, self.flavorData)
+		if self.flavor == "woff2":
+			# let the WOFF2 writer transform our 'glyf' table without
+			# decompiling it again from the data we compile
+			writer.sourceFont = self
 
 		done = []
 		for tag in tags:
@@ -73,21 +73,24 @@ class table__g_l_y_f(DefaultTable.DefaultTable):
 	def compile(self, ttFont):
 		if not hasattr(self, "glyphOrder"):
 			self.glyphOrder = ttFont.getGlyphOrder()
+		recalcBBoxes = ttFont.recalcBBoxes
+		dataList = [self.glyphs[glyphName].compile(self, recalcBBoxes)
+				for glyphName in self.glyphOrder]
+		data, locations = self.joinGlyphData(dataList)
+		if 'loca' in ttFont:
+			ttFont['loca'].set(locations)
+		if 'maxp' in ttFont:
+			ttFont['maxp'].numGlyphs = len(self.glyphs)
+		return data
+
+	def joinGlyphData(self, dataList):
+		"""Pad the compiled glyphs in dataList according to self.padding,
+		and return the table data along with the 'loca' offsets."""
 		padding = self.padding
 		assert padding in (0, 1, 2, 4)
-		locations = []
-		currentLocation = 0
-		dataList = []
-		recalcBBoxes = ttFont.recalcBBoxes
-		for glyphName in self.glyphOrder:
-			glyph = self.glyphs[glyphName]
-			glyphData = glyph.compile(self, recalcBBoxes)
-			if padding > 1:
-				glyphData = pad(glyphData, size=padding)
-			locations.append(currentLocation)
-			currentLocation = currentLocation + len(glyphData)
-			dataList.append(glyphData)
-		locations.append(currentLocation)
+		if padding > 1:
+			dataList = [pad(glyphData, size=padding) for glyphData in dataList]
+		currentLocation = sum(len(glyphData) for glyphData in dataList)
 
 		if padding == 1 and currentLocation < 0x20000:
 			# See if we can pad any odd-lengthed glyphs to allow loca
@@ -95,20 +98,17 @@ class table__g_l_y_f(DefaultTable.DefaultTable):
 			indices = [i for i,glyphData in enumerate(dataList) if len(glyphData) % 2 == 1]
 			if indices and currentLocation + len(indices) < 0x20000:
 				# It fits.  Do it.
+				dataList = list(dataList)
 				for i in indices:
 					dataList[i] += b'\0'
-				currentLocation = 0
-				for i,glyphData in enumerate(dataList):
-					locations[i] = currentLocation
-					currentLocation += len(glyphData)
-				locations[len(dataList)] = currentLocation
 
-		data = bytesjoin(dataList)
-		if 'loca' in ttFont:
-			ttFont['loca'].set(locations)
-		if 'maxp' in ttFont:
-			ttFont['maxp'].numGlyphs = len(self.glyphs)
-		return data
+		locations = []
+		currentLocation = 0
+		for glyphData in dataList:
+			locations.append(currentLocation)
+			currentLocation += len(glyphData)
+		locations.append(currentLocation)
+		return bytesjoin(dataList), locations
 
 	def toXML(self, writer, ttFont, progress=None):
 		writer.newline()
@@ -162,6 +162,10 @@ class WOFF2Writer(SFNTWriter):
 		# make empty TTFont to store data while normalising and transforming tables
 		self.ttFont = TTFont(recalcBBoxes=False, recalcTimestamp=False)
 
+		# the TTFont being saved, if any: its decompiled 'glyf' table is
+		# transformed directly, instead of decompiling the data written
+		self.sourceFont = None
+
 	def __setitem__(self, tag, data):
 		"""Associate new entry named 'tag' with raw table data."""
 		if tag in self.tables:
@@ -234,8 +238,13 @@ class WOFF2Writer(SFNTWriter):
 		if self.sfntVersion == "OTTO":
 			return
 
-		# make up glyph names required to decompile glyf table
 		self._decompileTable('maxp')
+		sourceGlyf = self._getSourceGlyfTable()
+		if sourceGlyf is not None:
+			self._normaliseSourceGlyfAndLoca(sourceGlyf, padding)
+			return
+
+		# make up glyph names required to decompile glyf table
 		numGlyphs = self.ttFont['maxp'].numGlyphs
 		glyphOrder = ['.notdef'] + ["glyph%.5d" % i for i in range(1, numGlyphs)]
 		self.ttFont.setGlyphOrder(glyphOrder)
@@ -246,6 +255,62 @@ class WOFF2Writer(SFNTWriter):
 		for tag in ('glyf', 'loca'):
 			self._compileTable(tag)
 
+	def _normaliseSourceGlyfAndLoca(self, sourceGlyf, padding):
+		""" Same as _normaliseGlyfAndLoca, but the glyf table to transform is
+		made from the glyphs of the font being saved instead of decompiled,
+		and the glyph data is re-aligned without recompiling them.
+
+		If the source table hasn't loaded its glyphs (like the table the
+		subsetter uses, which keeps them as raw data), it is left alone and
+		the glyphs are made from the data written.  Either way, transforming
+		still expands every compact glyph, to read its coordinates.
+		"""
+		glyphOrder = sourceGlyf.glyphOrder
+		self.ttFont.setGlyphOrder(glyphOrder)
+		for tag in ('head', 'loca'):
+			self._decompileTable(tag)
+		locaTable = self.ttFont['loca']
+		data = self.tables['glyf'].data
+		dataList = [data[locaTable[i]:locaTable[i+1]] for i in range(len(glyphOrder))]
+
+		# reuse the expanded glyphs; copy the compact ones, which get
+		# expanded while transforming
+		Glyph = getTableModule('glyf').Glyph
+		glyfTable = WOFF2GlyfTable()
+		sourceGlyphs = vars(sourceGlyf).get('glyphs')
+		if sourceGlyphs is None:
+			glyfTable.glyphs = {
+				glyphName: Glyph(glyphData)
+				for glyphName, glyphData in zip(glyphOrder, dataList)}
+		else:
+			glyfTable.glyphs = {
+				glyphName: Glyph(glyph.data) if hasattr(glyph, 'data') else glyph
+				for glyphName, glyph in sourceGlyphs.items()}
+		glyfTable.glyphOrder = glyphOrder
+		glyfTable.padding = padding
+		self.ttFont.tables['glyf'] = glyfTable
+
+		self.tables['glyf'].data, locations = glyfTable.joinGlyphData(dataList)
+		locaTable.set(locations)
+		self._compileTable('loca')
+
+	def _getSourceGlyfTable(self):
+		""" Return the decompiled 'glyf' table of the font being saved, if it
+		has one and it matches the 'glyf' data written; else return None.
+		"""
+		font = self.sourceFont
+		if font is None or not font.isLoaded('glyf') or 'loca' not in self.tables:
+			return None
+		glyfTable = font['glyf']
+		numGlyphs = self.ttFont['maxp'].numGlyphs
+		# don't make tables that load their glyphs lazily load them
+		glyphs = vars(glyfTable).get('glyphs')
+		if (getattr(glyfTable, 'glyphOrder', None) is None or
+				len(glyfTable.glyphOrder) != numGlyphs or
+				(glyphs is not None and len(glyphs) != numGlyphs)):
+			return None
+		return glyfTable
+
 	def _setHeadTransformFlag(self):
 		""" Set bit 11 of 'head' table flags to indicate that the font has undergone
 		a lossless modifying transform. Re-compile head table data."""
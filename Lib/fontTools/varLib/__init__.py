@@ -28,11 +28,17 @@ from fontTools.ttLib.tables._g_l_y_f import GlyphCoordinates
 from fontTools.ttLib.tables.TupleVariation import TupleVariation
 from fontTools.ttLib.tables import otTables as ot
 from fontTools.varLib import builder, designspace, models
+from fontTools.misc.workerTools import mapInWorkers
 from fontTools.varLib.merger import VariationMerger, _all_equal
 from collections import OrderedDict
+import itertools
 import os.path
 import logging
 from pprint import pformat
+try:
+	import numpy
+except ImportError:
+	numpy = None
 
 log = logging.getLogger("fontTools.varLib")
 
@@ -244,6 +250,125 @@ def _all_interpolatable_in_between(deltas, coords, i, j, tolerance):
 
 	return all(abs(complex(x-p, y-q)) <= tolerance for (x,y),(p,q) in zip(deltas, interp))
 
+def _iup_axis_params(c1, c2, d1, d2):
+	"""Returns (c1, c2, d1, d2, scale) to interpolate one axis the way
+	_iup_segment() does; scale is None if c1 == c2."""
+	if c1 == c2:
+		return c1, c2, (d1 if d1 == d2 else 0), None, None
+	if c1 > c2:
+		c1, c2 = c2, c1
+		d1, d2 = d2, d1
+	return c1, c2, d1, d2, (d2 - d1) / (c2 - c1)
+
+# Segments longer than this are checked with NumPy, when it is installed.
+_IUP_NUMPY_MIN_POINTS = 24
+
+class _IUPChecker(object):
+
+	"""Tells whether the points of a contour between points i and j can be
+	interpolated from those two, within tolerance, with the same results as
+	_all_interpolatable_in_between().  Points are looked at one by one until
+	one fails; long segments are checked with NumPy, if it is installed.
+
+	If the contour is repeated to make up delta and coords, period is its
+	length: the results for two points are then reused for the same two
+	points in the other copy of the contour."""
+
+	def __init__(self, delta, coords, tolerance, period=None):
+		self.delta = delta
+		self.coords = coords
+		self.tolerance = tolerance
+		self.period = period
+		self.results = {}
+		self.failed = -1
+		self.arrays = None
+		if numpy is not None and len(coords) > _IUP_NUMPY_MIN_POINTS:
+			self.arrays = (numpy.array([c[0] for c in coords], dtype=numpy.float64),
+				       numpy.array([c[1] for c in coords], dtype=numpy.float64),
+				       numpy.array([d[0] for d in delta], dtype=numpy.float64),
+				       numpy.array([d[1] for d in delta], dtype=numpy.float64))
+
+	def __call__(self, i, j):
+		period = self.period
+		if period:
+			key = (i % period, j - i)
+			result = self.results.get(key)
+			if result is None:
+				result = self.results[key] = self._checkAll(i, j)
+			return result
+		return self._checkAll(i, j)
+
+	def _checkAll(self, i, j):
+		if self.arrays is None or j - i <= _IUP_NUMPY_MIN_POINTS:
+			return self._check(i, j, j)
+		# Most segments fail in their first few points.
+		start = i + _IUP_NUMPY_MIN_POINTS
+		return self._check(i, j, start) and self._checkArrays(i, j, start)
+
+	def _check(self, i, j, end):
+		"""Checks the points between i and j, up to end.  The point that
+		failed the last check, if it is between i and j, goes first: it is
+		likely to fail this one too."""
+		assert j - i >= 2
+		delta = self.delta
+		coords = self.coords
+		tolerance = self.tolerance
+		x1, y1 = coords[i]
+		x2, y2 = coords[j]
+		dx1, dy1 = delta[i]
+		dx2, dy2 = delta[j]
+		lx, hx, ldx, hdx, sx = _iup_axis_params(x1, x2, dx1, dx2)
+		ly, hy, ldy, hdy, sy = _iup_axis_params(y1, y2, dy1, dy2)
+		points = range(i+1, end)
+		failed = self.failed
+		if i < failed < j:
+			points = itertools.chain((failed,), points)
+		for k in points:
+			x, y = coords[k]
+			if sx is None:
+				ix = ldx
+			elif x <= lx:
+				ix = ldx
+			elif x >= hx:
+				ix = hdx
+			else:
+				ix = ldx + (x - lx) * sx
+			if sy is None:
+				iy = ldy
+			elif y <= ly:
+				iy = ldy
+			elif y >= hy:
+				iy = hdy
+			else:
+				iy = ldy + (y - ly) * sy
+			dx, dy = delta[k]
+			if abs(complex(dx - ix, dy - iy)) > tolerance:
+				self.failed = k
+				return False
+		return True
+
+	def _checkArrays(self, i, j, start):
+		"""Checks the points between i and j, from start on, with NumPy."""
+		xs, ys, dxs, dys = self.arrays
+		(x1, y1), (x2, y2) = self.coords[i], self.coords[j]
+		(dx1, dy1), (dx2, dy2) = self.delta[i], self.delta[j]
+		errors = numpy.hypot(
+			dxs[start:j] - _iup_axis_array(xs[start:j], x1, x2, dx1, dx2),
+			dys[start:j] - _iup_axis_array(ys[start:j], y1, y2, dy1, dy2))
+		failed = numpy.flatnonzero(errors > self.tolerance)
+		if len(failed):
+			self.failed = start + int(failed[0])
+			return False
+		return True
+
+def _iup_axis_array(c, c1, c2, d1, d2):
+	"""Returns the deltas interpolated for the coordinates array c, on one
+	axis, like _iup_segment() does."""
+	c1, c2, d1, d2, scale = _iup_axis_params(c1, c2, d1, d2)
+	if scale is None:
+		return d1
+	return numpy.where(c <= c1, d1, numpy.where(c >= c2, d2, d1 + (c - c1) * scale))
+
 def _iup_contour_bound_forced_set(delta, coords, tolerance=0):
 	"""The forced set is a conservative set of points on the contour that must be encoded
 	explicitly (ie. cannot be interpolated).  Calculating this set allows for significantly
@@ -312,7 +437,7 @@ def _iup_contour_bound_forced_set(delta, coords, tolerance=0):
 
 	return forced
 
-def _iup_contour_optimize_dp(delta, coords, forced={}, tolerance=0, lookback=None):
+def _iup_contour_optimize_dp(delta, coords, forced={}, tolerance=0, lookback=None, period=None):
 	"""Straightforward Dynamic-Programming.  For each index i, find least-costly encoding of
 	points i to n-1 where i is explicitly encoded.  We find this by considering all next
 	explicit points j and check whether interpolation can fill points between i and j.
@@ -320,11 +445,14 @@ def _iup_contour_optimize_dp(delta, coords, forced={}, tolerance=0, lookback=Non
 	Note that solution always encodes last point explicitly.  Higher-level is responsible
 	for removing that restriction.
 
-	As major speedup, we stop looking further whenever we see a "forced" point."""
+	As major speedup, we stop looking further whenever we see a "forced" point.
+
+	If delta and coords repeat a contour, period is the length of the contour."""
 
 	n = len(delta)
 	if lookback is None:
 		lookback = n
+	can_iup = _IUPChecker(delta, coords, tolerance, period)
 	costs = {-1:0}
 	chain = {-1:None}
 	for i in range(0, n):
@@ -340,7 +468,7 @@ def _iup_contour_optimize_dp(delta, coords, forced={}, tolerance=0, lookback=Non
 
 			cost = costs[j] + 1
 
-			if cost < best_cost and _all_interpolatable_in_between(delta, coords, j, i, tolerance):
+			if cost < best_cost and can_iup(j, i):
 				costs[i] = best_cost = cost
 				chain[i] = j
 
@@ -362,7 +490,11 @@ def _rot_set(s, k, n):
 	if not k: return s
 	return {(v + k) % n for v in s}
 
-def _iup_contour_optimize(delta, coords, tolerance=0.):
+def _iup_contour_optimize(delta, coords, tolerance=0., lookback=None):
+	"""Returns delta with the points that can be interpolated from the
+	others set to None.  If lookback is set, interpolation is only tried
+	across that many points at most, which is faster on long contours but
+	may encode more points."""
 	n = len(delta)
 
 	# Get the easy cases out of the way:
@@ -398,7 +530,7 @@ def _iup_contour_optimize(delta, coords, tolerance=0.):
 		coords = _rot_list(coords, k)
 		forced = _rot_set(forced, k, n)
 
-		chain, costs = _iup_contour_optimize_dp(delta, coords, forced, tolerance)
+		chain, costs = _iup_contour_optimize_dp(delta, coords, forced, tolerance, lookback)
 
 		# Assemble solution.
 		solution = set()
@@ -414,7 +546,8 @@ def _iup_contour_optimize(delta, coords, tolerance=0.):
 		# Repeat the contour an extra time, solve the 2*n case, then look for solutions of the
 		# circular n-length problem in the solution for 2*n linear case.  I cannot prove that
 		# this always produces the optimal solution...
-		chain, costs = _iup_contour_optimize_dp(delta+delta, coords+coords, forced, tolerance, n)
+		chain, costs = _iup_contour_optimize_dp(delta+delta, coords+coords, forced, tolerance,
+							min(n, lookback or n), period=n)
 		best_sol, best_cost = None, n+1
 
 		for start in range(n-1, 2*n-1):
@@ -434,21 +567,107 @@ def _iup_contour_optimize(delta, coords, tolerance=0.):
 
 	return delta
 
-def _iup_delta_optimize(delta, coords, ends, tolerance=0.):
+def _iup_delta_optimize(delta, coords, ends, tolerance=0., lookback=None):
 	assert sorted(ends) == ends and len(coords) == (ends[-1]+1 if ends else 0) + 4
 	n = len(coords)
 	ends = ends + [n-4, n-3, n-2, n-1]
 	out = []
 	start = 0
 	for end in ends:
-		contour = _iup_contour_optimize(delta[start:end+1], coords[start:end+1], tolerance)
+		contour = _iup_contour_optimize(delta[start:end+1], coords[start:end+1], tolerance, lookback)
 		assert len(contour) == end - start + 1
 		out.extend(contour)
 		start = end+1
 
 	return out
 
-def _add_gvar(font, model, master_ttfs, tolerance=0.5, optimize=True):
+def _glyph_variations(glyph, model, master_ttfs, tolerance, optimize):
+	"""Returns the list of TupleVariation of glyph, or None if its masters
+	are incompatible."""
+
+	allData = [_GetCoordinates(m, glyph) for m in master_ttfs]
+	allCoords = [d[0] for d in allData]
+	allControls = [d[1] for d in allData]
+	control = allControls[0]
+	if (any(c != control for c in allControls)):
+		return None
+	del allControls
+
+	variations = []
+	supports = model.supports
+	# One row of master values per coordinate component; each column of the
+	# deltas holds the deltas of one support.
+	rows = list(zip(*(c.array for c in allCoords)))
+	if rows:
+		deltas = [GlyphCoordinates(zip(column[0::2], column[1::2]))
+			  for column in zip(*model.getDeltasBatch(rows))]
+	else:
+		deltas = [GlyphCoordinates() for _ in supports]
+	assert len(deltas) == len(supports)
+
+	# Prepare for IUP optimization
+	origCoords = deltas[0]
+	endPts = control[1] if control[0] >= 1 else list(range(len(control[1])))
+
+	for i,(delta,support) in enumerate(zip(deltas[1:], supports[1:])):
+		if all(abs(v) <= tolerance for v in delta.array):
+			continue
+		var = TupleVariation(support, delta)
+		if optimize:
+			delta_opt = _iup_delta_optimize(delta, origCoords, endPts, tolerance=tolerance)
+
+			if None in delta_opt:
+				# Use "optimized" version only if smaller...
+				var_opt = TupleVariation(support, delta_opt)
+
+				axis_tags = sorted(support.keys()) # Shouldn't matter that this is different from fvar...?
+				tupleData, auxData = var.compile(axis_tags, [], None)
+				unoptimized_len = len(tupleData) + len(auxData)
+				tupleData, auxData = var_opt.compile(axis_tags, [], None)
+				optimized_len = len(tupleData) + len(auxData)
+
+				if optimized_len < unoptimized_len:
+					var = var_opt
+
+		variations.append(var)
+
+	return variations
+
+# Tables of the masters that _GetCoordinates() reads, in the order in which
+# they have to be compiled.
+_gvar_master_tables = ('glyf', 'loca', 'head', 'hhea', 'maxp', 'hmtx')
+
+def _gvar_master_data(font):
+	"""Returns the binary of a font with just the tables of font needed to
+	get its glyph coordinates, to send it to worker processes."""
+	from fontTools.ttLib.sfnt import SFNTWriter
+	data = [(tag, font.getTableData(tag)) for tag in _gvar_master_tables]
+	buf = BytesIO()
+	writer = SFNTWriter(buf, len(data), font.sfntVersion)
+	for tag, tableData in data:
+		writer[tag] = tableData
+	writer.close()
+	return buf.getvalue()
+
+# Number of glyphs whose variations are computed at a time by a worker
+# process.
+_gvar_chunk_size = 64
+
+def _load_gvar_masters(state):
+	"""Loads the masters sent to worker processes by _add_gvar()."""
+	masters, model, tolerance, optimize = state
+	master_ttfs = []
+	for data, glyphOrder in masters:
+		master = TTFont(BytesIO(data))
+		master.setGlyphOrder(glyphOrder)
+		master_ttfs.append(master)
+	return master_ttfs, model, tolerance, optimize
+
+def _gvar_worker_variations(state, glyph):
+	master_ttfs, model, tolerance, optimize = state
+	return _glyph_variations(glyph, model, master_ttfs, tolerance, optimize)
+
+def _add_gvar(font, model, master_ttfs, tolerance=0.5, optimize=True, workers=None):
 
 	assert tolerance >= 0
 
@@ -459,59 +678,34 @@ def _add_gvar(font, model, master_ttfs, tolerance=0.5, optimize=True):
 	gvar.reserved = 0
 	gvar.variations = {}
 
-	for glyph in font.getGlyphOrder():
-
-		allData = [_GetCoordinates(m, glyph) for m in master_ttfs]
-		allCoords = [d[0] for d in allData]
-		allControls = [d[1] for d in allData]
-		control = allControls[0]
-		if (any(c != control for c in allControls)):
+	glyphs = font.getGlyphOrder()
+	if workers is None or workers <= 1 or len(glyphs) <= _gvar_chunk_size:
+		allVariations = [_glyph_variations(glyph, model, master_ttfs, tolerance, optimize)
+				 for glyph in glyphs]
+	else:
+		masters = [(_gvar_master_data(m), m.getGlyphOrder()) for m in master_ttfs]
+		allVariations = mapInWorkers(_gvar_worker_variations, glyphs, workers,
+					     (masters, model, tolerance, optimize),
+					     setup=_load_gvar_masters,
+					     chunkSize=_gvar_chunk_size)
+
+	for glyph, variations in zip(glyphs, allVariations):
+		if variations is None:
 			log.warning("glyph %s has incompatible masters; skipping" % glyph)
 			continue
-		del allControls
-
-		# Update gvar
-		gvar.variations[glyph] = []
-		deltas = model.getDeltas(allCoords)
-		supports = model.supports
-		assert len(deltas) == len(supports)
-
-		# Prepare for IUP optimization
-		origCoords = deltas[0]
-		endPts = control[1] if control[0] >= 1 else list(range(len(control[1])))
-
-		for i,(delta,support) in enumerate(zip(deltas[1:], supports[1:])):
-			if all(abs(v) <= tolerance for v in delta.array):
-				continue
-			var = TupleVariation(support, delta)
-			if optimize:
-				delta_opt = _iup_delta_optimize(delta, origCoords, endPts, tolerance=tolerance)
-
-				if None in delta_opt:
-					# Use "optimized" version only if smaller...
-					var_opt = TupleVariation(support, delta_opt)
-
-					axis_tags = sorted(support.keys()) # Shouldn't matter that this is different from fvar...?
-					tupleData, auxData = var.compile(axis_tags, [], None)
-					unoptimized_len = len(tupleData) + len(auxData)
-					tupleData, auxData = var_opt.compile(axis_tags, [], None)
-					optimized_len = len(tupleData) + len(auxData)
-
-					if optimized_len < unoptimized_len:
-						var = var_opt
-
-			gvar.variations[glyph].append(var)
+		gvar.variations[glyph] = variations
 
 def _add_HVAR(font, model, master_ttfs, axisTags):
 
 	log.info("Generating HVAR")
 
-	hAdvanceDeltas = {}
 	metricses = [m["hmtx"].metrics for m in master_ttfs]
-	for glyph in font.getGlyphOrder():
-		hAdvances = [metrics[glyph][0] for metrics in metricses]
-		# TODO move round somewhere else?
-		hAdvanceDeltas[glyph] = tuple(round(d) for d in model.getDeltas(hAdvances)[1:])
+	glyphOrder = font.getGlyphOrder()
+	allDeltas = model.getDeltasBatch([[metrics[glyph][0] for metrics in metricses]
+					  for glyph in glyphOrder])
+	# TODO move round somewhere else?
+	hAdvanceDeltas = {glyph: tuple(round(d) for d in deltas[1:])
+			  for glyph, deltas in zip(glyphOrder, allDeltas)}
 
 	# We only support the direct mapping right now.
 
@@ -816,13 +1010,16 @@ def load_designspace(designspace_filename):
 	return axes, internal_axis_supports, base_idx, normalized_master_locs, masters, instances
 
 
-def build(designspace_filename, master_finder=lambda s:s):
+def build(designspace_filename, master_finder=lambda s:s, workers=None):
 	"""
 	Build variation font from a designspace file.
 
 	If master_finder is set, it should be a callable that takes master
 	filename as found in designspace file and map it to master font
 	binary as to be opened (eg. .ttf or .otf).
+
+	If workers is more than 1, the glyph variations are computed in up
+	to that many processes.
 	"""
 
 	axes, internal_axis_supports, base_idx, normalized_master_locs, masters, instances = load_designspace(designspace_filename)
@@ -855,7 +1052,7 @@ def build(designspace_filename, master_finder=lambda s:s):
 	_add_HVAR(vf, model, master_fonts, axisTags)
 	_merge_OTL(vf, model, master_fonts, axisTags)
 	if 'glyf' in vf:
-		_add_gvar(vf, model, master_fonts)
+		_add_gvar(vf, model, master_fonts, workers=workers)
 
 	return vf, model, master_ttfs
 
@@ -866,6 +1063,8 @@ def main(args=None):
 
 	parser = ArgumentParser(prog='varLib')
 	parser.add_argument('designspace')
+	parser.add_argument('-j', '--jobs', type=int, default=1,
+		help='number of processes to build the glyph variations in')
 	options = parser.parse_args(args)
 
 	# TODO: allow user to configure logging via command-line options
@@ -875,7 +1074,7 @@ def main(args=None):
 	finder = lambda s: s.replace('master_ufo', 'master_ttf_interpolatable').replace('.ufo', '.ttf')
 	outfile = os.path.splitext(designspace_filename)[0] + '-VF.ttf'
 
-	vf, model, master_ttfs = build(designspace_filename, finder)
+	vf, model, master_ttfs = build(designspace_filename, finder, workers=options.jobs)
 
 	log.info("Saving variation font %s", outfile)
 	vf.save(outfile)
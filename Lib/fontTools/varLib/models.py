@@ -1,6 +1,11 @@
 """Variation fonts interpolation models."""
 from __future__ import print_function, division, absolute_import
 from fontTools.misc.py23 import *
+from collections import OrderedDict
+try:
+	import numpy
+except ImportError:
+	numpy = None
 
 __all__ = ['normalizeValue', 'normalizeLocation', 'supportScalar', 'VariationModel']
 
@@ -171,6 +176,8 @@ class VariationModel(object):
 		self.reverseMapping = [locations.index(l) for l in self.locations] # Reverse of above
 
 		self._computeMasterSupports(axisPoints)
+		self._deltaMatrix = None
+		self._scalarsCache = OrderedDict()
 
 	@staticmethod
 	def getMasterLocationsSortKeyFunc(locations, axisOrder=[]):
@@ -282,8 +289,62 @@ class VariationModel(object):
 			out.append(delta)
 		return out
 
+	# Number of locations whose scalars getScalars() remembers.
+	scalarsCacheSize = 128
+
 	def getScalars(self, loc):
-		return [supportScalar(loc, support) for support in self.supports]
+		key = tuple(sorted(loc.items()))
+		cache = self._scalarsCache
+		scalars = cache.pop(key, None)
+		if scalars is None:
+			scalars = tuple(supportScalar(loc, support) for support in self.supports)
+			if len(cache) >= self.scalarsCacheSize:
+				cache.popitem(last=False)
+		cache[key] = scalars
+		return list(scalars)
+
+	def getDeltaMatrix(self):
+		"""Returns the matrix that turns master values into deltas: the
+		inverse of the matrix of deltaWeights, as a list of rows, with the
+		columns in the order of the masters given to the model.  It is
+		computed once."""
+		if self._deltaMatrix is None:
+			n = len(self.deltaWeights)
+			rows = []
+			for i,weights in enumerate(self.deltaWeights):
+				row = [0.] * n
+				row[i] = 1.
+				for j,weight in weights.items():
+					for k,v in enumerate(rows[j]):
+						if v:
+							row[k] -= v * weight
+				rows.append(row)
+			mapping = self.mapping
+			self._deltaMatrix = [[row[mapping[k]] for k in range(n)] for row in rows]
+		return self._deltaMatrix
+
+	def getDeltasBatch(self, masterValuesList):
+		"""Returns the deltas of each row of master values in
+		masterValuesList, with one matrix product.  Like with getDeltas(),
+		master values are in the order of the masters given to the model.
+		A NumPy array gives a NumPy array, anything else a list of lists.
+		The deltas may differ from those of getDeltas() by rounding errors."""
+		return _dotRows(masterValuesList, self.getDeltaMatrix())
+
+	def getScalarsBatch(self, locations):
+		return [self.getScalars(loc) for loc in locations]
+
+	def interpolateFromDeltasBatch(self, locations, deltasList):
+		"""Returns, for each location, the list of values interpolated from
+		each row of deltas in deltasList."""
+		return _dotRows(self.getScalarsBatch(locations), deltasList)
+
+	def interpolateFromMastersBatch(self, locations, masterValuesList):
+		"""Returns, for each location, the list of values interpolated from
+		each row of master values in masterValuesList."""
+		deltaColumns = [list(column) for column in zip(*self.getDeltaMatrix())]
+		weights = _dotRows(self.getScalarsBatch(locations), deltaColumns)
+		return _dotRows(weights, masterValuesList)
 
 	@staticmethod
 	def interpolateFromDeltasAndScalars(deltas, scalars):
@@ -311,6 +372,19 @@ class VariationModel(object):
 		return self.interpolateFromDeltasAndScalars(deltas, scalars)
 
 
+def _dotRows(a, b):
+	"""Returns the matrix of the dot products of each row of a with each
+	row of b, ie. a x transpose(b).  NumPy is only used if either is a
+	NumPy array, and then so is the result; else it is a list of lists."""
+	if numpy is not None and (isinstance(a, numpy.ndarray) or isinstance(b, numpy.ndarray)):
+		return numpy.dot(numpy.asarray(a, dtype=numpy.float64),
+				 numpy.asarray(b, dtype=numpy.float64).T)
+	out = []
+	for rowA in a:
+		nonZero = [(i,v) for i,v in enumerate(rowA) if v]
+		out.append([sum(v * rowB[i] for i,v in nonZero) for rowB in b])
+	return out
+
 if __name__ == "__main__":
 	import doctest, sys
 	sys.exit(doctest.testmod().failed)
@@ -2,13 +2,19 @@
 Instantiate a variation font.  Run, eg:
 
 $ python mutator.py ./NotoSansArabic-VF.ttf wght=140 wdth=85
+
+From Python, use instantiateVariableFont(), or instantiateVariableFonts()
+for many locations at once.
 """
 from __future__ import print_function, division, absolute_import
 from fontTools.misc.py23 import *
 from fontTools.ttLib import TTFont
 from fontTools.ttLib.tables._g_l_y_f import GlyphCoordinates
-from fontTools.varLib import _GetCoordinates, _SetCoordinates
+from fontTools.ttLib.tables import otBase, otTables as ot
+from fontTools.varLib import _GetCoordinates, _SetCoordinates, _MVAR_entries
 from fontTools.varLib.models import supportScalar, normalizeLocation
+from fontTools.misc.workerTools import mapInWorkers
+from functools import reduce
 import os.path
 
 
@@ -99,6 +105,341 @@ def _iup_delta(delta, coords, ends):
 	return out
 
 
+
+def _piecewiseLinearMap(value, mapping):
+	"""Maps value with the avar segment map mapping, a dict from
+	normalized axis values to their mapped values."""
+	keys = sorted(mapping.keys())
+	if not keys:
+		return value
+	if value in mapping:
+		return mapping[value]
+	k = keys[0]
+	if value < k:
+		return value + mapping[k] - k
+	k = keys[-1]
+	if value > k:
+		return value + mapping[k] - k
+	a = max(k for k in keys if k < value)
+	b = min(k for k in keys if k > value)
+	va = mapping[a]
+	vb = mapping[b]
+	return va + (vb - va) * (value - a) / (b - a)
+
+
+class _VarStoreInstancer(object):
+
+	"""Gives the deltas of the items of an ItemVariationStore at a
+	normalized location."""
+
+	def __init__(self, varStore, axisTags, location):
+		self.varStore = varStore
+		regionScalars = []
+		if varStore is not None:
+			for region in varStore.VarRegionList.Region:
+				support = {tag: (axis.StartCoord, axis.PeakCoord, axis.EndCoord)
+					   for tag, axis in zip(axisTags, region.VarRegionAxis)}
+				regionScalars.append(supportScalar(location, support, ot=True))
+		self.regionScalars = regionScalars
+
+	def __getitem__(self, varIdx):
+		varData = self.varStore.VarData[varIdx >> 16]
+		deltas = varData.Item[varIdx & 0xFFFF]
+		regionScalars = self.regionScalars
+		delta = 0.
+		for regionIndex, d in zip(varData.VarRegionIndex, deltas):
+			scalar = regionScalars[regionIndex]
+			if scalar:
+				delta += d * scalar
+		return delta
+
+
+# Device table attributes, and the values they vary.
+_deviceValues = [
+	('XPlaDevice', 'XPlacement'),
+	('YPlaDevice', 'YPlacement'),
+	('XAdvDevice', 'XAdvance'),
+	('YAdvDevice', 'YAdvance'),
+	('XDeviceTable', 'XCoordinate'),
+	('YDeviceTable', 'YCoordinate'),
+	('DeviceTable', 'Coordinate'),
+]
+
+def _instantiateDevices(table, varStoreInstancer, seen):
+	"""Adds the deltas of the variation device tables found in table (an
+	otTables table, ValueRecord or list) to the values they vary, and
+	drops those device tables."""
+	if isinstance(table, list):
+		for item in table:
+			_instantiateDevices(item, varStoreInstancer, seen)
+		return
+	if not isinstance(table, (otBase.BaseTable, otBase.ValueRecord)):
+		return
+	if id(table) in seen:
+		return
+	seen.add(id(table))
+	if isinstance(table, otBase.BaseTable):
+		table.ensureDecompiled()
+	attrs = table.__dict__
+	for deviceName, valueName in _deviceValues:
+		device = attrs.get(deviceName)
+		if device is None or getattr(device, 'DeltaFormat', None) != 0x8000:
+			continue
+		varIdx = (device.StartSize << 16) + device.EndSize
+		setattr(table, valueName,
+			round(attrs.get(valueName, 0) + varStoreInstancer[varIdx]))
+		if isinstance(table, otBase.ValueRecord):
+			delattr(table, deviceName)
+		else:
+			setattr(table, deviceName, None)
+	if isinstance(table, ot.Anchor) and table.Format == 3 and \
+	   table.XDeviceTable is None and table.YDeviceTable is None:
+		table.Format = 1
+	if isinstance(table, ot.CaretValue) and table.Format == 3 and \
+	   table.DeviceTable is None:
+		table.Format = 1
+	for name, value in list(table.__dict__.items()):
+		if isinstance(value, (list, otBase.BaseTable, otBase.ValueRecord)):
+			_instantiateDevices(value, varStoreInstancer, seen)
+
+
+def _valueFormat(valueRecords):
+	return reduce(int.__or__, [v.getFormat() for v in valueRecords if v is not None], 0)
+
+def _updateValueFormats(gpos):
+	"""Sets the ValueFormats of the single and pair adjustment subtables
+	of gpos (an otTables.GPOS) to what their ValueRecords hold, once
+	_instantiateDevices() has moved the device deltas into values."""
+	if not gpos.LookupList:
+		return
+	for lookup in gpos.LookupList.Lookup:
+		for subtable in lookup.SubTable:
+			if lookup.LookupType == 9:
+				subtable = subtable.ExtSubTable
+			if isinstance(subtable, ot.SinglePos):
+				if subtable.Format == 1:
+					subtable.ValueFormat = _valueFormat([subtable.Value])
+				else:
+					subtable.ValueFormat = _valueFormat(subtable.Value)
+			elif isinstance(subtable, ot.PairPos):
+				if subtable.Format == 1:
+					records = [r for pairSet in subtable.PairSet
+						     for r in pairSet.PairValueRecord]
+				else:
+					records = [r for class1Record in subtable.Class1Record
+						     for r in class1Record.Class2Record]
+				subtable.ValueFormat1 = _valueFormat(
+					[getattr(r, 'Value1', None) for r in records])
+				subtable.ValueFormat2 = _valueFormat(
+					[getattr(r, 'Value2', None) for r in records])
+
+
+class _FontInstancer(object):
+
+	"""Instantiates the variable font varfont, and copies of it, at any
+	number of locations.  The glyph variations of varfont are read, and
+	their deltas interpolated for all the glyph points, only once; so are
+	the CFF2 blends."""
+
+	def __init__(self, varfont):
+		fvar = varfont['fvar']
+		self.axisTags = [a.axisTag for a in fvar.axes]
+		self.axes = {a.axisTag:(a.minValue,a.defaultValue,a.maxValue) for a in fvar.axes}
+		self.avarSegments = varfont['avar'].segments if 'avar' in varfont else {}
+
+		# (glyphName, origCoords, [(axes, delta)]) for each glyph with
+		# variations, sorted by component depth, so that components are
+		# instantiated before the composite glyphs that use them.
+		self.glyphVariations = []
+		if 'gvar' in varfont:
+			gvar = varfont['gvar']
+			glyf = varfont['glyf']
+			glyphnames = sorted(
+				gvar.variations.keys(),
+				key=lambda name: (
+					glyf[name].getCompositeMaxpValues(glyf).maxComponentDepth
+					if glyf[name].isComposite() else 0,
+					name))
+			for glyphname in glyphnames:
+				origCoords,control = _GetCoordinates(varfont, glyphname)
+				endPts = control[1] if control[0] >= 1 else list(range(len(control[1])))
+				deltas = []
+				for var in gvar.variations[glyphname]:
+					delta = var.coordinates
+					if None in delta:
+						delta = _iup_delta(delta, origCoords, endPts)
+					deltas.append((var.axes, GlyphCoordinates(delta)))
+				self.glyphVariations.append((glyphname, origCoords, deltas))
+
+		self.cvtVariations = []
+		if 'cvar' in varfont:
+			for var in varfont['cvar'].variations:
+				self.cvtVariations.append((var.axes,
+					[d if d is not None else 0 for d in var.coordinates]))
+
+		self.cff2Instancer = None
+		if 'CFF2' in varfont:
+			from fontTools.cffLib.instancer import CFF2Instancer
+			self.cff2Instancer = CFF2Instancer(varfont['CFF2'].cff, self.axisTags)
+
+	def normalizeLocation(self, location):
+		"""Returns location, in user-space axis values, in normalized
+		space, mapped with avar."""
+		loc = normalizeLocation(location, self.axes)
+		for tag, mapping in self.avarSegments.items():
+			if tag in loc:
+				loc[tag] = _piecewiseLinearMap(loc[tag], mapping)
+		return loc
+
+	def instantiate(self, font, location):
+		"""Instantiates font, which must be the variable font this
+		instancer was made from or a copy of it, at location (in user-space
+		axis values), in place."""
+		loc = self.normalizeLocation(location)
+		scalars = {}
+		def getScalar(axes):
+			key = tuple(sorted(axes.items()))
+			scalar = scalars.get(key)
+			if scalar is None:
+				scalar = scalars[key] = supportScalar(loc, axes, ot=True)
+			return scalar
+
+		for glyphname, origCoords, deltas in self.glyphVariations:
+			coordinates = origCoords.copy()
+			for axes, delta in deltas:
+				scalar = getScalar(axes)
+				if not scalar: continue
+				coordinates += delta * scalar
+			_SetCoordinates(font, glyphname, coordinates)
+
+		if self.cvtVariations:
+			cvt = font['cvt ']
+			values = [float(v) for v in cvt.values]
+			for axes, delta in self.cvtVariations:
+				scalar = getScalar(axes)
+				if not scalar: continue
+				for i, d in enumerate(delta):
+					values[i] += d * scalar
+			for i, v in enumerate(values):
+				cvt[i] = round(v)
+
+		if 'MVAR' in font:
+			mvar = font['MVAR'].table
+			varStoreInstancer = _VarStoreInstancer(mvar.VarStore, self.axisTags, loc)
+			for rec in mvar.ValueRecord:
+				if rec.ValueTag not in _MVAR_entries:
+					continue
+				tableTag, itemName = _MVAR_entries[rec.ValueTag]
+				if tableTag not in font:
+					continue
+				table = font[tableTag]
+				setattr(table, itemName,
+					round(getattr(table, itemName) + varStoreInstancer[rec.VarIdx]))
+
+		if 'HVAR' in font and 'gvar' not in font:
+			# With gvar, the advance widths vary with its phantom points.
+			hvar = font['HVAR'].table
+			varStoreInstancer = _VarStoreInstancer(hvar.VarStore, self.axisTags, loc)
+			metrics = font['hmtx'].metrics
+			advMapping = hvar.AdvWidthMap.mapping if hvar.AdvWidthMap else None
+			for gid, glyphname in enumerate(font.getGlyphOrder()):
+				varIdx = advMapping[min(gid, len(advMapping) - 1)] if advMapping else gid
+				width, lsb = metrics[glyphname]
+				metrics[glyphname] = (round(width + varStoreInstancer[varIdx]), lsb)
+
+		if 'GDEF' in font:
+			gdef = font['GDEF'].table
+			varStore = getattr(gdef, 'VarStore', None)
+			if varStore is not None:
+				varStoreInstancer = _VarStoreInstancer(varStore, self.axisTags, loc)
+				seen = set()
+				for tag in ('GDEF', 'GPOS'):
+					if tag in font:
+						_instantiateDevices(font[tag].table, varStoreInstancer, seen)
+				if 'GPOS' in font:
+					_updateValueFormats(font['GPOS'].table)
+				gdef.VarStore = None
+				gdef.Version = 0x00010002 if getattr(gdef, 'MarkGlyphSetsDef', None) else 0x00010000
+				if not any(getattr(gdef, name, None) for name in (
+						'GlyphClassDef', 'AttachList', 'LigCaretList',
+						'MarkAttachClassDef', 'MarkGlyphSetsDef')):
+					# Only there for the variation store.
+					del font['GDEF']
+
+		if self.cff2Instancer is not None:
+			self.cff2Instancer.apply(font['CFF2'].cff, loc)
+
+		for tag in ('avar','cvar','fvar','gvar','HVAR','MVAR','VVAR','STAT'):
+			if tag in font:
+				del font[tag]
+
+
+def instantiateVariableFont(varfont, location, inplace=False):
+	"""Returns a static instance of the variable font varfont at location,
+	a dict from axis tags to user-space axis values, eg. {'wght': 500}.
+	Axes missing from location are at their default.  If inplace is true,
+	varfont itself is changed and returned; else a copy of it is.
+
+	The avar mapping is applied to the location; gvar, cvar, MVAR, HVAR
+	(when there is no gvar), the GPOS and GDEF device tables and CFF2
+	blends are instantiated; and the variation tables are removed."""
+	if not inplace:
+		varfont = _copyFont(varfont)
+	_FontInstancer(varfont).instantiate(varfont, location)
+	return varfont
+
+
+def instantiateVariableFonts(varfont, locations, outfiles=None, workers=None):
+	"""Instantiates the variable font varfont at each of the locations (as
+	for instantiateVariableFont()), in up to workers processes.  varfont is
+	not changed.
+
+	The glyph variations of varfont are read once, and each instance is
+	made from a copy of the compiled variable font.  Returns a list with,
+	for each location, its file from outfiles if given, or the compiled
+	instance font as bytes otherwise."""
+	if outfiles is None:
+		outfiles = [None] * len(locations)
+	assert len(outfiles) == len(locations)
+	state = (_fontData(varfont), varfont.getGlyphOrder(), _FontInstancer(varfont))
+	return mapInWorkers(_instantiate_batch_item, list(zip(locations, outfiles)),
+			    workers, state)
+
+
+def _fontData(font):
+	buf = BytesIO()
+	saved = font.recalcBBoxes, font.recalcTimestamp
+	font.recalcBBoxes = font.recalcTimestamp = False
+	try:
+		font.save(buf, reorderTables=None)
+	finally:
+		font.recalcBBoxes, font.recalcTimestamp = saved
+	return buf.getvalue()
+
+def _loadFont(data, glyphOrder):
+	font = TTFont(BytesIO(data))
+	font.setGlyphOrder(glyphOrder)
+	return font
+
+def _copyFont(font):
+	copy = _loadFont(_fontData(font), font.getGlyphOrder())
+	copy.recalcBBoxes, copy.recalcTimestamp = font.recalcBBoxes, font.recalcTimestamp
+	return copy
+
+
+def _instantiate_batch_item(state, item):
+	fontdata, glyphOrder, instancer = state
+	location, outfile = item
+	font = _loadFont(fontdata, glyphOrder)
+	instancer.instantiate(font, location)
+	if outfile is not None:
+		font.save(outfile)
+		return outfile
+	buf = BytesIO()
+	font.save(buf)
+	return buf.getvalue()
+
+
 def main(args=None):
 
 	if args is None:
@@ -119,43 +460,8 @@ def main(args=None):
 	print("Loading variable font")
 	varfont = TTFont(varfilename)
 
-	fvar = varfont['fvar']
-	axes = {a.axisTag:(a.minValue,a.defaultValue,a.maxValue) for a in fvar.axes}
-	# TODO Apply avar
-	# TODO Round to F2Dot14?
-	loc = normalizeLocation(loc, axes)
-	# Location is normalized now
-	print("Normalized location:", loc)
-
-	gvar = varfont['gvar']
-	glyf = varfont['glyf']
-	# get list of glyph names in gvar sorted by component depth
-	glyphnames = sorted(
-		gvar.variations.keys(),
-		key=lambda name: (
-			glyf[name].getCompositeMaxpValues(glyf).maxComponentDepth
-			if glyf[name].isComposite() else 0,
-			name))
-	for glyphname in glyphnames:
-		variations = gvar.variations[glyphname]
-		coordinates,_ = _GetCoordinates(varfont, glyphname)
-		origCoords, endPts = None, None
-		for var in variations:
-			scalar = supportScalar(loc, var.axes, ot=True)
-			if not scalar: continue
-			delta = var.coordinates
-			if None in delta:
-				if origCoords is None:
-					origCoords,control = _GetCoordinates(varfont, glyphname)
-					endPts = control[1] if control[0] >= 1 else list(range(len(control[1])))
-				delta = _iup_delta(delta, origCoords, endPts)
-			coordinates += GlyphCoordinates(delta) * scalar
-		_SetCoordinates(varfont, glyphname, coordinates)
-
-	print("Removing variable tables")
-	for tag in ('avar','cvar','fvar','gvar','HVAR','MVAR','VVAR','STAT'):
-		if tag in varfont:
-			del varfont[tag]
+	print("Instantiating")
+	instantiateVariableFont(varfont, loc, inplace=True)
 
 	print("Saving instance font", outfile)
 	varfont.save(outfile)
@@ -0,0 +1,158 @@
+from __future__ import print_function, division, absolute_import
+from fontTools.misc.py23 import *
+from fontTools.cffLib import CFFFontSet
+from fontTools.cffLib.cff2Converter import convertCharStrings, _WidthFinder
+from fontTools.cffLib.subroutinizer import _expandCharString
+from fontTools.misc.psCharStrings import T2CharString
+from fontTools.misc.testTools import parseXML
+from fontTools.ttLib import TTFont
+import os
+import unittest
+
+
+CFF_FONT = """
+    <CFFFont name="Test">
+      <Private>
+        <defaultWidthX value="500"/>
+        <nominalWidthX value="400"/>
+        <Subrs>
+          <CharString index="0">
+            10 20 hstem return
+          </CharString>
+          <CharString index="1">
+            1 2 rlineto endchar
+          </CharString>
+        </Subrs>
+      </Private>
+      <CharStrings>
+        <CharString name=".notdef">
+          endchar
+        </CharString>
+        <CharString name="a">
+          200 10 10 rmoveto 5 6 rlineto endchar
+        </CharString>
+        <CharString name="b">
+          -300 -107 callsubr 10 hmoveto -106 callsubr
+        </CharString>
+        <CharString name="c">
+          10 20 -107 callsubr 10 vmoveto 5 6 rlineto endchar
+        </CharString>
+        <CharString name="d">
+          150 endchar
+        </CharString>
+        <CharString name="e">
+          1 2 rlineto endchar
+        </CharString>
+      </CharStrings>
+    </CFFFont>
+"""
+
+
+def loadCFF(xml, glyphOrder):
+    font = TTFont()
+    font.setGlyphOrder(glyphOrder)
+    cff = CFFFontSet()
+    for element in parseXML(xml):
+        if isinstance(element, tuple):
+            cff.fromXML(*element, otFont=font)
+    cff.topDictIndex[0].charset = glyphOrder
+    # Round-trip, to work on charstrings read from a binary font.
+    file = BytesIO()
+    cff.compile(file, font)
+    file.seek(0)
+    cff = CFFFontSet()
+    cff.decompile(file, font)
+    return cff
+
+
+def bytecode(program):
+    return T2CharString(program=program).encodeProgram(isCFF2=True)
+
+
+class ConvertCharStringsTest(unittest.TestCase):
+
+    def test_convertCharStrings(self):
+        cff = loadCFF(CFF_FONT, [".notdef", "a", "b", "c", "d", "e"])
+        topDict = cff.topDictIndex[0]
+        # A loaded and modified charstring.
+        charStrings = topDict.CharStrings
+        charStrings["a"].decompile()
+        charStrings["a"].program[1] = 20
+        convertCharStrings(topDict, cff.GlobalSubrs)
+
+        self.assertEqual(charStrings[".notdef"].bytecode, b"")
+        self.assertEqual(charStrings["a"].bytecode,
+                         bytecode([20, 10, 'rmoveto', 5, 6, 'rlineto']))
+        # The width comes before a subroutine with the stems.
+        self.assertEqual(charStrings["b"].bytecode,
+                         bytecode([-107, 'callsubr', 10, 'hmoveto',
+                                   -106, 'callsubr']))
+        self.assertEqual(charStrings["c"].bytecode,
+                         bytecode([10, 20, -107, 'callsubr', 10, 'vmoveto',
+                                   5, 6, 'rlineto']))
+        self.assertEqual(charStrings["d"].bytecode, b"")
+        # Operators the width finder doesn't follow: decompiled.
+        self.assertEqual(charStrings["e"].bytecode,
+                         bytecode([1, 2, 'rlineto']))
+
+        subrs = topDict.Private.Subrs
+        self.assertEqual(subrs[0].bytecode, bytecode([10, 20, 'hstem']))
+        self.assertEqual(subrs[1].bytecode, bytecode([1, 2, 'rlineto']))
+
+    def test_widthLength(self):
+        finder = _WidthFinder([], [[bytecode([10, 20, 'hstem'])]])
+        self.assertEqual(finder.widthLength(
+            bytecode([300, -107, 'callsubr', 10, 'hmoveto']), 0), 2)
+        # To be decompiled: a subroutine number that isn't an integer, a
+        # computed one and an operator that isn't followed.
+        for program in ([300, -107.0, 'callsubr', 10, 'hmoveto'],
+                        [300, -108, 1, 'add', 'callsubr', 10, 'hmoveto'],
+                        [300, 1, 'neg', 10, 'hmoveto']):
+            self.assertIsNone(finder.widthLength(bytecode(program), 0))
+
+    def test_convertCFFToCFF2(self):
+        glyphOrder = [".notdef", "a", "b", "c", "d", "e"]
+        cff = loadCFF(CFF_FONT, glyphOrder)
+        font = TTFont()
+        font.setGlyphOrder(glyphOrder)
+        cff.convertCFFToCFF2(font)
+        self.assertEqual(cff.major, 2)
+        topDict = cff.topDictIndex[0]
+        charString = topDict.CharStrings["b"]
+        charString.decompile()
+        self.assertEqual(charString.program,
+                         [-107, 'callsubr', 10, 'hmoveto', -106, 'callsubr'])
+
+    def test_convertCFFToCFF2_width_in_subr(self):
+        # Some glyphs push their width inside a local subroutine.
+        path = os.path.join(os.path.dirname(__file__), os.pardir, "varLib",
+                            "data", "master_ttx_interpolatable_otf",
+                            "TestFamily2-Master0.ttx")
+        font = TTFont()
+        font.importXML(path)
+        file = BytesIO()
+        font.save(file)
+        file.seek(0)
+        font = TTFont(file)
+        font.getGlyphOrder()
+        cff = font["CFF "].cff
+        charStrings = cff.topDictIndex[0].CharStrings
+        expected = {}
+        for name in charStrings.keys():
+            program = _expandCharString(charStrings[name], cff.GlobalSubrs)
+            if name in ("d", "a.alt"):
+                self.assertEqual(program[0], 540)
+            expected[name] = program
+        cff.convertCFFToCFF2(font)
+        self.assertEqual(cff.major, 2)
+        charStrings = cff.topDictIndex[0].CharStrings
+        for name in charStrings.keys():
+            program = _expandCharString(charStrings[name], cff.GlobalSubrs)
+            # Without the width, if any, and the final 'endchar'.
+            self.assertEqual(expected[name][-len(program) - 1:-1], program)
+            self.assertIn(len(expected[name]) - len(program), (1, 2))
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(unittest.main())
@@ -1,6 +1,11 @@
 from __future__ import print_function, division, absolute_import
-from fontTools.cffLib import TopDict, PrivateDict, CharStrings
+from fontTools.misc.py23 import *
+from fontTools.cffLib import TopDict, PrivateDict, CharStrings, Index
+from fontTools.cffLib import (
+    FDSelect, FDSelectCompiler, CharsetCompiler, parseCharset0, parseCharset,
+    GlobalSubrsIndex, packOffsets, readOffsets)
 from fontTools.misc.testTools import parseXML
+import struct
 import unittest
 
 
@@ -43,6 +48,102 @@ class TopDictTest(unittest.TestCase):
         self.assertEqual(topDict.FontBBox, [0, 0, 0, 0])
 
 
+class IndexTest(unittest.TestCase):
+
+    def test_decompile(self):
+        items = [b"", b"a", b"bc" * 50, b"def"]
+        offsets = [1]
+        for item in items:
+            offsets.append(offsets[-1] + len(item))
+        for offSize in (1, 2, 3, 4):
+            data = struct.pack(">HB", len(items), offSize)
+            for offset in offsets:
+                data += struct.pack(">L", offset)[4 - offSize:]
+            data += bytesjoin(items) + b"tail"
+            file = BytesIO(b"head" + data)
+            file.seek(4)
+            index = Index(file, isCFF2=False)
+            self.assertEqual(file.read(), b"tail")
+            self.assertEqual(list(index.offsets), offsets)
+            self.assertEqual([index[i] for i in range(len(items))], items)
+
+    def test_packOffsets(self):
+        offsets = [1, 2, 0x80, 0xFF]
+        for offSize in (1, 2, 3, 4):
+            data = packOffsets(offsets, offSize)
+            self.assertEqual(len(data), 4 * offSize)
+            self.assertEqual(list(readOffsets(BytesIO(data), 4, offSize)),
+                             offsets)
+        self.assertEqual(packOffsets([1, 0x10203], 3), b"\0\0\1\1\2\3")
+
+    def test_compile_unloaded(self):
+        items = [b"\x8b\x0b", b"\x8c\x8c\x05\x0b", b"\x0b"]
+        data = struct.pack(">HB", len(items), 1) + bytes(bytearray([1, 3, 7, 8]))
+        data += bytesjoin(items)
+        index = GlobalSubrsIndex(BytesIO(data), isCFF2=False)
+        index[1].decompile()
+        index[1].program[0] = 2
+        file = BytesIO()
+        index.getCompiler(None, None, isCFF2=False).toFile(file)
+        self.assertEqual(file.getvalue(), data.replace(b"\x8c\x8c", b"\x8d\x8c"))
+        # Items that are not loaded are copied from the data.
+        self.assertIsNone(index.items[0])
+        self.assertIsNone(index.items[2])
+
+
+class FDSelectTest(unittest.TestCase):
+
+    def test_format3(self):
+        data = struct.pack(">BHHBHBHBH", 3, 3, 0, 1, 2, 0, 5, 10, 7)
+        fdSelect = FDSelect(BytesIO(data), 7)
+        self.assertEqual(list(fdSelect.gidArray), [1, 1, 0, 0, 0, 10, 10])
+        fdSelect.format = None
+        compiler = FDSelectCompiler(fdSelect, None)
+        # format 0 is smaller for so few glyphs
+        self.assertEqual(fdSelect.format, 0)
+        self.assertEqual(compiler.data, b"\x00\x01\x01\x00\x00\x00\x0a\x0a")
+        fdSelect.format = 3
+        self.assertEqual(FDSelectCompiler(fdSelect, None).data, data)
+
+    def test_format0(self):
+        fdSelect = FDSelect(BytesIO(b"\x00" + b"\x02" * 10), 10)
+        self.assertEqual(list(fdSelect.gidArray), [2] * 10)
+        fdSelect.format = None
+        self.assertEqual(FDSelectCompiler(fdSelect, None).data,
+                         struct.pack(">BHHBH", 3, 1, 0, 2, 10))
+        self.assertEqual(fdSelect.format, 3)
+
+
+class CharsetTest(unittest.TestCase):
+
+    def compile(self, charset):
+        class Parent(object):
+            pass
+        parent = Parent()
+        parent.dictObj = TopDict()
+        parent.dictObj.ROS = ("Adobe", "Identity", 0)
+        return CharsetCompiler(None, charset, parent).data
+
+    def test_cid(self):
+        charset = [".notdef"] + ["cid%05d" % cid for cid in range(1, 300)]
+        data = self.compile(charset)
+        self.assertEqual(data, struct.pack(">BHH", 2, 1, 298))
+        self.assertEqual(
+            parseCharset(300, BytesIO(data[1:]), None, True, 2), charset)
+
+        charset = [".notdef", "cid00003", "cid00001"]
+        data = self.compile(charset)
+        self.assertEqual(data, struct.pack(">BHH", 0, 3, 1))
+        self.assertEqual(parseCharset0(3, BytesIO(data[1:]), None, True),
+                         charset)
+
+        charset = [".notdef", "cid00010", "cid00011", "cid00012"]
+        data = self.compile(charset)
+        self.assertEqual(data, struct.pack(">BHB", 1, 10, 2))
+        self.assertEqual(
+            parseCharset(4, BytesIO(data[1:]), None, True, 1), charset)
+
+
 if __name__ == "__main__":
     import sys
     sys.exit(unittest.main())
@@ -0,0 +1,102 @@
+from __future__ import print_function, division, absolute_import
+from fontTools.misc.py23 import *
+from fontTools.cffLib import CFFFontSet
+from fontTools.cffLib.dehinter import dehint
+from fontTools.misc.testTools import parseXML
+from fontTools.ttLib import TTFont
+import unittest
+
+
+CFF_FONT = """
+    <CFFFont name="Test">
+      <Private>
+        <BlueValues value="-10 0 500 510"/>
+        <StdHW value="50"/>
+        <defaultWidthX value="500"/>
+        <nominalWidthX value="400"/>
+        <Subrs>
+          <CharString index="0">
+            10 20 hstemhm 30 40 return
+          </CharString>
+          <CharString index="1">
+            1 2 rlineto return
+          </CharString>
+          <CharString index="2">
+            50 60 vstem return
+          </CharString>
+        </Subrs>
+      </Private>
+      <CharStrings>
+        <CharString name=".notdef">
+          endchar
+        </CharString>
+        <CharString name="a">
+          200 10 20 hstemhm 30 40 hintmask 11000000 10 10 rmoveto
+          hintmask 10000000 5 6 rlineto endchar
+        </CharString>
+        <CharString name="b">
+          -107 callsubr hintmask 11000000 10 10 rmoveto -106 callsubr
+          endchar
+        </CharString>
+        <CharString name="c">
+          150 -105 callsubr 10 10 rmoveto -105 callsubr 5 6 rlineto endchar
+        </CharString>
+      </CharStrings>
+    </CFFFont>
+"""
+
+
+def loadCFF(xml, glyphOrder):
+    font = TTFont()
+    font.setGlyphOrder(glyphOrder)
+    cff = CFFFontSet()
+    for element in parseXML(xml):
+        if isinstance(element, tuple):
+            cff.fromXML(*element, otFont=font)
+    cff.topDictIndex[0].charset = glyphOrder
+    # Round-trip, to work on charstrings read from a binary font.
+    file = BytesIO()
+    cff.compile(file, font)
+    file.seek(0)
+    cff = CFFFontSet()
+    cff.decompile(file, font)
+    return cff
+
+
+def program(charString):
+    charString.decompile()
+    return charString.program
+
+
+class DehinterTest(unittest.TestCase):
+
+    def test_dehint(self):
+        cff = loadCFF(CFF_FONT, [".notdef", "a", "b", "c"])
+        topDict = cff.topDictIndex[0]
+        dehint(topDict)
+
+        charStrings = topDict.CharStrings
+        # The implicit vstem goes, and the width is put back.
+        self.assertEqual(program(charStrings["a"]),
+                         [200, 10, 10, 'rmoveto', 5, 6, 'rlineto', 'endchar'])
+        # The subroutine with the stems is called before any other
+        # operator, so the call is dropped.
+        self.assertEqual(program(charStrings["b"]),
+                         [10, 10, 'rmoveto', -106, 'callsubr', 'endchar'])
+        # After a path operator, calls to a stems-only subroutine go.
+        self.assertEqual(program(charStrings["c"]),
+                         [150, 10, 10, 'rmoveto', 5, 6, 'rlineto',
+                          'endchar'])
+
+        subrs = topDict.Private.Subrs
+        self.assertEqual(program(subrs[0]), [30, 40, 'return'])
+        self.assertEqual(program(subrs[1]), [1, 2, 'rlineto', 'return'])
+        self.assertEqual(program(subrs[2]), ['return'])
+
+        self.assertIsNone(topDict.Private.BlueValues)
+        self.assertIsNone(topDict.Private.StdHW)
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(unittest.main())
@@ -0,0 +1,146 @@
+from __future__ import print_function, division, absolute_import
+from fontTools.misc.py23 import *
+from fontTools.cffLib.instancer import CFF2Instancer, CFF2InstancerError
+from fontTools.misc.psCharStrings import T2CharString
+from fontTools.ttLib import TTFont
+import copy
+import os
+import pickle
+import unittest
+
+
+CFF2_BIN = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                        "ttLib", "tables", "data", "C_F_F__2.bin")
+
+AXES = ["wght", "wdth"]
+
+
+def loadCFF2():
+    font = TTFont(CFF2_BIN)
+    return font, font["CFF2"].cff
+
+
+def copyDict(d):
+    # copy.copy() trips on the __getattr__ of CFF dicts.
+    copy = d.__class__.__new__(d.__class__)
+    copy.__dict__.update(d.__dict__)
+    copy.rawDict = dict(d.rawDict)
+    return copy
+
+
+def loadCFF2SharedSubr(subrProgram):
+    """Returns the CFF2 font set with a second font dict, using vsindex 1,
+    for 'dollar.nostroke', and a global subroutine called by both glyphs."""
+    font, cff = loadCFF2()
+    topDict = cff.topDictIndex[0]
+    otVarStore = topDict.VarStore.otVarStore
+    otVarStore.VarData.append(copy.deepcopy(otVarStore.VarData[0]))
+    otVarStore.VarDataCount = len(otVarStore.VarData)
+    fontDict = copyDict(topDict.FDArray[0])
+    fontDict.Private = private = copyDict(fontDict.Private)
+    private.rawDict["vsindex"] = private.vsindex = 1
+    topDict.FDArray.append(fontDict)
+    cff.GlobalSubrs.append(T2CharString(program=subrProgram))
+    for glyphName in ("dollar", "dollar.nostroke"):
+        charString = topDict.CharStrings[glyphName]
+        charString.decompile()
+        if glyphName == "dollar.nostroke":
+            charString.private = private
+        charString.program = [-107, "callgsubr"] + charString.program
+    return font, cff
+
+
+class CFF2InstancerTest(unittest.TestCase):
+
+    def test_default_location(self):
+        font, cff = loadCFF2()
+        instancer = CFF2Instancer(cff, AXES)
+        instance = instancer.instantiate({})
+        topDict = instance.topDictIndex[0]
+        self.assertFalse(hasattr(topDict, "VarStore"))
+        program = topDict.CharStrings[".notdef"].program
+        self.assertNotIn("blend", program)
+        self.assertEqual(program[:3], [80, 0, "rmoveto"])
+        private = topDict.FDArray[0].Private
+        self.assertEqual(private.BlueValues[:3], [-20, 0, 487])
+        self.assertEqual(private.StdHW, 74)
+
+    def test_region_scalars(self):
+        font, cff = loadCFF2()
+        instancer = CFF2Instancer(cff, AXES)
+        self.assertEqual(instancer.regionScalars({"wght": -1}),
+                         {0: [0, 1, 0, 0, 0]})
+        self.assertEqual(instancer.regionScalars({"wdth": .5}),
+                         {0: [0, 0, .5, 0, 0]})
+
+    def test_many_locations(self):
+        font, cff = loadCFF2()
+        instancer = CFF2Instancer(cff, AXES)
+        light = instancer.instantiate({"wght": -1})
+        mid = instancer.instantiate({"wght": -.5, "wdth": 1})
+        self.assertEqual(
+            light.topDictIndex[0].FDArray[0].Private.BlueValues[:3],
+            [-13, 0, 470])
+        self.assertEqual(
+            mid.topDictIndex[0].FDArray[0].Private.BlueValues[:3],
+            [-12, 0, 466])
+        self.assertEqual(light.topDictIndex[0].CharStrings["dollar"].program[:3],
+                         [245, 7, "rmoveto"])
+        self.assertEqual(mid.topDictIndex[0].CharStrings["dollar"].program[:3],
+                         [251, 26, "rmoveto"])
+
+    def test_compile(self):
+        font, cff = loadCFF2()
+        instance = CFF2Instancer(cff, AXES).instantiate({"wght": -1})
+        font["CFF2"].cff = instance
+        data = font["CFF2"].compile(font)
+
+        font = TTFont(CFF2_BIN)
+        table = font["CFF2"]
+        table.decompile(data, font)
+        topDict = table.cff.topDictIndex[0]
+        self.assertFalse(hasattr(topDict, "VarStore"))
+        self.assertEqual(topDict.FDArray[0].Private.BlueValues[:3],
+                         [-13, 0, 470])
+        charString = topDict.CharStrings["dollar"]
+        charString.decompile()
+        self.assertEqual(charString.program[:3], [245, 7, "rmoveto"])
+
+    def test_pickle(self):
+        font, cff = loadCFF2()
+        instancer = pickle.loads(pickle.dumps(CFF2Instancer(cff, AXES)))
+        with self.assertRaises(CFF2InstancerError):
+            instancer.instantiate({"wght": -1})
+        for location in ({"wght": -1}, {"wght": -.5, "wdth": 1}):
+            font, cff = loadCFF2()
+            instancer.apply(cff, location)
+            expected = CFF2Instancer(loadCFF2()[1], AXES).instantiate(location)
+            topDict = cff.topDictIndex[0]
+            self.assertFalse(hasattr(topDict, "VarStore"))
+            self.assertEqual(topDict.FDArray[0].Private.BlueValues,
+                             expected.topDictIndex[0].FDArray[0].Private.BlueValues)
+            for glyphName in ("dollar", ".notdef"):
+                self.assertEqual(
+                    topDict.CharStrings[glyphName].program,
+                    expected.topDictIndex[0].CharStrings[glyphName].program)
+
+    def test_subr_with_different_vsindex(self):
+        font, cff = loadCFF2SharedSubr([10, 20, "rmoveto"])
+        CFF2Instancer(cff, AXES).apply(cff, {"wght": -1})
+        charStrings = cff.topDictIndex[0].CharStrings
+        for glyphName in ("dollar", "dollar.nostroke"):
+            program = charStrings[glyphName].program
+            self.assertEqual(program[:2], [-107, "callgsubr"])
+            self.assertNotIn("blend", program)
+        self.assertEqual(charStrings["dollar"].program[2:5],
+                         [245, 7, "rmoveto"])
+
+        font, cff = loadCFF2SharedSubr([10, 1, 1, 1, 1, 1, 1, "blend",
+                                        20, "rmoveto"])
+        with self.assertRaises(CFF2InstancerError):
+            CFF2Instancer(cff, AXES)
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(unittest.main())
@@ -912,6 +912,28 @@ class CFFSpecializeProgramTest(unittest.TestCase):
         xpct_charstr = (operands + operator + operands*8 + operator).rstrip()
         self.assertEqual(get_specialized_charstr(test_charstr), xpct_charstr)
 
+    def test_maxstack_optimal(self):
+        operands = '1 2 3 4 5 6 '
+        operator = 'rrcurveto '
+        test_charstr = (operands + operator)*9
+        xpct_charstr = (operands + operator + operands*8 + operator).rstrip()
+        self.assertEqual(get_specialized_charstr(test_charstr, optimal=True), xpct_charstr)
+
+# optimal
+    def test_optimal_rlinecurve(self):
+        # Greedily, the hlineto saves a byte over 0 as an rlineto argument, but
+        # costs an operator.
+        test_charstr = '-1 -1 rlineto -1 0 rlineto -1 1 0 -1 -1 1 rrcurveto'
+        xpct_charstr = '-1 -1 rlineto -1 hlineto -1 1 0 -1 -1 1 rrcurveto'
+        self.assertEqual(get_specialized_charstr(test_charstr), xpct_charstr)
+        xpct_charstr = '-1 -1 -1 0 -1 1 0 -1 -1 1 rlinecurve'
+        self.assertEqual(get_specialized_charstr(test_charstr, optimal=True), xpct_charstr)
+
+    def test_optimal_same_as_greedy(self):
+        test_charstr = '1 0 rlineto 0 2 rlineto 3 0 rlineto 0 4 0 5 6 0 rrcurveto 7 0 8 9 0 10 rrcurveto'
+        self.assertEqual(get_specialized_charstr(test_charstr, optimal=True),
+                         get_specialized_charstr(test_charstr))
+
 
 if __name__ == "__main__":
     import sys
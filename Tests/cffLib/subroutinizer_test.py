@@ -0,0 +1,214 @@
+from __future__ import print_function, division, absolute_import
+from fontTools.misc.py23 import *
+from fontTools.cffLib import CFFFontSet
+from fontTools.cffLib.subroutinizer import subroutinize, _expandCharString
+from fontTools.misc.testTools import parseXML
+from fontTools.ttLib import TTFont
+import unittest
+
+
+SHAPE = "100 200 rlineto 300 400 500 600 700 800 rrcurveto -300 hlineto"
+
+CFF_FONT = """
+    <CFFFont name="Test">
+      <Private>
+        <Subrs>
+          <CharString index="0">
+            %(shape)s return
+          </CharString>
+          <CharString index="1">
+            1 2 rlineto return
+          </CharString>
+        </Subrs>
+      </Private>
+      <CharStrings>
+        <CharString name=".notdef">
+          endchar
+        </CharString>
+        <CharString name="a">
+          10 10 rmoveto %(shape)s 30 vlineto %(shape)s endchar
+        </CharString>
+        <CharString name="b">
+          20 20 rmoveto %(shape)s -107 callsubr endchar
+        </CharString>
+        <CharString name="c">
+          30 30 rmoveto %(shape)s endchar
+        </CharString>
+      </CharStrings>
+    </CFFFont>
+""" % {"shape": SHAPE}
+
+WIDTH_FONT = """
+    <CFFFont name="TestWidth">
+      <Private>
+        <defaultWidthX value="500"/>
+        <nominalWidthX value="400"/>
+      </Private>
+      <CharStrings>
+        <CharString name=".notdef">
+          endchar
+        </CharString>
+        <CharString name="a">
+          100 10 10 rmoveto %(shape)s endchar
+        </CharString>
+        <CharString name="b">
+          100 10 10 rmoveto %(shape)s endchar
+        </CharString>
+        <CharString name="c">
+          100 10 10 rmoveto %(shape)s endchar
+        </CharString>
+        <CharString name="d">
+          100 10 10 rmoveto %(shape)s 5 hlineto endchar
+        </CharString>
+      </CharStrings>
+    </CFFFont>
+""" % {"shape": SHAPE}
+
+CID_FONT = """
+    <CFFFont name="TestCID">
+      <ROS Registry="Adobe" Order="Identity" Supplement="0"/>
+      <CIDCount value="5"/>
+      <FDSelect format="3"/>
+      <FDArray>
+        <FontDict index="0">
+          <Private>
+          </Private>
+        </FontDict>
+        <FontDict index="1">
+          <Private>
+          </Private>
+        </FontDict>
+      </FDArray>
+      <CharStrings>
+        <CharString name=".notdef" fdSelectIndex="0">
+          endchar
+        </CharString>
+        <CharString name="cid00001" fdSelectIndex="0">
+          10 10 rmoveto %(shape)s endchar
+        </CharString>
+        <CharString name="cid00002" fdSelectIndex="1">
+          20 20 rmoveto %(shape)s %(local)s endchar
+        </CharString>
+        <CharString name="cid00003" fdSelectIndex="1">
+          30 30 rmoveto %(local)s endchar
+        </CharString>
+        <CharString name="cid00004" fdSelectIndex="1">
+          40 40 rmoveto %(local)s endchar
+        </CharString>
+      </CharStrings>
+    </CFFFont>
+""" % {"shape": SHAPE,
+       "local": "1000 2000 3000 4000 5000 6000 rrcurveto 7000 8000 rlineto"}
+
+
+def loadCFF(xml, glyphOrder):
+    font = TTFont()
+    font.setGlyphOrder(glyphOrder)
+    cff = CFFFontSet()
+    for element in parseXML(xml):
+        if isinstance(element, tuple):
+            cff.fromXML(*element, otFont=font)
+    topDict = cff.topDictIndex[0]
+    topDict.charset = glyphOrder
+    if hasattr(topDict, "FDArray"):
+        topDict.FDArray.GlobalSubrs = cff.GlobalSubrs
+    return cff
+
+
+def expandAll(cff):
+    charStrings = cff.topDictIndex[0].CharStrings
+    return {name: _expandCharString(charStrings[name], cff.GlobalSubrs)
+            for name in charStrings.keys()}
+
+
+class SubroutinizerTest(unittest.TestCase):
+
+    def test_subroutinize(self):
+        cff = loadCFF(CFF_FONT, [".notdef", "a", "b", "c"])
+        expected = expandAll(cff)
+
+        subroutinize(cff)
+
+        self.assertEqual(expandAll(cff), expected)
+        topDict = cff.topDictIndex[0]
+        subrs = topDict.Private.Subrs
+        self.assertEqual(len(subrs), 1)
+        self.assertEqual(subrs[0].program,
+                         [100, 200, 'rlineto', 300, 400, 500, 600, 700, 800,
+                          'rrcurveto', -300, 'hlineto', 'return'])
+        self.assertEqual(topDict.CharStrings["c"].program,
+                         [30, 30, 'rmoveto', -107, 'callsubr', 'endchar'])
+        self.assertEqual(len(cff.GlobalSubrs), 0)
+
+    def test_subroutinize_per_fd(self):
+        glyphOrder = [".notdef", "cid00001", "cid00002", "cid00003", "cid00004"]
+        cff = loadCFF(CID_FONT, glyphOrder)
+        expected = expandAll(cff)
+
+        subroutinize(cff)
+
+        self.assertEqual(expandAll(cff), expected)
+        fdArray = cff.topDictIndex[0].FDArray
+        # Shared by both FDs: goes into the global subrs.
+        self.assertEqual(len(cff.GlobalSubrs), 1)
+        self.assertEqual(cff.GlobalSubrs[0].program,
+                         [100, 200, 'rlineto', 300, 400, 500, 600, 700, 800,
+                          'rrcurveto', -300, 'hlineto', 'return'])
+        # Only used in FD 1: goes into that FD's local subrs.
+        self.assertFalse(hasattr(fdArray[0].Private, "Subrs"))
+        self.assertEqual(len(fdArray[1].Private.Subrs), 1)
+        self.assertEqual(fdArray[1].Private.Subrs[0].program,
+                         [1000, 2000, 3000, 4000, 5000, 6000, 'rrcurveto',
+                          7000, 8000, 'rlineto', 'endchar'])
+        self.assertEqual(
+            cff.topDictIndex[0].CharStrings["cid00003"].program,
+            [30, 30, 'rmoveto', -107, 'callsubr'])
+
+    def test_subroutinize_keeps_width(self):
+        glyphOrder = [".notdef", "a", "b", "c", "d"]
+        cff = loadCFF(WIDTH_FONT, glyphOrder)
+        expected = expandAll(cff)
+
+        subroutinize(cff)
+
+        self.assertEqual(expandAll(cff), expected)
+        topDict = cff.topDictIndex[0]
+        for name in glyphOrder[1:]:
+            self.assertEqual(topDict.CharStrings[name].program[0], 100)
+        for subr in topDict.Private.Subrs:
+            self.assertNotEqual(subr.program[0], 100)
+
+        font = TTFont()
+        font.setGlyphOrder(glyphOrder)
+        file = BytesIO()
+        cff.compile(file, font)
+        file.seek(0)
+        cff = CFFFontSet()
+        cff.decompile(file, font)
+        cff.convertCFFToCFF2(font)
+        charString = cff.topDictIndex[0].CharStrings["a"]
+        charString.decompile()
+        self.assertEqual(charString.program, [-107, 'callsubr'])
+
+    def test_compile_subroutinize(self):
+        glyphOrder = [".notdef", "a", "b", "c"]
+        font = TTFont()
+        font.setGlyphOrder(glyphOrder)
+        font.recalcBBoxes = False
+        plain = BytesIO()
+        loadCFF(CFF_FONT, glyphOrder).compile(plain, font)
+        cff = loadCFF(CFF_FONT, glyphOrder)
+        expected = expandAll(cff)
+        subroutinized = BytesIO()
+        cff.compile(subroutinized, font, subroutinize=True)
+        self.assertLess(len(subroutinized.getvalue()), len(plain.getvalue()))
+
+        subroutinized.seek(0)
+        cff = CFFFontSet()
+        cff.decompile(subroutinized, font)
+        self.assertEqual(expandAll(cff), expected)
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(unittest.main())
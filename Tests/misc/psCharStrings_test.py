@@ -1,7 +1,9 @@
 from __future__ import print_function, division, absolute_import
 from fontTools.cffLib import PrivateDict
 from fontTools.cffLib.specializer import stringToProgram
-from fontTools.misc.psCharStrings import T2CharString
+from fontTools.pens.boundsPen import BoundsPen
+from fontTools.misc.psCharStrings import (
+    T2CharString, decodeT2, t2OperatorNames)
 import unittest
 
 
@@ -26,6 +28,98 @@ class T2CharStringTest(unittest.TestCase):
         bounds = cs.calcBounds()
         self.assertEqual(bounds, (91.90524980688875, -12.5, 208.09475019311125, 100))
 
+    def test_calcBounds_matches_pen(self):
+        private = PrivateDict()
+        private.nominalWidthX = 0
+        private.defaultWidthX = 0
+        for string in [
+                "10 20 30 40 hstemhm hintmask 50 60 rlineto 10 20 30 40 50 60 rrcurveto endchar",
+                "300 -40 hmoveto 5 5 rlineto 0 100 30 40 -20 -30 rrcurveto endchar",
+                "10 10 rmoveto 10 20 30 0 40 50 60 hflex 10 20 30 40 50 60 70 80 90 -40 0 flex1 endchar",
+                "0 0 rmoveto 10 20 30 40 50 vhcurveto 10 20 30 40 50 60 70 80 hvcurveto "
+                "10 20 30 40 50 vvcurveto 5 10 20 30 40 hhcurveto 10 20 30 40 50 60 70 80 rcurveline endchar",
+                ]:
+            cs = T2CharString(program=stringToProgram(string), private=private)
+            if "hintmask" in string:
+                i = cs.program.index("hintmask")
+                cs.program.insert(i + 1, b"\x80")
+            pen = BoundsPen(None)
+            cs.draw(pen)
+            self.assertEqual(cs.calcBounds(), pen.bounds)
+
+    def test_decodeT2(self):
+        cs = T2CharString(program=[1, 2, 3, 4, "hstem", -1000, 2.5,
+                                   "hintmask", b"\xa0", 1000, -108, "rmoveto",
+                                   0, 1, 2, 3, 4, 5, 6, "flex", "endchar"])
+        cs.compile()
+        data = bytearray(cs.bytecode)
+        operands, opcodes, argEnds, opEnds, index = decodeT2(data)
+        # Decoding stops after the mask operator.
+        self.assertEqual(operands, [1, 2, 3, 4, -1000, 2.5])
+        self.assertEqual([t2OperatorNames[op] for op in opcodes],
+                         ["hstem", "hintmask"])
+        self.assertEqual(list(argEnds), [4, 6])
+        self.assertEqual(opEnds[-1], index)
+        operands, opcodes, argEnds, opEnds, index = decodeT2(data, index + 1)
+        self.assertEqual(operands, [1000, -108, 0, 1, 2, 3, 4, 5, 6])
+        self.assertEqual([t2OperatorNames[op] for op in opcodes],
+                         ["rmoveto", "flex", "endchar"])
+        self.assertEqual(index, len(data))
+
+    def test_tokenize(self):
+        private = PrivateDict()
+        private.Subrs = [T2CharString(program=stringToProgram(
+            "30 40 hstem 5 6 rlineto return"))]
+        cs = T2CharString(program=[10, 20, -107, "callsubr",
+                                   "hintmask", b"\xc0", 1, 2, "rlineto",
+                                   "endchar"], private=private)
+        operands, opcodes, argEnds, hintMasks = cs.tokenize()
+        self.assertEqual(operands, [10, 20, -107, 1, 2])
+        self.assertEqual([t2OperatorNames[op] for op in opcodes],
+                         ["callsubr", "hintmask", "rlineto", "endchar"])
+        # The subroutine's stems decide the mask length.
+        self.assertEqual(hintMasks, [b"\xc0"])
+        cs.compile()
+        operands, opcodes, argEnds, hintMasks = cs.tokenize(inlineSubrs=True)
+        self.assertEqual(operands, [10, 20, 30, 40, 5, 6, 1, 2])
+        self.assertEqual([t2OperatorNames[op] for op in opcodes],
+                         ["hstem", "rlineto", "hintmask", "rlineto", "endchar"])
+        self.assertEqual(list(argEnds), [4, 6, 6, 8, 8])
+        self.assertEqual(hintMasks, [b"\xc0"])
+
+    def test_decompile_bytecode(self):
+        program = [1, 2, "hstemhm", 300, -300, 1000, -1000, -32768, 0.5,
+                   "rmoveto", "hintmask", b"\x80", 2, 3, "rlineto", "endchar"]
+        cs = T2CharString(program=program)
+        cs.compile()
+        cs.decompile()
+        self.assertEqual(cs.program, program)
+
+    def test_compile_reuses_bytecode(self):
+        # 100 as a shortint is not how the encoder would write it.
+        bytecode = b"\x1c\x00\x64\xef\x15\x0e"
+        cs = T2CharString(bytecode=bytecode)
+        cs.decompile()
+        self.assertEqual(cs.program, [100, 100, "rmoveto", "endchar"])
+        cs.compile()
+        self.assertEqual(cs.bytecode, bytecode)
+
+        cs.decompile()
+        cs.program[0] = 101
+        cs.compile()
+        self.assertEqual(cs.bytecode, b"\xf0\xef\x15\x0e")
+
+        cs.decompile()
+        cs.program[:2] = [100, 100]
+        cs.compile()
+        self.assertEqual(cs.bytecode, b"\xef\xef\x15\x0e")
+
+        cs = T2CharString(bytecode=bytecode)
+        cs.decompile()
+        cs.setProgram([100, 100, "rmoveto", "endchar"])
+        cs.compile()
+        self.assertEqual(cs.bytecode, b"\xef\xef\x15\x0e")
+
 
 if __name__ == "__main__":
     import sys
@@ -0,0 +1,37 @@
+from __future__ import print_function, division, absolute_import
+from fontTools.misc.py23 import *
+from fontTools.misc.workerTools import mapInWorkers
+import os
+import pytest
+
+
+def setup(factor):
+    return factor, os.getpid()
+
+
+def scale(state, item):
+    factor, setupPid = state
+    return item * factor, setupPid, os.getpid()
+
+
+def test_mapInWorkers_serial():
+    results = mapInWorkers(scale, range(5), workers=4, state=3, setup=setup,
+                           chunkSize=10)
+    pid = os.getpid()
+    assert results == [(i * 3, pid, pid) for i in range(5)]
+
+
+def test_mapInWorkers_without_setup():
+    results = mapInWorkers(scale, [1, 2], state=(2, None))
+    pid = os.getpid()
+    assert results == [(2, None, pid), (4, None, pid)]
+
+
+@pytest.mark.parametrize("chunkSize", [1, 3])
+def test_mapInWorkers_processes(chunkSize):
+    results = mapInWorkers(scale, range(7), workers=2, state=5, setup=setup,
+                           chunkSize=chunkSize)
+    assert [r for r, _, _ in results] == [i * 5 for i in range(7)]
+    for _, setupPid, pid in results:
+        # setup ran in the same worker process.
+        assert setupPid == pid != os.getpid()
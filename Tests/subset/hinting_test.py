@@ -0,0 +1,147 @@
+from __future__ import print_function, division, absolute_import
+from fontTools.misc.py23 import *
+from fontTools.subset import hinting
+from fontTools.ttLib.tables import ttProgram
+import unittest
+
+
+def assemble(assembly):
+    program = ttProgram.Program()
+    program.fromAssembly(assembly)
+    return program.getBytecode()
+
+
+FPGM = assemble(
+    "PUSH[ ] 0 FDEF[ ] RCVT[ ] POP[ ] ENDF[ ] "
+    "PUSH[ ] 1 FDEF[ ] PUSH[ ] 0 CALL[ ] ENDF[ ] "
+    "PUSH[ ] 2 FDEF[ ] PUSH[ ] 5 RCVT[ ] POP[ ] ENDF[ ]")
+
+# Calls the function whose number is on top of the stack as many times as
+# the value below says, the way ttfautohint's bci_loop does: the number
+# is kept in storage location 7 and read back by function 4.
+LOOP = (
+    "PUSH[ ] 3 FDEF[ ] PUSH[ ] 7 SWAP[ ] WS[ ] PUSH[ ] 4 LOOPCALL[ ] ENDF[ ] "
+    "PUSH[ ] 4 FDEF[ ] PUSH[ ] 7 RS[ ] CALL[ ] ENDF[ ]")
+
+
+def analyze(fpgm=FPGM, interpret=True, **programs):
+    programs["fpgm"] = fpgm
+    roots = ["fpgm"] + (["prep"] if "prep" in programs else [])
+    roots += sorted(k for k in programs if k not in ("fpgm", "prep"))
+    return hinting.HintingAnalysis(programs, roots, interpret=interpret)
+
+
+class CountingAnalysis(hinting.HintingAnalysis):
+    """Counts the runs of each glyph program."""
+
+    def _run(self, program, start, end, state, depth):
+        if not depth and program.key not in ("fpgm", "prep"):
+            self.runs[program.key] = self.runs.get(program.key, 0) + 1
+        return super(CountingAnalysis, self)._run(program, start, end,
+                                                  state, depth)
+
+
+class HintingAnalysisTest(unittest.TestCase):
+
+    def test_calls(self):
+        analysis = analyze(prep=assemble("PUSH[ ] 2 0 CALL[ ]"),
+                           a=assemble("PUSH[ ] 4 1 CALL[ ]"),
+                           interpret=False)
+        self.assertEqual(analysis.functions, {0, 1})
+        self.assertEqual([d[0] for d in analysis.definitions["fpgm"]],
+                         [0, 1, 2])
+        self.assertEqual(analysis.jumping, set())
+
+    def test_calls_not_pushed(self):
+        for assembly in ("PUSH[ ] 7 2 WS[ ] PUSH[ ] 7 RS[ ] CALL[ ]",
+                         "MPPEM[ ] PUSH[ ] 9 LT[ ] IF[ ] PUSH[ ] 2 ELSE[ ] "
+                         "PUSH[ ] 2 EIF[ ] CALL[ ]",
+                         "PUSH[ ] 2 3 JMPR[ ] PUSH[ ] 1 CALL[ ]"):
+            with self.assertRaises(hinting.HintingAnalysisError):
+                analyze(a=assemble(assembly), interpret=False)
+            self.assertEqual(analyze(a=assemble(assembly)).functions, {2})
+
+    def test_jumping(self):
+        analysis = analyze(prep=assemble("PUSH[ ] 3 JMPR[ ] PUSH[ ] 1 POP[ ]"),
+                           interpret=False)
+        self.assertEqual(analysis.jumping, {"prep"})
+
+    def test_branches(self):
+        analysis = analyze(a=assemble(
+            "MPPEM[ ] PUSH[ ] 9 LT[ ] IF[ ] PUSH[ ] 3 ELSE[ ] PUSH[ ] 4 EIF[ ] "
+            "PUSH[ ] 0 CALL[ ]"))
+        self.assertEqual(analysis.functions, {0})
+
+    def test_function_number_from_storage(self):
+        analysis = analyze(a=assemble(
+            "PUSH[ ] 7 2 WS[ ] PUSH[ ] 3 7 RS[ ] CALL[ ]"))
+        self.assertEqual(analysis.functions, {2})
+
+    def test_function_number_from_other_glyph(self):
+        analysis = analyze(a=assemble("PUSH[ ] 7 2 WS[ ]"),
+                           b=assemble("PUSH[ ] 3 7 RS[ ] CALL[ ]"))
+        # Glyph b may run before a, when storage is still zeros.
+        self.assertEqual(analysis.functions, {0, 2})
+
+    def test_function_number_from_prep(self):
+        analysis = analyze(prep=assemble("PUSH[ ] 7 2 WS[ ] PUSH[ ] 6 2 WCVTP[ ]"),
+                           a=assemble("PUSH[ ] 7 RS[ ] CALL[ ]"),
+                           b=assemble("PUSH[ ] 6 RCVT[ ] CALL[ ]"))
+        self.assertEqual(analysis.functions, {2})
+
+    def test_function_number_dispatch(self):
+        analysis = analyze(fpgm=FPGM + assemble(LOOP),
+                           a=assemble("PUSH[ ] 3 2 3 CALL[ ]"))
+        self.assertEqual(analysis.functions, {2, 3, 4})
+
+    def test_function_number_arithmetic(self):
+        analysis = analyze(a=assemble(
+            "PUSH[ ] 4 MPPEM[ ] PUSH[ ] 9 LT[ ] IF[ ] PUSH[ ] 0 ELSE[ ] "
+            "PUSH[ ] 1 EIF[ ] PUSH[ ] 1 ADD[ ] CALL[ ]"))
+        self.assertEqual(analysis.functions, {0, 1, 2})
+
+    def test_computed_function_number(self):
+        with self.assertRaises(hinting.HintingAnalysisError):
+            analyze(a=assemble("MPPEM[ ] CALL[ ]"))
+
+    def test_glyph_programs_run_again(self):
+        read = assemble("PUSH[ ] 3 7 RS[ ] CALL[ ]")
+        programs = {"fpgm": FPGM + assemble(LOOP),
+                    "a": read, "b": read,
+                    "c": assemble("PUSH[ ] 8 RS[ ] POP[ ] PUSH[ ] 2 CALL[ ]"),
+                    "d": assemble("PUSH[ ] 7 2 WS[ ]")}
+        analysis = CountingAnalysis.__new__(CountingAnalysis)
+        analysis.runs = {}
+        analysis.__init__(programs, ["fpgm", "a", "b", "c", "d"],
+                          interpret=True)
+        self.assertEqual(analysis.functions, {0, 2})
+        # d's write makes a run again; b is the same program as a, and c
+        # reads another location.
+        self.assertEqual(analysis.runs, {"a": 2, "c": 1, "d": 1})
+
+    def test_steps_per_program(self):
+        # 15 steps each, with the function called.
+        call = "PUSH[ ] 3 7 RS[ ] CALL[ ]"
+        programs = {k: assemble("PUSH[ ] 1 POP[ ] " * 5 + call) for k in "abc"}
+        limit = hinting.MAX_STEPS
+        hinting.MAX_STEPS = 16
+        try:
+            analyze(**programs)
+            with self.assertRaises(hinting.HintingAnalysisError):
+                analyze(a=assemble("PUSH[ ] 1 POP[ ] " * 7 + call))
+        finally:
+            hinting.MAX_STEPS = limit
+
+    def test_remove_function_bodies(self):
+        analysis = analyze(a=assemble("PUSH[ ] 4 1 CALL[ ]"), interpret=False)
+        self.assertEqual(
+            hinting.removeFunctionBodies(FPGM, analysis.definitions["fpgm"],
+                                         analysis.functions),
+            assemble("PUSH[ ] 0 FDEF[ ] RCVT[ ] POP[ ] ENDF[ ] "
+                     "PUSH[ ] 1 FDEF[ ] PUSH[ ] 0 CALL[ ] ENDF[ ] "
+                     "PUSH[ ] 2 FDEF[ ] ENDF[ ]"))
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(unittest.main())
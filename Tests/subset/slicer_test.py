@@ -0,0 +1,110 @@
+from __future__ import print_function, division, absolute_import
+from fontTools.misc.py23 import *
+from fontTools.subset import slicer
+from fontTools.ttLib import TTFont
+from fontTools.ttLib.tables._g_l_y_f import Glyph, GlyphComponent
+import os
+import unittest
+
+
+def getpath(testfile):
+    path, _ = os.path.split(__file__)
+    return os.path.join(path, "data", testfile)
+
+
+def load_ttx(testfile):
+    font = TTFont()
+    font.importXML(getpath(testfile))
+    return font
+
+
+class SlicerTest(unittest.TestCase):
+
+    def test_unicode_range(self):
+        self.assertEqual(slicer.unicode_range([]), "")
+        self.assertEqual(slicer.unicode_range([0x41]), "U+41")
+        self.assertEqual(slicer.unicode_range([0x43, 0x41, 0x42, 0x45, 0x1F600]),
+                         "U+41-43, U+45, U+1F600")
+
+    def test_plan_slices_keeps_ligature_components_together(self):
+        font = load_ttx("Lobster.subset.ttx")
+        slices = slicer.plan_slices(font, rule_overhead=0, slice_overhead=0,
+                                    max_slice_size=0)
+        # With no cost per slice, every group is its own slice.
+        self.assertIn([0x49, 0x4A], slices)
+        self.assertEqual(sorted(u for s in slices for u in s),
+                         [0x30, 0x31, 0x32, 0x33, 0x41, 0x42, 0x49, 0x4A])
+        self.assertEqual(len(slices), 7)
+
+    def test_plan_slices_frequencies(self):
+        font = load_ttx("Lobster.subset.ttx")
+        frequencies = {0x41: .9, 0x42: .9}
+        slices = slicer.plan_slices(font, frequencies, default_frequency=.0001)
+        self.assertEqual(slices, [[0x41, 0x42],
+                                  [0x30, 0x31, 0x32, 0x33, 0x49, 0x4A]])
+
+    def test_plan_slices_composites(self):
+        # A and C are composites of B, which isn't mapped.
+        font = load_ttx("TestTTF-Regular.ttx")
+        glyf = font["glyf"]
+        for g in ("A", "C"):
+            component = GlyphComponent()
+            component.glyphName = "B"
+            component.x = component.y = 0
+            component.flags = 0
+            glyph = Glyph()
+            glyph.numberOfContours = -1
+            glyph.components = [component]
+            glyf[g] = glyph
+            glyph.recalcBounds(glyf)
+        for t in font["cmap"].tables:
+            del t.cmap[0x42]
+        self.assertEqual(slicer._glyph_components(font), {"A": ["B"], "C": ["B"]})
+
+        # B fits once in a slice of both.
+        sizes = slicer._glyph_sizes(font)
+        size = sizes["A"] + sizes["B"] + sizes["C"]
+        frequencies = {0x41: .9, 0x43: .9}
+        slices = slicer.plan_slices(font, frequencies, max_slice_size=size)
+        self.assertEqual(slices, [[0x41, 0x43]])
+        slices = slicer.plan_slices(font, frequencies, max_slice_size=size - 1)
+        self.assertEqual(slices, [[0x41], [0x43]])
+
+    def test_parse_frequencies(self):
+        self.assertEqual(
+            slicer.parse_frequencies({"a": 1, "U+0042": .5, "u+43": 0, "7": .1}),
+            {0x61: 1., 0x42: .5, 0x43: 0., 0x37: .1})
+        with self.assertRaises(ValueError):
+            slicer.parse_frequencies({"43": 0})
+        with self.assertRaises(ValueError):
+            slicer.parse_frequencies({"U+": 0})
+
+    def test_batch_requests(self):
+        self.assertEqual(
+            slicer.batch_requests([[0x41, 0x42], [0x30]], "font.{index}.woff2"),
+            [{"output-file": "font.0.woff2", "unicodes": "41-42"},
+             {"output-file": "font.1.woff2", "unicodes": "30"}])
+
+    def test_font_face_rules(self):
+        css = slicer.font_face_rules([[0x41, 0x42], [0x30]], "Lobster",
+                                     "lobster.{index}.woff2", format="woff2",
+                                     descriptors={"font-weight": "400"})
+        self.assertEqual(css,
+            "@font-face {\n"
+            "  font-family: 'Lobster';\n"
+            "  font-weight: 400;\n"
+            "  src: url(lobster.0.woff2) format('woff2');\n"
+            "  unicode-range: U+41-42;\n"
+            "}\n"
+            "\n"
+            "@font-face {\n"
+            "  font-family: 'Lobster';\n"
+            "  font-weight: 400;\n"
+            "  src: url(lobster.1.woff2) format('woff2');\n"
+            "  unicode-range: U+30;\n"
+            "}\n")
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(unittest.main())
@@ -1,15 +1,25 @@
 from __future__ import print_function, division, absolute_import
 from fontTools.misc.py23 import *
 from fontTools import subset
-from fontTools.ttLib import TTFont, newTable
+from fontTools.ttLib import TTFont, getTableClass, newTable, woff2
+from fontTools.ttLib.tables._g_l_y_f import GlyphComponent
+from fontTools.ttLib.tables.ttProgram import Program
 from fontTools.misc.loggingTools import CapturingLogHandler
+from fontTools.feaLib.builder import addOpenTypeFeaturesFromString
+from fontTools.pens.recordingPen import RecordingPen
+import array
 import difflib
+import json
 import logging
 import os
 import shutil
 import sys
 import tempfile
 import unittest
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
 
 
 class SubsetTest(unittest.TestCase):
@@ -428,6 +438,30 @@ class SubsetTest(unittest.TestCase):
         self.expect_ttx(subsetfont, self.getpath(
             "expect_no_hinting_desubroutinize_CFF.ttx"), ["CFF "])
 
+    def test_subroutinize_CFF(self):
+        ttxpath = self.getpath("Lobster.subset.ttx")
+        _, fontpath = self.compile_font(ttxpath, ".otf")
+        subsetpath = self.temp_path(".otf")
+        subset.main([fontpath, "--desubroutinize", "--notdef-outline",
+                     "--output-file=%s" % subsetpath, "*"])
+        expected = TTFont(subsetpath)
+        subroutinizedpath = self.temp_path(".otf")
+        subset.main([fontpath, "--subroutinize", "--notdef-outline",
+                     "--output-file=%s" % subroutinizedpath, "*"])
+        subsetfont = TTFont(subroutinizedpath)
+        self.assertLess(len(subsetfont.reader["CFF "]),
+                        len(expected.reader["CFF "]))
+        expectedGlyphs = expected.getGlyphSet()
+        glyphs = subsetfont.getGlyphSet()
+        for glyphName in expected.getGlyphOrder():
+            expectedPen = RecordingPen()
+            expectedGlyphs[glyphName].draw(expectedPen)
+            pen = RecordingPen()
+            glyphs[glyphName].draw(pen)
+            self.assertEqual(pen.value, expectedPen.value)
+            self.assertEqual(glyphs[glyphName].width,
+                             expectedGlyphs[glyphName].width)
+
     def test_no_hinting_TTF(self):
         _, fontpath = self.compile_font(self.getpath("TestTTF-Regular.ttx"), ".ttf")
         subsetpath = self.temp_path(".ttf")
@@ -439,6 +473,354 @@ class SubsetTest(unittest.TestCase):
         for tag in subset.Options().hinting_tables:
             self.assertTrue(tag not in subsetfont)
 
+    def test_raw_glyf_TTF(self):
+        font, fontpath = self.compile_font(self.getpath("TestTTF-Regular.ttx"), ".ttf")
+        # Make 'C' a composite of 'A', to exercise the raw closure.
+        glyf = font["glyf"]
+        component = GlyphComponent()
+        component.glyphName = "A"
+        component.x, component.y = 10, 20
+        component.flags = 0x4
+        glyph = glyf["C"]
+        glyph.numberOfContours = -1
+        glyph.components = [component]
+        glyph.recalcBounds(glyf)
+        font.save(fontpath)
+
+        for kwargs in ({}, {"hinting": False}, {"notdef_outline": False}):
+            outputs = []
+            for decompile in (False, True):
+                options = subset.Options(**kwargs)
+                font = subset.load_font(fontpath, options)
+                if decompile:
+                    font["glyf"]
+                subsetter = subset.Subsetter(options)
+                subsetter.populate(text="C")
+                subsetter.subset(font)
+                self.assertEqual("glyphs" in font["glyf"].__dict__, decompile)
+                self.assertEqual(font.getGlyphOrder(), [".notdef", "A", "C"])
+                buf = BytesIO()
+                subset.save_font(font, buf, options)
+                outputs.append(buf.getvalue())
+            self.assertEqual(outputs[0], outputs[1])
+
+    @unittest.skipUnless(woff2.haveBrotli, "No module named brotli")
+    def test_raw_glyf_woff2(self):
+        _, fontpath = self.compile_font(self.getpath("TestTTF-Regular.ttx"), ".ttf")
+        outputs = []
+        for decompile in (False, True):
+            options = subset.Options(flavor="woff2")
+            font = subset.load_font(fontpath, options)
+            if decompile:
+                font["glyf"]
+            subsetter = subset.Subsetter(options)
+            subsetter.populate(text="AC")
+            subsetter.subset(font)
+            buf = BytesIO()
+            subset.save_font(font, buf, options)
+            # The WOFF2 writer doesn't make the raw table load its glyphs.
+            self.assertEqual("glyphs" in font["glyf"].__dict__, decompile)
+            outputs.append(buf.getvalue())
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_prune_functions(self):
+        def program(assembly):
+            p = Program()
+            p.fromAssembly(assembly)
+            return p
+        font, fontpath = self.compile_font(self.getpath("TestTTF-Regular.ttx"), ".ttf")
+        font["fpgm"].program = program(
+            "PUSH[ ] 0 FDEF[ ] RCVT[ ] POP[ ] ENDF[ ] "
+            "PUSH[ ] 1 FDEF[ ] PUSH[ ] 0 CALL[ ] ENDF[ ] "
+            "PUSH[ ] 2 FDEF[ ] PUSH[ ] 5 RCVT[ ] POP[ ] ENDF[ ] "
+            "PUSH[ ] 3 FDEF[ ] PUSH[ ] 7 RS[ ] CALL[ ] ENDF[ ]")
+        font["prep"].program = program("PUSH[ ] 7 2 WS[ ] PUSH[ ] 2 0 CALL[ ]")
+        font["glyf"]["A"].program = program("PUSH[ ] 4 1 CALL[ ]")
+        font["glyf"]["B"].program = program("PUSH[ ] 3 CALL[ ]")
+        font.save(fontpath)
+
+        for text, interpret, functions in (("A", False, [0, 1]),
+                                           ("AB", False, None),
+                                           ("AB", True, [0, 1, 2, 3])):
+            options = subset.Options(prune_functions=True,
+                                     interpret_hinting=interpret)
+            font = subset.load_font(fontpath, options)
+            subsetter = subset.Subsetter(options)
+            subsetter.populate(text=text)
+            subsetter.subset(font)
+            buf = BytesIO()
+            subset.save_font(font, buf, options)
+            buf.seek(0)
+            font = TTFont(buf)
+            expected = [
+                "PUSH[ ] 0 FDEF[ ] RCVT[ ] POP[ ] ENDF[ ]",
+                "PUSH[ ] 1 FDEF[ ] PUSH[ ] 0 CALL[ ] ENDF[ ]",
+                "PUSH[ ] 2 FDEF[ ] PUSH[ ] 5 RCVT[ ] POP[ ] ENDF[ ]",
+                "PUSH[ ] 3 FDEF[ ] PUSH[ ] 7 RS[ ] CALL[ ] ENDF[ ]"]
+            if functions is not None:
+                # Only the bodies of the other functions are removed.
+                for i, assembly in enumerate(expected):
+                    if i not in functions:
+                        expected[i] = "PUSH[ ] %d FDEF[ ] ENDF[ ]" % i
+            self.assertEqual(font["fpgm"].program.getBytecode(),
+                             program(" ".join(expected)).getBytecode())
+
+    def test_prune_functions_hinted_font(self):
+        fontpath = self.compile_font(self.getpath("TestTTF-Regular.ttx"), ".ttf")[1]
+        def count_definitions(font):
+            return sum(1 for line in font["fpgm"].program.getAssembly()
+                       if line.startswith("FDEF"))
+        sizes = {}
+        for text in ("A", "B"):
+            options = subset.Options(prune_functions=True)
+            font = subset.load_font(fontpath, options)
+            definitions = count_definitions(font)
+            subsetter = subset.Subsetter(options)
+            subsetter.populate(text=text)
+            subsetter.subset(font)
+            buf = BytesIO()
+            subset.save_font(font, buf, options)
+            buf.seek(0)
+            font = TTFont(buf)
+            self.assertEqual(count_definitions(font), definitions)
+            sizes[text] = len(font["fpgm"].program.getBytecode())
+        # 'B' has instructions that call one more function than 'prep'.
+        self.assertLess(sizes["A"], sizes["B"])
+
+    def test_closure_cache(self):
+        def subset_glyphs(fontpath, cache, **kwargs):
+            options = subset.Options()
+            font = subset.load_font(fontpath, options)
+            subsetter = subset.Subsetter(options, closure_cache=cache)
+            subsetter.populate(**kwargs)
+            subsetter.subset(font)
+            return font.getGlyphOrder()
+
+        # Ligatures: only identical requests are reused.
+        _, fontpath = self.compile_font(self.getpath("Lobster.subset.ttx"), ".otf")
+        cache = subset.ClosureCache()
+        for text in ("IJ", "AB", "IJ"):
+            self.assertEqual(subset_glyphs(fontpath, cache, text=text),
+                             subset_glyphs(fontpath, None, text=text))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+        # No 'GSUB': requests are combined from their parts.
+        _, fontpath = self.compile_font(self.getpath("TestTTF-Regular.ttx"), ".ttf")
+        cache = subset.ClosureCache()
+        for kwargs in ({"text": "A"}, {"glyphs": ["C"]}, {"text": "A", "glyphs": ["C"]}):
+            self.assertEqual(subset_glyphs(fontpath, cache, **kwargs),
+                             subset_glyphs(fontpath, None, **kwargs))
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+        # Options that change the closure are part of the key.
+        options = subset.Options(notdef_glyph=False)
+        font = subset.load_font(fontpath, options)
+        subsetter = subset.Subsetter(options, closure_cache=cache)
+        subsetter.populate(text="A")
+        subsetter.subset(font)
+        self.assertEqual(font.getGlyphOrder(), ["A"])
+        self.assertEqual(cache.misses, 3)
+
+    def test_closure_cache_checksums(self):
+        # Shift the cmap by one glyph: the tables keep their lengths.
+        with open(self.getpath("TestTTF-Regular.ttx")) as f:
+            ttx = f.read()
+        ttx = (ttx.replace('code="0x41" name="A"', 'code="0x41" name=".notdef"')
+                  .replace('code="0x42" name="B"', 'code="0x42" name="A"')
+                  .replace('code="0x43" name="C"', 'code="0x43" name="B"'))
+        ttxpath = self.temp_path(".ttx")
+        with open(ttxpath, "w") as f:
+            f.write(ttx)
+        _, fontpath = self.compile_font(self.getpath("TestTTF-Regular.ttx"), ".ttf")
+        _, shiftedpath = self.compile_font(ttxpath, ".ttf")
+        # Give both fonts the same 'head' table.
+        head = TTFont(fontpath).reader.tables["head"]
+        with open(fontpath, "rb") as f:
+            f.seek(head.offset)
+            headData = f.read(head.length)
+        with open(shiftedpath, "r+b") as f:
+            f.seek(TTFont(shiftedpath).reader.tables["head"].offset)
+            f.write(headData)
+
+        cache = subset.ClosureCache()
+        glyphOrders = []
+        for path in (fontpath, shiftedpath):
+            options = subset.Options()
+            font = subset.load_font(path, options)
+            self.assertEqual(font.reader.tables["cmap"].length,
+                             TTFont(fontpath).reader.tables["cmap"].length)
+            subsetter = subset.Subsetter(options, closure_cache=cache)
+            subsetter.populate(text="C")
+            subsetter.subset(font)
+            glyphOrders.append(font.getGlyphOrder())
+        self.assertEqual(glyphOrders, [[".notdef", "C"], [".notdef", "B"]])
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+
+    def test_closure_cache_GSUB_dependencies(self):
+        _, fontpath = self.compile_font(self.getpath("Lobster.subset.ttx"), ".otf")
+        GSUB = getTableClass("GSUB")
+        closure_lookup_deps = GSUB.closure_lookup_deps
+        calls = []
+        def counting(self, reverse_glyph_map):
+            calls.append(1)
+            return closure_lookup_deps(self, reverse_glyph_map)
+        GSUB.closure_lookup_deps = counting
+        try:
+            cache = subset.ClosureCache()
+            for text in ("IJ", "AB", "A"):
+                options = subset.Options()
+                font = subset.load_font(fontpath, options)
+                subsetter = subset.Subsetter(options, closure_cache=cache)
+                subsetter.populate(text=text)
+                subsetter.subset(font)
+        finally:
+            GSUB.closure_lookup_deps = closure_lookup_deps
+        self.assertEqual(cache.misses, 3)
+        self.assertEqual(len(calls), 1)
+
+    def test_closure_cache_glyph_names(self):
+        # Without its glyph names, 'B.alt' is named after its code point.
+        with open(self.getpath("TestTTF-Regular.ttx")) as f:
+            ttx = f.read().replace('name="B"', 'name="B.alt"')
+        ttxpath = self.temp_path(".ttx")
+        with open(ttxpath, "w") as f:
+            f.write(ttx)
+        _, fontpath = self.compile_font(ttxpath, ".ttf")
+        cache = subset.ClosureCache()
+        glyphOrders = []
+        for dontLoadGlyphNames in (False, True, False):
+            options = subset.Options()
+            font = subset.load_font(fontpath, options,
+                                    dontLoadGlyphNames=dontLoadGlyphNames)
+            subsetter = subset.Subsetter(options, closure_cache=cache)
+            subsetter.populate(text="B")
+            subsetter.subset(font)
+            glyphOrders.append(font.getGlyphOrder())
+        self.assertEqual(glyphOrders[0], [".notdef", "B.alt"])
+        self.assertEqual(glyphOrders[1], [".notdef", "B"])
+        self.assertEqual(glyphOrders[2], glyphOrders[0])
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_release_tables(self):
+        _, fontpath = self.compile_font(self.getpath("TestTTF-Regular.ttx"), ".ttf")
+        for kwargs in ({}, {"glyph_names": True, "recalc_average_width": True}):
+            outputs = []
+            for release in (False, True):
+                options = subset.Options(release_tables=release, **kwargs)
+                font = subset.load_font(fontpath, options)
+                subsetter = subset.Subsetter(options)
+                subsetter.populate(text="AC")
+                subsetter.subset(font)
+                for tag in ("name", "hmtx", "OS/2"):
+                    self.assertEqual(hasattr(font[tag], "data"), release)
+                buf = BytesIO()
+                subset.save_font(font, buf, options)
+                outputs.append(buf.getvalue())
+            self.assertEqual(outputs[0], outputs[1])
+        subsetfont = TTFont(BytesIO(outputs[1]))
+        self.assertEqual(subsetfont.getGlyphOrder(), [".notdef", "A", "C"])
+        self.assertEqual(sorted(subsetfont["hmtx"].metrics), [".notdef", "A", "C"])
+
+    def test_release_tables_api_tables(self):
+        _, fontpath = self.compile_font(self.getpath("TestTTF-Regular.ttx"), ".ttf")
+        options = subset.Options(release_tables=True)
+        font = subset.load_font(fontpath, options)
+        subsetter = subset.Subsetter(options)
+        subsetter.populate(text="A")
+        subsetter.subset(font)
+        # Released tables are only kept compiled, until the font is saved
+        # and loaded again.
+        for tag in ("name", "post", "hmtx", "OS/2"):
+            self.assertEqual(font[tag].__class__.__name__, "DefaultTable")
+        buf = BytesIO()
+        subset.save_font(font, buf, options)
+        subsetfont = TTFont(BytesIO(buf.getvalue()))
+        self.assertEqual(subsetfont["name"].getDebugName(1), "TestTTF")
+        self.assertEqual(subsetfont["OS/2"].usWeightClass,
+                         TTFont(fontpath)["OS/2"].usWeightClass)
+
+    def test_release_tables_layout_tables(self):
+        _, fontpath = self.compile_font(self.getpath("Lobster.subset.ttx"), ".otf")
+        outputs = []
+        for release in (False, True):
+            options = subset.Options(release_tables=release)
+            font = subset.load_font(fontpath, options)
+            subsetter = subset.Subsetter(options)
+            subsetter.populate(text="0123")
+            subsetter.subset(font)
+            self.assertEqual(hasattr(font["GPOS"], "data"), release)
+            buf = BytesIO()
+            subset.save_font(font, buf, options)
+            outputs.append(buf.getvalue())
+        self.assertEqual(outputs[0], outputs[1])
+
+    @unittest.skipIf(tracemalloc is None, "tracemalloc not available")
+    def test_release_tables_peak_memory(self):
+        # Big 'name' and 'GPOS' tables: only one of them is decompiled at
+        # a time when the tables are released.
+        font = TTFont()
+        font.importXML(self.getpath("TestTTF-Regular.ttx"))
+        for i in range(2000):
+            font["name"].setName(u"N%d" % i, 256 + i, 3, 1, 0x409)
+        lookups = range(1000)
+        addOpenTypeFeaturesFromString(font, "".join(
+            ["lookup L%d { pos A %d; } L%d;\n" % (i, i + 1, i) for i in lookups] +
+            ["feature kern {\n"] + ["lookup L%d;\n" % i for i in lookups] +
+            ["} kern;\n"]))
+        buf = BytesIO()
+        font.save(buf)
+        fontdata = buf.getvalue()
+
+        def peak(release):
+            options = subset.Options(release_tables=release,
+                                     name_IDs=["*"], name_languages=["*"])
+            tracemalloc.start()
+            try:
+                font = subset.load_font(BytesIO(fontdata), options)
+                subsetter = subset.Subsetter(options)
+                subsetter.populate(text="A")
+                subsetter.subset(font)
+                subset.save_font(font, BytesIO(), options)
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        peak(False)  # Imports and caches.
+        self.assertLess(peak(True), 0.85 * peak(False))
+
+    def test_release_tables_recalc_bounds_save(self):
+        # Saving recalculates the 'maxp' and 'hhea' bounds from 'hmtx',
+        # as TTFont does so by default.
+        for name, suffix in (("TestTTF-Regular.ttx", ".ttf"),
+                             ("Lobster.subset.ttx", ".otf")):
+            _, fontpath = self.compile_font(self.getpath(name), suffix)
+            outputs = []
+            for release in (False, True):
+                font = TTFont(fontpath)
+                subsetter = subset.Subsetter(subset.Options(release_tables=release))
+                subsetter.populate(text="A")
+                subsetter.subset(font)
+                self.assertFalse(hasattr(font["hmtx"], "data"))
+                buf = BytesIO()
+                font.save(buf)
+                outputs.append(buf.getvalue())
+            self.assertEqual(outputs[0], outputs[1])
+
+    def test_release_tables_xml(self):
+        _, fontpath = self.compile_font(self.getpath("TestTTF-Regular.ttx"), ".ttf")
+        subsetpath = self.temp_path(".ttf")
+        stdout = sys.stdout
+        sys.stdout = UnicodeIO()
+        try:
+            subset.main([fontpath, "--release-tables", "--xml", "--text=A",
+                         "--output-file=%s" % subsetpath])
+            ttx = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertNotIn('raw="True"', ttx)
+        self.assertIn("<hmtx>", ttx)
+        self.assertIn("<namerecord", ttx)
+
     def test_notdef_width_cid(self):
         # https://github.com/fonttools/fonttools/pull/845
         _, fontpath = self.compile_font(self.getpath("NotdefWidthCID-Regular.ttx"), ".otf")
@@ -477,6 +859,188 @@ class SubsetTest(unittest.TestCase):
         subset.main([fontpath, "--recalc-timestamp", "--output-file=%s" % subsetpath, "*"])
         self.assertLess(modified, TTFont(subsetpath)['head'].modified)
 
+    def test_closure_glyphs_GSUB(self):
+        _, fontpath = self.compile_font(self.getpath("Lobster.subset.ttx"), ".otf")
+        font = TTFont(fontpath)
+        subsetter = subset.Subsetter()
+        subsetter.populate(glyphs=["nonexistent"], text="AIJ")
+        subsetter.options.ignore_missing_glyphs = True
+        subsetter.subset(font)
+        self.assertEqual(subsetter.glyphs_missing, {"nonexistent"})
+        self.assertEqual(subsetter.glyphs_cmaped, {"A", "I", "J"})
+        self.assertEqual(subsetter.glyphs_all, {".notdef", "A", "I", "IJ", "J"})
+        self.assertEqual(font.getGlyphOrder(), [".notdef", "A", "I", "IJ", "J"])
+
+        font = TTFont(fontpath)
+        subsetter = subset.Subsetter(subset.Options(layout_features=["*"]))
+        subsetter.populate(text="AB")
+        subsetter.subset(font)
+        self.assertEqual(font.getGlyphOrder(),
+                         [".notdef", "A", "A.salt", "B", "B.salt"])
+
+    def test_closure_glyphs_GSUB_ligature_components(self):
+        _, fontpath = self.compile_font(self.getpath("Lobster.subset.ttx"), ".otf")
+        for text, expected in [("I", {".notdef", "I"}),
+                               ("JI", {".notdef", "I", "IJ", "J"})]:
+            font = TTFont(fontpath)
+            subsetter = subset.Subsetter()
+            subsetter.populate(text=text)
+            subsetter.subset(font)
+            self.assertEqual(subsetter.glyphs_all, expected)
+
+    def test_subset_many(self):
+        _, fontpath = self.compile_font(self.getpath("Lobster.subset.ttx"), ".otf")
+        requests = [{"text": "AB"},
+                    {"unicodes": [0x30, 0x31]},
+                    {"glyphs": ["IJ"], "output_file": self.temp_path(".otf")}]
+        expected = [[".notdef", "A", "B"],
+                    [".notdef", "one", "zero"],
+                    [".notdef", "IJ"]]
+        for workers in (None, 2):
+            subsetter = subset.Subsetter()
+            results = subsetter.subset_many(TTFont(fontpath), requests,
+                                            workers=workers)
+            self.assertEqual(len(results), 3)
+            self.assertEqual(results[2], requests[2]["output_file"])
+            for result, glyphs in zip(results, expected):
+                if not isinstance(result, bytes):
+                    result = open(result, "rb").read()
+                subsetfont = TTFont(BytesIO(result))
+                self.assertEqual(subsetfont.getGlyphOrder(), glyphs)
+                self.assertEqual(subsetfont["CFF "].cff.topDictIndex[0].charset, glyphs)
+
+    def test_batch(self):
+        _, fontpath = self.compile_font(self.getpath("TestTTF-Regular.ttx"), ".ttf")
+        outpaths = [self.temp_path(".ttf"), self.temp_path(".ttf")]
+        specpath = self.temp_path(".json")
+        with open(specpath, "w", encoding="utf-8") as spec:
+            spec.write(tounicode(json.dumps([
+                {"output-file": outpaths[0], "text": "A"},
+                {"output-file": outpaths[1], "unicodes": "U+0043"},
+            ])))
+        ret = subset.main([fontpath, "--gids=0", "--batch=%s" % specpath,
+                           "--jobs=2"])
+        self.assertEqual(ret, 0)
+        self.assertEqual(TTFont(outpaths[0]).getGlyphOrder(), [".notdef", "A"])
+        self.assertEqual(TTFont(outpaths[1]).getGlyphOrder(), [".notdef", "C"])
+
+    def test_batch_failed_request(self):
+        _, fontpath = self.compile_font(self.getpath("TestTTF-Regular.ttx"), ".ttf")
+        outpath = self.temp_path(".ttf")
+        badpath = os.path.join(self.tempdir, "missing", "dir.ttf")
+        specpath = self.temp_path(".json")
+        with open(specpath, "w", encoding="utf-8") as spec:
+            spec.write(tounicode(json.dumps([
+                {"output-file": badpath, "text": "A"},
+                {"output-file": outpath, "text": "C"},
+            ])))
+        for jobs in (1, 2):
+            stderr = sys.stderr
+            sys.stderr = UnicodeIO()
+            try:
+                ret = subset.main([fontpath, "--batch=%s" % specpath,
+                                   "--jobs=%d" % jobs])
+                errors = sys.stderr.getvalue().splitlines()
+            finally:
+                sys.stderr = stderr
+            # The failed request is reported, and the other one still done.
+            self.assertEqual(ret, 1)
+            self.assertEqual(len(errors), 1)
+            self.assertIn(badpath, errors[0])
+            self.assertEqual(TTFont(outpath).getGlyphOrder(), [".notdef", "C"])
+            os.remove(outpath)
+
+    def test_batch_xml(self):
+        _, fontpath = self.compile_font(self.getpath("TestTTF-Regular.ttx"), ".ttf")
+        specpath = self.temp_path(".json")
+        with open(specpath, "w", encoding="utf-8") as spec:
+            spec.write(tounicode(json.dumps([
+                {"output-file": self.temp_path(".ttf"), "text": "A"},
+            ])))
+        ret = subset.main([fontpath, "--batch=%s" % specpath, "--xml"])
+        self.assertEqual(ret, 2)
+
+    def test_jobs(self):
+        _, fontpath = self.compile_font(self.getpath("TestTTF-Regular.ttx"), ".ttf")
+        outpath = self.temp_path(".ttf")
+        for jobs in ("0", "-1", "two", ""):
+            ret = subset.main([fontpath, "--text=A", "--jobs=%s" % jobs,
+                               "--output-file=%s" % outpath])
+            self.assertEqual(ret, 2)
+        self.assertFalse(os.path.exists(outpath))
+
+    def test_batch_output_file(self):
+        _, fontpath = self.compile_font(self.getpath("TestTTF-Regular.ttx"), ".ttf")
+        outpath = self.temp_path(".ttf")
+        specpath = self.temp_path(".json")
+        with open(specpath, "w", encoding="utf-8") as spec:
+            spec.write(tounicode(json.dumps([
+                {"output-file": self.temp_path(".ttf"), "text": "A"},
+            ])))
+        ret = subset.main([fontpath, "--batch=%s" % specpath,
+                           "--output-file=%s" % outpath])
+        self.assertEqual(ret, 2)
+        self.assertFalse(os.path.exists(outpath))
+
+    def test_multiple_font_files(self):
+        _, ttfpath = self.compile_font(self.getpath("TestTTF-Regular.ttx"), ".ttf")
+        _, otfpath = self.compile_font(self.getpath("TestOTF-Regular.ttx"), ".otf")
+        badpath = self.temp_path(".ttf")
+        with open(badpath, "wb") as f:
+            f.write(b"not a font")
+        outdir = os.path.join(self.tempdir, "out")
+        for jobs in (1, 2):
+            ret = subset.main([os.path.join(self.tempdir, "*.?tf"),
+                               "--font-file=%s" % ttfpath,
+                               "--unicodes=41", "--jobs=%d" % jobs,
+                               "--output-file=%s" % os.path.join(
+                                   outdir, "{name}.subset{ext}")])
+            # The bad font is reported, and the others are still subset.
+            self.assertEqual(ret, 1)
+            for path in (ttfpath, otfpath):
+                name, ext = os.path.splitext(os.path.basename(path))
+                subsetfont = TTFont(os.path.join(outdir, name + ".subset" + ext))
+                self.assertEqual(subsetfont.getGlyphOrder(), [".notdef", "A"])
+            shutil.rmtree(outdir)
+
+    def test_multiple_font_files_xml(self):
+        _, ttfpath = self.compile_font(self.getpath("TestTTF-Regular.ttx"), ".ttf")
+        _, otfpath = self.compile_font(self.getpath("TestOTF-Regular.ttx"), ".otf")
+        ret = subset.main([ttfpath, "--font-file=%s" % otfpath,
+                           "--unicodes=41", "--xml"])
+        self.assertEqual(ret, 2)
+        self.assertEqual(sorted(os.listdir(self.tempdir)), ["tmp1.ttf", "tmp2.otf"])
+
+    def test_subset_file_traceback(self):
+        badpath = self.temp_path(".ttf")
+        with open(badpath, "wb") as f:
+            f.write(b"not a font")
+        state = (subset.Options(),
+                 {"glyphs": [], "gids": [], "unicodes": [0x41], "text": ""},
+                 (False, False, True))
+        outpath = self.temp_path(".ttf")
+        infile, outfile, error, tb = subset._subset_file(state, (badpath, outpath))
+        self.assertEqual((infile, outfile), (badpath, outpath))
+        self.assertTrue(error.startswith("TTLibError: "))
+        # For main() to log, at debug level.
+        self.assertTrue(tb.startswith("Traceback"))
+        self.assertIn(error, tb)
+
+    def test_output_file_name(self):
+        self.assertEqual(
+            subset._output_file_name("out/{x}/{name}-{dir}{ext}", "a/b.c.ttf"),
+            os.path.join("out/{x}/b.c-a.ttf"))
+        self.assertEqual(subset._output_file_name("{{name}}{ext}", "b.ttf"),
+                         "{b}.ttf")
+        self.assertEqual(subset._output_file_name(None, "b.ttf"), "b.subset.ttf")
+
+    def test_multiple_font_files_output_template(self):
+        _, fontpath = self.compile_font(self.getpath("TestTTF-Regular.ttx"), ".ttf")
+        self.compile_font(self.getpath("TestTTF-Regular.ttx"), ".ttf")
+        ret = subset.main([os.path.join(self.tempdir, "*.ttf"), "--unicodes=41",
+                           "--output-file=%s" % self.temp_path(".ttf")])
+        self.assertEqual(ret, 2)
+
 
 if __name__ == "__main__":
     sys.exit(unittest.main())
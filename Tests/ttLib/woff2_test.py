@@ -539,6 +539,42 @@ class WOFF2WriterTTFTest(WOFF2WriterTest):
 		for tag in normTables:
 			self.assertEqual(self.writer.tables[tag].data, normTables[tag])
 
+	def test_normaliseGlyfAndLoca_sourceFont(self):
+		font = ttLib.TTFont(recalcBBoxes=False, recalcTimestamp=False, flavor="woff2")
+		font.importXML(TTX)
+		normTables = {}
+		for tag in ('head', 'loca', 'glyf'):
+			normTables[tag] = normalise_table(font, tag, padding=4)
+		glyfTable = font['glyf']
+		for glyphName in font.getGlyphOrder():
+			glyfTable[glyphName]  # expand
+		font.getTableData('glyf')  # set up 'loca'
+		for tag in self.tags:
+			self.writer[tag] = font.getTableData(tag)
+		self.writer.sourceFont = font
+		self.writer._normaliseGlyfAndLoca(padding=4)
+		self.writer._setHeadTransformFlag()
+		for tag in normTables:
+			self.assertEqual(self.writer.tables[tag].data, normTables[tag])
+		# the expanded glyphs are transformed without being decompiled again
+		for glyphName in font.getGlyphOrder():
+			self.assertIs(self.writer.ttFont['glyf'].glyphs[glyphName], glyfTable[glyphName])
+
+	def test_transform_glyf_sourceFont(self):
+		font = ttLib.TTFont(recalcBBoxes=False, recalcTimestamp=False, flavor="woff2")
+		font.importXML(TTX)
+		font.getTableData('glyf')  # set up 'loca'
+		tableData = [(tag, font.getTableData(tag)) for tag in self.tags]
+		transformed = []
+		for sourceFont in (None, font):
+			writer = WOFF2Writer(BytesIO(), self.numTables, font.sfntVersion)
+			for tag, data in tableData:
+				writer[tag] = data
+			writer.sourceFont = sourceFont
+			writer._normaliseGlyfAndLoca(padding=4)
+			transformed.append(writer.transformTable('glyf'))
+		self.assertEqual(transformed[0], transformed[1])
+
 
 class WOFF2LocaTableTest(unittest.TestCase):
 
@@ -2,6 +2,7 @@ from __future__ import print_function, division, absolute_import
 from fontTools.misc.py23 import *
 from fontTools.varLib.models import (
     normalizeLocation, supportScalar, VariationModel)
+import pytest
 
 
 def test_normalizeLocation():
@@ -75,3 +76,55 @@ def test_VariationModel():
          5: 0.6666666666666667,
          6: 0.16666666666666669,
          7: 0.6666666666666667}]
+
+
+def test_VariationModel_batch():
+    locations = [
+        {'wght':100},
+        {'wght':-100},
+        {'wdth':+.3},
+        {'wght':+100,'wdth':.3},
+        {},
+    ]
+    model = VariationModel(locations, axisOrder=['wght'])
+    masterValuesList = [
+        [10, -20, 5, 30, 0],
+        [500, 400, 520, 650, 450],
+        [0, 0, 0, 0, 0],
+    ]
+
+    deltasList = model.getDeltasBatch(masterValuesList)
+    assert len(deltasList) == 3
+    for masterValues, deltas in zip(masterValuesList, deltasList):
+        assert deltas == pytest.approx(model.getDeltas(masterValues))
+
+    instances = [{'wght':.5, 'wdth':.1}, {'wght':-1, 'wdth':0}, {'wght':0, 'wdth':0}]
+    expected = [[model.interpolateFromMasters(loc, masterValues)
+                 for masterValues in masterValuesList]
+                for loc in instances]
+    assert model.interpolateFromMastersBatch(instances, masterValuesList) == \
+        [pytest.approx(values) for values in expected]
+    assert model.interpolateFromDeltasBatch(instances, deltasList) == \
+        [pytest.approx(values) for values in expected]
+
+
+def test_VariationModel_batch_numpy():
+    numpy = pytest.importorskip("numpy")
+    model = VariationModel([{}, {'wght':1}, {'wght':-1}])
+    masterValuesList = [[400, 700, 100], [10, 20, 0]]
+    deltasList = model.getDeltasBatch(masterValuesList)
+    assert type(deltasList) is list
+    assert all(type(deltas) is list for deltas in deltasList)
+    deltasArray = model.getDeltasBatch(numpy.array(masterValuesList))
+    assert isinstance(deltasArray, numpy.ndarray)
+    assert deltasArray.tolist() == deltasList
+
+
+def test_VariationModel_getScalars_cache():
+    model = VariationModel([{}, {'wght':1}, {'wght':-1}])
+    model.scalarsCacheSize = 2
+    assert model.getScalars({'wght':.5}) == [1., 0., .5]
+    assert model.getScalars({'wght':-.25}) == [1., .25, 0.]
+    assert model.getScalars({'wght':.5}) == [1., 0., .5]
+    model.getScalars({'wght':1})
+    assert list(model._scalarsCache) == [(('wght', .5),), (('wght', 1),)]
@@ -1,8 +1,14 @@
 from __future__ import print_function, division, absolute_import
 from fontTools.misc.py23 import *
-from fontTools.ttLib import TTFont
+from fontTools.ttLib import TTFont, newTable
+from fontTools.otlLib.builder import buildLookup, buildPairPosGlyphsSubtable
 from fontTools.varLib import build
+from fontTools.ttLib.tables import otBase, otTables as ot
+from fontTools.varLib import builder
 from fontTools.varLib.mutator import main as mutator
+from fontTools.varLib.mutator import (
+    instantiateVariableFont, instantiateVariableFonts, _VarStoreInstancer,
+    _instantiateDevices)
 import difflib
 import os
 import shutil
@@ -139,6 +145,111 @@ class MutatorTest(unittest.TestCase):
         expected_ttx_path = self.get_test_output(varfont_name + '-instance.ttx')
         self.expect_ttx(instfont, expected_ttx_path, tables)
 
+    def build_varfont(self):
+        ds_path = self.get_test_input('Build.designspace')
+        ufo_dir = self.get_test_input('master_ufo')
+        ttx_dir = self.get_test_input('master_ttx_interpolatable_ttf')
+
+        self.temp_dir()
+        ttx_paths = self.get_file_list(ttx_dir, '.ttx', 'TestFamily-')
+        for path in ttx_paths:
+            self.compile_font(path, '.ttf', self.tempdir)
+
+        finder = lambda s: s.replace(ufo_dir, self.tempdir).replace('.ufo', '.ttf')
+        varfont, _, _ = build(ds_path, finder)
+        return varfont
+
+    def test_instantiateVariableFont(self):
+        varfont = self.build_varfont()
+        instfont = instantiateVariableFont(varfont, {'wght': 500, 'cntr': 50})
+        self.assertIn('fvar', varfont)
+        self.assertNotIn('fvar', instfont)
+
+        path = self.temp_path('.ttf')
+        instfont.save(path)
+        instfont = TTFont(path)
+        tables = [table_tag for table_tag in instfont.keys() if table_tag != 'head']
+        self.expect_ttx(instfont, self.get_test_output('Mutator.ttx'), tables)
+
+    def test_instantiateVariableFonts(self):
+        varfont = self.build_varfont()
+        locations = [{'wght': 500, 'cntr': 50}, {'wght': 900}, {}]
+        outfile = self.temp_path('.ttf')
+        results = instantiateVariableFonts(varfont, locations,
+                                           outfiles=[outfile, None, None],
+                                           workers=2)
+        self.assertEqual(results[0], outfile)
+        instfont = TTFont(outfile)
+        tables = [table_tag for table_tag in instfont.keys() if table_tag != 'head']
+        self.expect_ttx(instfont, self.get_test_output('Mutator.ttx'), tables)
+
+        for location, data in zip(locations[1:], results[1:]):
+            buf = BytesIO()
+            instantiateVariableFont(varfont, location).save(buf)
+            expected = TTFont(BytesIO(buf.getvalue()))
+            instfont = TTFont(BytesIO(data))
+            for tag in ('glyf', 'hmtx', 'OS/2'):
+                self.assertEqual(instfont.getTableData(tag),
+                                 expected.getTableData(tag))
+
+    def test_instantiateDevices(self):
+        regions = builder.buildVarRegionList([{'wght': (0, 1, 1)}], ['wght'])
+        varData = builder.buildVarData([0], [[100], [-40]])
+        varStore = builder.buildVarStore(regions, [varData])
+
+        valueRecord = otBase.ValueRecord()
+        valueRecord.XAdvance = 500
+        valueRecord.XAdvDevice = builder.buildVarDevTable(0)
+        anchor = ot.Anchor()
+        anchor.Format = 3
+        anchor.XCoordinate = 10
+        anchor.YCoordinate = 20
+        anchor.XDeviceTable = None
+        anchor.YDeviceTable = builder.buildVarDevTable(1)
+
+        instancer = _VarStoreInstancer(varStore, ['wght'], {'wght': .5})
+        _instantiateDevices([valueRecord, anchor], instancer, set())
+        self.assertEqual(valueRecord.XAdvance, 550)
+        self.assertFalse(hasattr(valueRecord, 'XAdvDevice'))
+        self.assertEqual(anchor.Format, 1)
+        self.assertEqual((anchor.XCoordinate, anchor.YCoordinate), (10, 0))
+
+    def test_instantiateVariableFont_kerning_device(self):
+        varfont = self.build_varfont()
+        axisTags = [axis.axisTag for axis in varfont['fvar'].axes]
+        regions = builder.buildVarRegionList([{'wght': (0, 1, 1)}], axisTags)
+        varData = builder.buildVarData([0], [[-100]])
+        varfont['GDEF'].table.VarStore = builder.buildVarStore(regions, [varData])
+
+        # Kerning of 0 at the default: only the device is in the ValueFormat.
+        value = otBase.ValueRecord()
+        value.XAdvDevice = builder.buildVarDevTable(0)
+        glyphOrder = varfont.getGlyphOrder()
+        glyphMap = {glyphName: i for i, glyphName in enumerate(glyphOrder)}
+        pairPos = buildPairPosGlyphsSubtable(
+            {(glyphOrder[1], glyphOrder[2]): (value, None)}, glyphMap)
+        self.assertEqual(pairPos.ValueFormat1, 0x0040)
+        gpos = ot.GPOS()
+        gpos.Version = 0x00010000
+        gpos.ScriptList = ot.ScriptList()
+        gpos.ScriptList.ScriptRecord = []
+        gpos.FeatureList = ot.FeatureList()
+        gpos.FeatureList.FeatureRecord = []
+        gpos.LookupList = ot.LookupList()
+        gpos.LookupList.Lookup = [buildLookup([pairPos])]
+        varfont['GPOS'] = newTable('GPOS')
+        varfont['GPOS'].table = gpos
+
+        instfont = instantiateVariableFont(varfont, {'wght': 1000})
+        buf = BytesIO()
+        instfont.save(buf)
+        instfont = TTFont(BytesIO(buf.getvalue()))
+        pairPos = instfont['GPOS'].table.LookupList.Lookup[0].SubTable[0]
+        self.assertEqual(pairPos.ValueFormat1, 0x0004)
+        value = pairPos.PairSet[0].PairValueRecord[0].Value1
+        self.assertEqual(value.XAdvance, -100)
+        self.assertFalse(hasattr(value, 'XAdvDevice'))
+
 
 if __name__ == "__main__":
     sys.exit(unittest.main())
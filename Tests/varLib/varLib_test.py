@@ -1,10 +1,16 @@
 from __future__ import print_function, division, absolute_import
 from fontTools.misc.py23 import *
 from fontTools.ttLib import TTFont
+from fontTools import varLib
 from fontTools.varLib import build
+from fontTools.varLib import (
+    _IUPChecker, _all_interpolatable_in_between, _iup_contour_optimize)
+from fontTools.varLib.mutator import _iup_contour
 from fontTools.varLib import main as varLib_main
 import difflib
+import math
 import os
+import random
 import shutil
 import sys
 import tempfile
@@ -124,6 +130,30 @@ class BuildTest(unittest.TestCase):
             expected_ttx_name='Build'
         )
 
+    def test_varlib_build_workers(self):
+        """Glyph variations computed in worker processes are the same."""
+        ds_path = self.get_test_input('Build.designspace')
+        ufo_dir = self.get_test_input('master_ufo')
+        ttx_dir = self.get_test_input('master_ttx_interpolatable_ttf')
+
+        self.temp_dir()
+        ttx_paths = self.get_file_list(ttx_dir, '.ttx', 'TestFamily-')
+        for path in ttx_paths:
+            self.compile_font(path, '.ttf', self.tempdir)
+
+        finder = lambda s: s.replace(ufo_dir, self.tempdir).replace('.ufo', '.ttf')
+        chunk_size = varLib._gvar_chunk_size
+        varLib._gvar_chunk_size = 2
+        try:
+            varfont, _, _ = build(ds_path, finder, workers=2)
+        finally:
+            varLib._gvar_chunk_size = chunk_size
+
+        tables = ['GDEF', 'HVAR', 'MVAR', 'fvar', 'gvar']
+        expected_ttx_path = self.get_test_output('Build.ttx')
+        self.expect_ttx(varfont, expected_ttx_path, tables)
+        self.check_ttx_dump(varfont, expected_ttx_path, tables, '.ttf')
+
     def test_varlib_build_no_axes_ttf(self):
         """Designspace file does not contain an <axes> element."""
         self._run_varlib_build_test(
@@ -211,5 +241,57 @@ class BuildTest(unittest.TestCase):
         self.expect_ttx(varfont, expected_ttx_path, tables)
 
 
+class IUPTest(unittest.TestCase):
+
+    COORDS = [(0, 0), (100, 0), (200, 0), (300, 0),
+              (300, 100), (200, 100), (100, 100), (0, 100)]
+    DELTA = [(0, 0), (5, 0), (10, 0), (15, 0),
+             (15, 5), (10, 5), (5, 5), (0, 5)]
+
+    @staticmethod
+    def random_contour(n, seed):
+        rand = random.Random(seed)
+        coords = [(int(500 + 300 * math.cos(2 * math.pi * k / n)),
+                   int(500 + 300 * math.sin(2 * math.pi * k / n)))
+                  for k in range(n)]
+        delta = [(int(round((x - 500) * 0.1)) + rand.choice([0, 0, 0, 2]),
+                  int(round((y - 500) * 0.05)))
+                 for x, y in coords]
+        return delta, coords
+
+    def test_iup_contour_optimize(self):
+        self.assertEqual(
+            _iup_contour_optimize(self.DELTA, self.COORDS),
+            [None, None, None, (15, 0), None, None, None, (0, 5)])
+
+    def test_iup_contour_optimize_lookback(self):
+        delta = _iup_contour_optimize(self.DELTA, self.COORDS, lookback=4)
+        self.assertEqual(
+            delta,
+            [None, None, (10, 0), None, (15, 5), None, None, (0, 5)])
+        self.assertEqual(_iup_contour(delta, self.COORDS), self.DELTA)
+
+    def test_iup_checker(self):
+        # Long enough for the NumPy checks, if it is installed.
+        delta, coords = self.random_contour(60, 1)
+        delta = delta + delta
+        coords = coords + coords
+        for tolerance in (0, 1.5):
+            can_iup = _IUPChecker(delta, coords, tolerance, period=60)
+            for i in range(len(delta)):
+                for j in range(i + 2, len(delta)):
+                    self.assertEqual(
+                        can_iup(i, j),
+                        _all_interpolatable_in_between(
+                            delta, coords, i, j, tolerance))
+
+    def test_iup_contour_optimize_tolerance(self):
+        delta, coords = self.random_contour(100, 2)
+        optimized = _iup_contour_optimize(delta, coords, 1.5)
+        self.assertIn(None, optimized)
+        for (x, y), (p, q) in zip(delta, _iup_contour(optimized, coords)):
+            self.assertLessEqual(abs(complex(x - p, y - q)), 1.5)
+
+
 if __name__ == "__main__":
     sys.exit(unittest.main())